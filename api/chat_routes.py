@@ -1,29 +1,37 @@
 from utils.logger_conf import logger
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from db.database import get_db
-from services.chat_service import ChatService
-from services.message_service import MessageService
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
+from services.chat_service import AsyncChatService
+from services.message_service import AsyncMessageService
 from api.user_routes import get_current_user
-from utils.rate_limiter import rate_limiter
+from utils.rate_limiter import RateLimiter
 from utils.user_logger import log_user_action
+from utils.pagination import PageParams
+from api.schemas import ChatOut, MessageOut, Page
 
 router = APIRouter()
 
-@router.post("/new", dependencies=[Depends(rate_limiter)])
-def create_chat(request: Request, request_type: str = "text", db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+@router.get("/", response_model=Page[ChatOut], dependencies=[Depends(RateLimiter(limit=60, period=60))])
+async def list_chats(request: Request, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    """List the current user's chats, most recent first."""
+    logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").debug(f"{request.method} {request.url.path} | Listing chats")
+    return await AsyncChatService.get_user_chats(db, current_user.id, after=page.after, limit=page.limit)
+
+@router.post("/new", response_model=ChatOut, dependencies=[Depends(RateLimiter(limit=10, period=60))])
+async def create_chat(request: Request, request_type: str = "text", db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
     user_id = current_user.id
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"{request.method} {request.url.path} | Creating new chat with type {request_type}")
-    chat = ChatService.create_chat(db, user_id=user_id, request_type=request_type)
+    chat = await AsyncChatService.create_chat(db, user_id=user_id, request_type=request_type)
     log_user_action("create_chat", {"chat_id": chat.id, "type": request_type}, user_uuid=current_user.uuid)
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").success(f"Chat created successfully: ID {chat.id}")
     return chat
 
-@router.post("/{chat_id}/messages", dependencies=[Depends(rate_limiter)])
-def send_message(request: Request, chat_id: int, content: str, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+@router.post("/{chat_id}/messages", response_model=MessageOut, dependencies=[Depends(RateLimiter(limit=30, period=60))])
+async def send_message(request: Request, chat_id: int, content: str, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
     user_id = current_user.id
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"{request.method} {request.url.path} | Sending message to chat {chat_id}")
-    message = MessageService.create_message(db, chat_id=chat_id, content=content)
+    message = await AsyncMessageService.create_message(db, chat_id=chat_id, content=content)
     log_user_action("send_message", {"chat_id": chat_id, "message_id": message.id}, user_uuid=current_user.uuid)
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").success(f"Message sent successfully: ID {message.id}")
     return message
\ No newline at end of file
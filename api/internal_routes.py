@@ -0,0 +1,84 @@
+import hmac
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from db.database import engine_config
+from db.pool_metrics import get_pool_stats
+from db.routing import get_replica_stats
+from utils.logger_conf import get_log_stats
+from utils.user_logger import action_log_writer
+from services.action_log_worker import get_stream_stats
+from utils.password_hasher import get_hashing_stats
+from utils.rate_limiter import get_rate_limit_stats
+from utils.chat_cache import get_chat_cache_stats
+from utils.chat_events import get_chat_event_stats
+from utils.storage import get_storage_stats
+from utils.metrics import render_metrics
+
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+# Without a token everything here is refused, unless opened explicitly (local dev)
+INTERNAL_API_OPEN = os.getenv("INTERNAL_API_OPEN", "false").lower() in ("1", "true", "yes")
+
+router = APIRouter()
+
+
+def require_internal_token(x_internal_token: str = Header(None)):
+    if not INTERNAL_API_TOKEN:
+        if INTERNAL_API_OPEN:
+            return
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if x_internal_token is None or not hmac.compare_digest(x_internal_token, INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@router.get("/pool", dependencies=[Depends(require_internal_token)])
+def pool_stats():
+    return {"config": engine_config.as_dict(), "pools": get_pool_stats()}
+
+
+@router.get("/replicas", dependencies=[Depends(require_internal_token)])
+def replica_stats():
+    return get_replica_stats()
+
+
+@router.get("/logs", dependencies=[Depends(require_internal_token)])
+def log_stats():
+    return get_log_stats()
+
+
+
+@router.get("/action-logs", dependencies=[Depends(require_internal_token)])
+def action_log_stats():
+    return {"writer": action_log_writer.get_stats(), "stream": get_stream_stats()}
+
+
+@router.get("/hashing", dependencies=[Depends(require_internal_token)])
+def hashing_stats():
+    return get_hashing_stats()
+
+
+@router.get("/rate-limit", dependencies=[Depends(require_internal_token)])
+def rate_limit_stats():
+    # local_denied: rejected by this worker's deny cache, without asking the backend
+    return get_rate_limit_stats()
+
+
+@router.get("/chat-cache", dependencies=[Depends(require_internal_token)])
+def chat_cache_stats():
+    return get_chat_cache_stats()
+
+
+@router.get("/realtime", dependencies=[Depends(require_internal_token)])
+def realtime_stats():
+    return get_chat_event_stats()
+
+
+@router.get("/storage", dependencies=[Depends(require_internal_token)])
+def storage_stats():
+    return get_storage_stats()
+
+
+@router.get("/metrics", dependencies=[Depends(require_internal_token)])
+def metrics():
+    # Prometheus text format; scrape with the X-Internal-Token header when one is configured
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,20 +1,68 @@
+import os
+from typing import List, Optional
 from utils.logger_conf import logger
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from db.database import get_db
-from services.chat_service import ChatService
-from services.message_service import MessageService
+import asyncio
+import json
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile, WebSocket, status
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
+from services.chat_service import AsyncChatService
+from services.message_service import AsyncMessageService
 from api.user_routes import get_current_user
-from utils.rate_limiter import rate_limiter
+from utils.rate_limiter import RateLimiter
 from utils.user_logger import log_user_action
+from utils.pagination import PageParams, decode_rank_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utils.chat_cache import cached_chat_response
+from utils.ndjson import ndjson_response
+from utils.chat_events import iter_chat_events
+from utils.storage import save_upload, storage, stored_response
+from api.schemas import ChatDetails, MessageDeleted, MessageOut, MessagesCreated, Page, SearchHit
+
+BULK_MAX_MESSAGES = int(os.getenv("BULK_MAX_MESSAGES", 500))
+# Charged per message, so one request of N messages costs N
+bulk_rate_limiter = RateLimiter(limit=int(os.getenv("BULK_MESSAGES_PER_MINUTE", 1000)), period=60)
 
 router = APIRouter()
 
-@router.get("/{chat_id}", dependencies=[Depends(rate_limiter)])
-def get_chat_with_messages(request: Request, chat_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+
+class BulkMessage(BaseModel):
+    chat_id: int
+    content: str
+    request_metadata: Optional[str] = None
+
+
+class BulkMessages(BaseModel):
+    messages: List[BulkMessage] = Field(..., min_length=1, max_length=BULK_MAX_MESSAGES)
+
+
+# 0. SEARCH the current user's messages (declared before /{chat_id} so "search" isn't taken for an id)
+@router.get("/search", response_model=Page[SearchHit], dependencies=[Depends(RateLimiter(limit=60, period=60))])
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: str = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """Best matches first, with <mark>-highlighted snippets; pass next_cursor back as ?cursor= for more."""
+    try:
+        after = decode_rank_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").debug(f"Searching messages for {q!r}")
+    return await AsyncMessageService.search_messages(db, current_user.id, q, after=after, limit=limit)
+
+@router.get("/{chat_id}", response_model=ChatDetails, dependencies=[Depends(RateLimiter(limit=60, period=60))])
+async def get_chat_with_messages(request: Request, response: Response, chat_id: int, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
     # This retrieves the chat and all associated messages via the relationship
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").debug(f"{request.method} {request.url.path} | Retrieving chat with messages for chat_id: {chat_id}")
-    chat_details = ChatService.get_chat_details(db, chat_id)
+    # Served from the chat cache when possible; 304 if the client's ETag is current
+    chat_details = await cached_chat_response(
+        request, chat_id, "details", lambda: AsyncChatService.get_chat_details(db, chat_id), ChatDetails, headers=response.headers
+    )
     if not chat_details:
         logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").warning(f"{request.method} {request.url.path} | Chat not found: ID {chat_id}")
         raise HTTPException(status_code=404, detail="Chat not found")
@@ -27,35 +75,182 @@ def get_chat_with_messages(request: Request, chat_id: int, db: Session = Depends
     return chat_details
 
 # 1. CREATE Message with File/Audio & Metadata
-@router.post("/{chat_id}/send", dependencies=[Depends(rate_limiter)])
+@router.post("/{chat_id}/send", response_model=MessageOut, dependencies=[Depends(RateLimiter(limit=30, period=60))])
 async def create_message(
     request: Request,
     chat_id: int,
     content: str = "placeholder content",
     # request_metadata: str = Form(...), # Your metadata string
-    # file: UploadFile = File(None),      # Optional file/audio
-    db: Session = Depends(get_db),
+    file: UploadFile = File(None),      # Optional file/audio, multipart
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"{request.method} {request.url.path} | Creating message for chat {chat_id}")
-    message = MessageService.create_message(db, chat_id=chat_id, content=content)
+    file_path = None
+    if file is not None:
+        # Copied into storage a chunk at a time; identical files are stored once
+        stored = await save_upload(file)
+        file_path = stored.key
+        logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"Stored attachment {stored.key} ({stored.size} bytes, deduplicated={stored.deduplicated})")
+    message = await AsyncMessageService.create_message(db, chat_id=chat_id, content=content, file_path=file_path)
     log_user_action("send_message_full", {"chat_id": chat_id, "message_id": message.id}, user_uuid=current_user.uuid)
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").success(f"Message created: ID {message.id}")
     return message
 
+# 1b. CREATE many messages, for one or several chats, in one transaction
+@router.post("/bulk", response_model=MessagesCreated)
+async def create_messages_bulk(
+    request: Request,
+    response: Response,
+    payload: BulkMessages,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user)
+):
+    """Insert all messages or none; returns their ids in the order they were sent."""
+    count = len(payload.messages)
+    await bulk_rate_limiter.check(request, response, db, cost=count)
+    logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"{request.method} {request.url.path} | Creating {count} messages")
+
+    chat_ids = {message.chat_id for message in payload.messages}
+    missing = chat_ids - await AsyncChatService.get_existing_chat_ids(db, chat_ids)
+    if missing:
+        logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").warning(f"{request.method} {request.url.path} | Chats not found: {sorted(missing)}")
+        raise HTTPException(status_code=404, detail=f"Chats not found: {sorted(missing)}")
+
+    ids = await AsyncMessageService.create_messages(db, [message.model_dump() for message in payload.messages])
+    log_user_action("send_messages_bulk", {"chat_ids": sorted(chat_ids), "count": count}, user_uuid=current_user.uuid)
+    logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").success(f"{count} messages created")
+    return {"ids": ids}
+
 # 2. GET all messages for a specific chat
-@router.get("/chat/{chat_id}")
-def get_messages_by_chat(chat_id: int, db: Session = Depends(get_db)):
-    """Retrieve all messages in a conversation."""
+@router.get("/chat/{chat_id}", response_model=Page[MessageOut])
+async def get_messages_by_chat(request: Request, response: Response, chat_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db)):
+    """Retrieve a conversation oldest first, one page at a time; pass next_cursor back as ?cursor= for the next page."""
     logger.debug(f"Fetching messages for chat {chat_id}")
-    return MessageService.get_messages_by_chat(db, chat_id)
+    return await cached_chat_response(
+        request, chat_id, f"messages:{page.cursor or ''}:{page.limit}",
+        lambda: AsyncMessageService.get_messages_by_chat(db, chat_id, after=page.after, limit=page.limit),
+        Page[MessageOut],
+        # An empty page is all a chat that doesn't exist gets too
+        found=lambda messages: messages["items"],
+        headers=response.headers,
+    )
+
+# 2b. EXPORT a whole conversation as NDJSON, streamed
+@router.get("/chat/{chat_id}/export")
+async def export_messages(chat_id: int, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    """One JSON message per line, oldest first; memory use doesn't grow with the chat."""
+    logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"Exporting messages for chat {chat_id}")
+    if not await AsyncChatService.get_chat(db, chat_id):
+        raise HTTPException(status_code=404, detail="Chat not found")
+    await AsyncMessageService.prepare_export(db, chat_id)
+    return ndjson_response(db, AsyncMessageService.export_statement(chat_id), filename=f"chat-{chat_id}.ndjson")
+
+# 2c. SUBSCRIBE to a conversation: new, updated and deleted messages as they happen.
+# Browsers can't set headers on WebSocket/EventSource requests, so the token may also come as ?token=.
+async def _subscriber(connection, chat_id: int, token: str, db: AsyncSession):
+    try:
+        current_user = await get_current_user(connection, token, db)
+    except HTTPException:
+        return None, status.HTTP_401_UNAUTHORIZED
+    chat = await AsyncChatService.get_chat(db, chat_id)
+    # Someone else's chat is as not found as a missing one
+    if chat is None or chat.user_id != current_user.id:
+        return current_user, status.HTTP_404_NOT_FOUND
+    return current_user, None
+
+
+def _chat_events(db: AsyncSession, chat_id: int, last_id: int = None):
+    async def load_backlog(last_id, limit):
+        try:
+            return await AsyncMessageService.get_messages_after(db, chat_id, last_id, limit)
+        finally:
+            await db.close()
+
+    return iter_chat_events(chat_id, last_id, load_backlog)
+
+
+@router.websocket("/{chat_id}/ws")
+async def subscribe_ws(websocket: WebSocket, chat_id: int, token: str = None, last_id: int = None, db: AsyncSession = Depends(get_async_db)):
+    """JSON events on a WebSocket; reconnect with ?last_id= (the last message.created id seen) to replay what was missed."""
+    current_user, error = await _subscriber(websocket, chat_id, token, db)
+    if error:
+        await db.close()
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Chat not found" if current_user else "Could not validate credentials")
+        return
+    if last_id is None:
+        # Nothing to replay: don't hold a pooled connection for the life of the socket
+        await db.close()
+    await websocket.accept()
+    logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"WebSocket subscribed to chat {chat_id}")
+
+    async def send_events():
+        async for event in _chat_events(db, chat_id, last_id):
+            await websocket.send_json(event)
+
+    async def wait_for_close():
+        # Clients only listen; reading is how a close frame gets noticed between events
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send_events()), asyncio.create_task(wait_for_close())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.get("/{chat_id}/events")
+async def subscribe_sse(
+    request: Request,
+    chat_id: int,
+    token: str = None,
+    last_id: int = Query(None),
+    last_event_id: int = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Server-sent events fallback for /{chat_id}/ws; EventSource resumes through Last-Event-ID by itself."""
+    current_user, error = await _subscriber(request, chat_id, token, db)
+    if error == status.HTTP_401_UNAUTHORIZED:
+        raise HTTPException(status_code=error, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    if error:
+        raise HTTPException(status_code=error, detail="Chat not found")
+    last_id = last_id if last_id is not None else last_event_id
+    if last_id is None:
+        await db.close()
+    logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"SSE subscribed to chat {chat_id}")
+
+    async def stream():
+        async for event in _chat_events(db, chat_id, last_id):
+            if event["type"] == "ping":
+                yield ": ping\n\n"
+                continue
+            # Only creations carry an id, so Last-Event-ID is always a message id to resume after
+            event_id = f"id: {event['message']['id']}\n" if event["type"] == "message.created" else ""
+            yield f"{event_id}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 2d. DOWNLOAD a message's attachment; Range requests let audio players seek
+@router.get("/{message_id}/attachment")
+async def download_attachment(request: Request, message_id: int, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user)):
+    # Someone else's message is as not found as a missing one
+    msg = await AsyncMessageService.get_user_message(db, message_id, current_user.id)
+    stored = await run_in_threadpool(storage.stat, msg.file_path) if msg and msg.file_path else None
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    # Nothing else to query while the file streams
+    await db.close()
+    return stored_response(request, stored)
 
 # 3. UPDATE Message content or metadata
-@router.put("/{message_id}")
-def update_message(message_id: int, content: str = None, request_metadata: str = None, db: Session = Depends(get_db)):
+@router.put("/{message_id}", response_model=MessageOut)
+async def update_message(message_id: int, content: str = None, request_metadata: str = None, db: AsyncSession = Depends(get_async_db)):
     """Update message details."""
     logger.info(f"Updating message {message_id}")
-    msg = MessageService.update_message(db, message_id, content=content, request_metadata=request_metadata)
+    msg = await AsyncMessageService.update_message(db, message_id, content=content, request_metadata=request_metadata)
     if not msg:
         logger.warning(f"Message update failed: ID {message_id} not found")
         raise HTTPException(status_code=404, detail="Message not found")
@@ -63,10 +258,10 @@ def update_message(message_id: int, content: str = None, request_metadata: str =
     return msg
 
 # 4. DELETE Message
-@router.delete("/{message_id}")
-def delete_message(message_id: int, db: Session = Depends(get_db)):
+@router.delete("/{message_id}", response_model=MessageDeleted)
+async def delete_message(message_id: int, db: AsyncSession = Depends(get_async_db)):
     logger.info(f"Attempting to delete message {message_id}")
-    success = MessageService.delete_message(db, message_id)
+    success = await AsyncMessageService.delete_message(db, message_id)
     if not success:
         logger.warning(f"Message delete failed: ID {message_id} not found")
         raise HTTPException(status_code=404, detail="Message not found")
@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import Generic, List, Optional, TypeVar
+from pydantic import BaseModel, ConfigDict
+
+# Response bodies. Declared as response_model, FastAPI validates the return value
+# against them and writes the JSON in pydantic-core, in one pass, without
+# jsonable_encoder's walk over ORM instances. ORM objects are read attribute by
+# attribute, so only the columns listed here are touched: nothing lazy-loads, and
+# anything not listed (User.hashed_password) never leaves the server.
+
+
+class Schema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserOut(Schema):
+    id: int
+    uuid: Optional[str] = None
+    username: Optional[str] = None
+    email: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class ChatOut(Schema):
+    id: int
+    user_id: Optional[int] = None
+    # The mapped attribute's name, as clients have always received it
+    requestType: str
+    created_at: Optional[datetime] = None
+
+
+class MessageOut(Schema):
+    id: int
+    chat_id: Optional[int] = None
+    content: Optional[str] = None
+    request_metadata: Optional[str] = None
+    file_path: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class ChatDetails(Schema):
+    chat_id: int
+    type: str
+    messages: List[MessageOut]
+
+
+class SearchHit(Schema):
+    id: int
+    chat_id: int
+    created_at: Optional[datetime] = None
+    rank: float
+    highlight: Optional[str] = None
+
+
+class ActionLogEntry(Schema):
+    timestamp: str
+    action: str
+    details: dict = {}
+
+
+T = TypeVar("T")
+
+
+class Page(Schema, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+class Token(Schema):
+    access_token: str
+    token_type: str
+
+
+class CreatedUser(Schema):
+    status: str
+    user_id: int
+
+
+class MessagesCreated(Schema):
+    ids: List[int]
+
+
+class MessageDeleted(Schema):
+    status: str
+    id: int
+
+
+class Detail(Schema):
+    message: str
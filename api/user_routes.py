@@ -1,17 +1,26 @@
+from datetime import datetime
 from utils.logger_conf import logger
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from db.database import get_db
-from services.user_service import UserService
-from utils.rate_limiter import rate_limiter
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
+from db.routing import bind_client_async
+from services.user_service import UserService, AsyncUserService
+from services.user_action_service import AsyncUserActionService
+from utils.rate_limiter import RateLimiter
 from utils.user_logger import log_user_action, get_user_logs
+from utils.identity import get_token_payload, resolve_user_async
+from utils.pagination import PageParams, build_page, encode_cursor
+from utils.ndjson import ndjson_response
+from api.internal_routes import require_internal_token
+from api.schemas import ActionLogEntry, CreatedUser, Detail, Page, Token, UserOut
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
-def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = UserService.decode_access_token(token)
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    payload = get_token_payload(request, token)
     if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -25,20 +34,22 @@ def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db:
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = UserService.get_user_by_email(db, email=email)
+    # Reuses the user already resolved by rate_limiter for this request, if any
+    user = await resolve_user_async(request, db, token)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    request.state.user = user
     return user
 
-@router.post("/login")
-def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = UserService.get_user_by_email(db, email=form_data.username)
-    if not user or not UserService.verify_password(form_data.password, user.hashed_password):
+@router.post("/login", response_model=Token)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    # A user who has just signed up is read from the primary
+    await bind_client_async(form_data.username)
+    user = await AsyncUserService.get_user_by_email(db, email=form_data.username)
+    if not user or not await AsyncUserService.check_password(db, user, form_data.password):
         if user:
             logger.bind(service="application", track=f"user_uuid:{user.uuid}").info(f"{request.method} {request.url.path} | login_failed")
             log_user_action("login_failed", {"reason": "incorrect_password"}, user_uuid=user.uuid)
@@ -53,47 +64,71 @@ def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db
     log_user_action("login_success", user_uuid=user.uuid)
     return {"access_token": access_token, "token_type": "bearer"}
 
-@router.get("/me", dependencies=[Depends(rate_limiter)])
-def read_users_me(request: Request, current_user=Depends(get_current_user)):
+@router.get("/me", response_model=UserOut, dependencies=[Depends(RateLimiter(limit=30, period=60))])
+async def read_users_me(request: Request, current_user=Depends(get_current_user)):
     logger.bind(service="application", track=f"user_uuid:{current_user.uuid}").info(f"{request.method} {request.url.path} | view_profile")
     log_user_action("view_profile", user_uuid=current_user.uuid)
     return current_user
 
-@router.get("/logs")
-def read_user_logs(current_user=Depends(get_current_user)):
-    return get_user_logs(f"user_uuid:{current_user.uuid}")
+@router.get("/logs", response_model=Page[ActionLogEntry])
+async def read_user_logs(page: PageParams = Depends(), current_user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    identifier = f"user_uuid:{current_user.uuid}"
+    items, after = [], page.after
+    if after is None:
+        # The most recent entries come from Redis
+        items = await run_in_threadpool(get_user_logs, identifier, page.limit)
+        if items:
+            after = (datetime.fromisoformat(items[-1]["timestamp"]), 0)
 
-@router.post("/test-user")
-def create_test_user(username: str, email: str, password: str, db: Session = Depends(get_db)):
+    # Everything older comes from the user_actions history
+    remaining = page.limit - len(items)
+    rows = await AsyncUserActionService.get_history(db, identifier, after, remaining)
+    if remaining == 0:
+        next_cursor = encode_cursor(*after) if rows else None
+    else:
+        history = build_page(rows, remaining)
+        items += [row.as_log() for row in history["items"]]
+        next_cursor = history["next_cursor"]
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.post("/test-user", response_model=CreatedUser)
+async def create_test_user(username: str, email: str, password: str, db: AsyncSession = Depends(get_async_db)):
     logger.info(f"Attempting to create test user: {username} ({email})")
+    await bind_client_async(email)
     try:
-        new_user = UserService.create_user(db, username=username, email=email, password=password)
+        new_user = await AsyncUserService.create_user(db, username=username, email=email, password=password)
         logger.success(f"User created successfully: ID {new_user.id}")
         return {"status": "success", "user_id": new_user.id}
     except Exception as e:
         logger.error(f"Error creating test user: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/")
-def get_all_users(db: Session = Depends(get_db)):
+@router.get("/", response_model=Page[UserOut])
+async def get_all_users(page: PageParams = Depends(), db: AsyncSession = Depends(get_async_db)):
     logger.debug("Fetching all users")
-    users = UserService.get_all_users(db)
+    users = await AsyncUserService.get_all_users(db, after=page.after, limit=page.limit)
     return users
 
+@router.get("/export", dependencies=[Depends(require_internal_token)])
+async def export_users(db: AsyncSession = Depends(get_async_db)):
+    """Admin export of all users as NDJSON, streamed."""
+    logger.info("Exporting users")
+    return ndjson_response(db, AsyncUserService.export_statement(), filename="users.ndjson")
+
 
-@router.get("/{user_id}")
-def get_user(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}", response_model=UserOut)
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     logger.debug(f"Fetching user with ID: {user_id}")
-    user = UserService.get_user(db, user_id)
+    user = await AsyncUserService.get_user(db, user_id)
     if not user:
         logger.warning(f"User not found: ID {user_id}")
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-@router.delete("/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
+@router.delete("/{user_id}", response_model=Detail)
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     logger.info(f"Attempting to delete user with ID: {user_id}")
-    success = UserService.delete_user(db, user_id)
+    success = await AsyncUserService.delete_user(db, user_id)
     if not success:
         logger.warning(f"Failed to delete user: ID {user_id} not found")
         raise HTTPException(status_code=404, detail="User not found")
@@ -0,0 +1,113 @@
+"""
+Logging cost on the request thread, before and after the batched log pipeline.
+
+A simulated request logs what a typical route does: two bound application lines
+plus one stdlib record bridged through InterceptHandler (uvicorn access log). Only
+the time spent inside the logging calls is measured. Between requests the thread
+sleeps for --idle-us to stand in for the request's own IO, which is when a server
+would give the background writer its CPU time.
+
+    python -m benchmarks.logging_overhead --requests 20000 --idle-us 200
+
+"legacy" rebuilds the previous configuration: synchronous colorized stdout sink and a
+JSON file sink serialized in a filter on the calling thread. Console output goes to
+/dev/null in both variants so the terminal doesn't dominate the measurement.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+import utils.logger_conf as logger_conf
+from utils.logger_conf import InterceptHandler, serialize
+
+
+class LegacyInterceptHandler(logging.Handler):
+    # InterceptHandler as it was: walks the stack to find the caller for every record
+    def emit(self, record):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        frame, depth = sys._getframe(6), 6
+        while frame and frame.f_code.co_filename == logging.__file__:
+            frame = frame.f_back
+            depth += 1
+        logger.opt(depth=depth, exception=record.exc_info).bind(service="system").log(level, record.getMessage())
+
+
+def setup_legacy(directory, devnull):
+    logger.remove()
+
+    def json_injector(record):
+        record["extra"]["json_format"] = serialize(record)
+        return True
+
+    logger.add(devnull, colorize=True, level="DEBUG")
+    logger.add(
+        os.path.join(directory, "app.log"),
+        format="{extra[json_format]}",
+        filter=json_injector,
+        level="DEBUG",
+        rotation="10 MB",
+        backtrace=False,
+        diagnose=False,
+        catch=False,
+    )
+    return LegacyInterceptHandler(), None
+
+
+def setup_pipeline(directory, devnull):
+    from utils.log_pipeline import BatchingSink, RotatingFileWriter, StreamWriter
+
+    logger.remove()
+    sink = BatchingSink([
+        (logger_conf.format_console, StreamWriter(devnull)),
+        (serialize, RotatingFileWriter(os.path.join(directory, "app.log"))),
+    ])
+    logger.add(sink, format="{message}", level="DEBUG", backtrace=False, diagnose=False, catch=False)
+    return InterceptHandler(), sink
+
+
+def run(variant: str, requests: int, idle_us: int):
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        handler, sink = (setup_legacy if variant == "legacy" else setup_pipeline)(directory, devnull)
+        access_log = logging.getLogger("bench.access")
+        access_log.handlers = [handler]
+        access_log.propagate = False
+        access_log.setLevel(logging.INFO)
+
+        elapsed = 0.0
+        for i in range(requests):
+            track = f"user_uuid:{i % 100}"
+            started = time.perf_counter()
+            logger.bind(service="application", track=track).info(f"POST /messages/1/send | Creating message for chat 1")
+            logger.bind(service="application", track=track).success(f"Message created: ID {i}")
+            access_log.info('127.0.0.1:5000 - "POST /messages/1/send HTTP/1.1" 200')
+            elapsed += time.perf_counter() - started
+            if idle_us:
+                time.sleep(idle_us / 1e6)
+
+        stats = {}
+        if sink is not None:
+            sink.drain(timeout=60)
+            stats = sink.get_stats()
+            sink.stop()
+        logger.remove()
+    return elapsed / requests * 1e6, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--idle-us", type=int, default=200)
+    args = parser.parse_args()
+
+    for variant in ("legacy", "pipeline"):
+        per_request_us, stats = run(variant, args.requests, args.idle_us)
+        extra = f"  dropped={stats['dropped']} sampled_out={stats['sampled_out']} batches={stats['batches']}" if stats else ""
+        print(f"{variant:<10}{per_request_us:>10.1f} us/request{extra}")
@@ -0,0 +1,90 @@
+"""
+Cost of turning a loaded chat into a JSON body: GET /messages/{chat_id} for a chat of
+--messages messages, serialization only (the rows are loaded once, up front).
+
+  jsonable_encoder   what untyped routes and the chat cache did: jsonable_encoder's
+                     walk over the ORM instances, then json.dumps
+  + orjson           the same walk, then orjson (what ORJSONResponse would add)
+  response_model     ChatDetails: validated from the columns and written by pydantic-core,
+                     as FastAPI does for a route with a response_model and the cache does
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.serialization --messages 10000 --repeat 20
+
+A throwaway SQLite database is used unless DATABASE_URL is set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+
+def timed(fn, repeat: int):
+    samples, body = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), len(body)
+
+
+async def load_chat(messages: int):
+    from db.database import get_engine, get_async_engine, get_session_factory, get_async_session_factory
+    from db.migrations import migrate
+    import models.User  # noqa: F401  (resolve relationships)
+    from services.chat_service import AsyncChatService, ChatService
+    from services.message_service import MessageService
+
+    migrate(get_engine())
+    db = get_session_factory()()
+    try:
+        chat_id = ChatService.create_chat(db, user_id=None).id
+        MessageService.create_messages(db, [{"chat_id": chat_id, "content": f"message {i} " + "lorem ipsum " * 8} for i in range(messages)])
+    finally:
+        db.close()
+    async with get_async_session_factory()() as db:
+        details = await AsyncChatService.get_chat_details(db, chat_id)
+    await get_async_engine().dispose()
+    return details
+
+
+def main(messages: int, repeat: int):
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(scratch, 'serialization.db')}")
+        os.environ.setdefault("APP_ENV", "test")
+        from fastapi.encoders import jsonable_encoder
+        from api.schemas import ChatDetails
+
+        details = asyncio.run(load_chat(messages))
+        variants = {
+            "jsonable_encoder": lambda: json.dumps(jsonable_encoder(details)).encode(),
+            "response_model": lambda: ChatDetails.model_validate(details).model_dump_json(),
+        }
+        try:
+            import orjson
+
+            variants["+ orjson"] = lambda: orjson.dumps(jsonable_encoder(details))
+        except ImportError:
+            pass
+
+        print(f"{messages} messages, median of {repeat}")
+        print(f"{'variant':<18}{'ms':>9}{'KiB':>9}{'speedup':>9}")
+        baseline = None
+        for name in ("jsonable_encoder", "+ orjson", "response_model"):
+            if name not in variants:
+                continue
+            ms, size = timed(variants[name], repeat)
+            baseline = baseline or ms
+            print(f"{name:<18}{ms:>9.1f}{size / 1024:>9.0f}{baseline / ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.messages, args.repeat)
@@ -0,0 +1,199 @@
+"""
+Route-level benchmark of the real application: boots `app` from main.py in this process,
+with Redis replaced by fakeredis and, unless DATABASE_URL is set, a throwaway SQLite
+database. Each route is driven in turn by --concurrency clients for --requests requests:
+
+  login         POST /users/login
+  create_chat   POST /chats/new
+  send_message  POST /messages/{chat_id}/send
+  read_chat     GET  /messages/{chat_id}  (a chat of --chat-size messages)
+
+and reported as throughput and p50/p95/p99 latency of the successful requests, with
+failures (e.g. logins shed with 503) counted separately. Rate limits are lifted so
+every request does its full amount of work.
+
+    python -m benchmarks.suite --concurrency 20 --requests 500 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --concurrency 20 --requests 500 --baseline benchmarks/baseline.json
+
+With --baseline, each route is compared with the stored run and the exit status is 1
+when one regressed beyond --tolerance (throughput down, or p95 up). Baselines are only
+comparable on the same machine and database. Point DATABASE_URL at a scratch Postgres
+to measure the production driver stack. Requires httpx and fakeredis.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROUTES = ("login", "create_chat", "send_message", "read_chat")
+EMAIL, PASSWORD = "suite@example.com", "password123"
+
+
+def boot(database_url: str):
+    """Import the application against the stand-ins; everything reads its config at import."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("APP_ENV", "test")
+    import fakeredis
+    import utils.redis_client
+
+    utils.redis_client.redis_client = fakeredis.FakeRedis(decode_responses=True)
+    utils.redis_client.async_redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    from main import app
+    from db.database import get_engine
+    from db.migrations import migrate
+    from api.chat_routes import router as chat_router
+    from api.message_routes import router as message_router
+    from api.user_routes import router as user_router
+    from benchmarks.login_storm import lift_rate_limits
+
+    migrate(get_engine())
+    lift_rate_limits(user_router, chat_router, message_router)
+    return app
+
+
+def seed(chat_size: int):
+    from db.database import SessionLocal
+    from services.chat_service import ChatService
+    from services.message_service import MessageService
+    from services.user_service import UserService
+
+    db = SessionLocal()
+    try:
+        user = UserService.get_user_by_email(db, EMAIL) or UserService.create_user(db, username="suite", email=EMAIL, password=PASSWORD)
+        read_chat, send_chat = ChatService.create_chat(db, user_id=user.id), ChatService.create_chat(db, user_id=user.id)
+        MessageService.create_messages(db, [{"chat_id": read_chat.id, "content": f"message {i}"} for i in range(chat_size)])
+        return {
+            "headers": {"Authorization": f"Bearer {UserService.create_access_token(data={'sub': EMAIL})}"},
+            "read_chat": read_chat.id,
+            "send_chat": send_chat.id,
+        }
+    finally:
+        db.close()
+
+
+def request(client, route: str, ctx: dict, i: int):
+    if route == "login":
+        return client.post("/users/login", data={"username": EMAIL, "password": PASSWORD})
+    if route == "create_chat":
+        return client.post("/chats/new", headers=ctx["headers"])
+    if route == "send_message":
+        return client.post(f"/messages/{ctx['send_chat']}/send", params={"content": f"suite {i}"}, headers=ctx["headers"])
+    if route == "read_chat":
+        return client.get(f"/messages/{ctx['read_chat']}", headers=ctx["headers"])
+    raise ValueError(f"Unknown route: {route}")
+
+
+async def run_route(client, route: str, ctx: dict, concurrency: int, requests: int, warmup: int):
+    from benchmarks.async_db import percentile
+
+    for i in range(warmup):
+        await request(client, route, ctx, i)
+    latencies, statuses = [], {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for i in remaining:
+            started = time.perf_counter()
+            resp = await request(client, route, ctx, i)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            # Rejections (e.g. logins shed with 503 when hashing is saturated) are fast and
+            # would flatter the latencies; they are reported as errors instead
+            if resp.status_code < 400:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = latencies or [float("nan")]
+    return {
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "rps": (requests - sum(count for status, count in statuses.items() if status >= 400)) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Lines of a per-route comparison, and the routes that regressed."""
+    lines, regressed = [], []
+    for route, now in results["routes"].items():
+        before = baseline["routes"].get(route)
+        if before is None:
+            lines.append(f"{route:<14}no baseline")
+            continue
+        rps = now["rps"] / before["rps"] - 1
+        p95 = now["p95_ms"] / before["p95_ms"] - 1
+        p99 = now["p99_ms"] / before["p99_ms"] - 1
+        worse = rps < -tolerance or p95 > tolerance
+        if worse:
+            regressed.append(route)
+        lines.append(f"{route:<14}{rps:>+10.1%}{p95:>+10.1%}{p99:>+10.1%}{'  REGRESSED' if worse else ''}")
+    return lines, regressed
+
+
+async def main(args):
+    import httpx
+
+    with tempfile.TemporaryDirectory() as scratch:
+        app = boot(os.getenv("DATABASE_URL") or f"sqlite:///{os.path.join(scratch, 'suite.db')}")
+        from db.database import DATABASE_URL, async_engine
+        from utils.password_hasher import hashing_executor
+
+        ctx = seed(args.chat_size)
+        results = {
+            "meta": {
+                "when": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "database": DATABASE_URL.split("://", 1)[0],
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "chat_size": args.chat_size,
+            },
+            "routes": {},
+        }
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://suite", timeout=None) as client:
+            print(f"{'route':<14}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+            for route in args.routes:
+                r = await run_route(client, route, ctx, args.concurrency, args.requests, args.warmup)
+                results["routes"][route] = r
+                print(f"{route:<14}{r['requests']:>9}{r['errors']:>8}{r['rps']:>9.0f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+        hashing_executor.shutdown()
+        await async_engine.dispose()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(results, baseline, args.tolerance)
+        print(f"\nagainst {args.baseline} ({baseline['meta']['when']}), tolerance {args.tolerance:.0%}")
+        print(f"{'route':<14}{'req/s':>10}{'p95':>10}{'p99':>10}")
+        print("\n".join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=300, help="per route")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per route")
+    parser.add_argument("--chat-size", type=int, default=100, help="messages in the chat read_chat reads")
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=list(ROUTES))
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change before a route counts as regressed")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,152 @@
+"""
+Throughput of the production runner (python -m server) as the worker count grows.
+
+For every count in --workers the server is started on its own, a read route is driven
+for --seconds by --load-processes client processes with --concurrency requests in flight
+each, and the server is stopped with SIGTERM. Reported per count: requests per second,
+latency percentiles, and how long the graceful stop took.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.worker_scaling --workers 1,2,4 --seconds 10
+
+The route (default GET /users/1, one async query and a response model) needs no Redis.
+A throwaway SQLite database is used unless DATABASE_URL is set. The load generator shares
+the machine: give it cores of its own (taskset) or the curve flattens early. Workers
+beyond the CPUs available to the container only add context switches.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def seed(email: str):
+    from db.database import get_engine, get_session_factory
+    from db.migrations import migrate
+    import models.Chat, models.Message, models.User  # noqa: F401  (resolve relationships)
+    from services.user_service import UserService
+
+    migrate(get_engine())
+    db = get_session_factory()()
+    try:
+        user = UserService.get_user_by_email(db, email) or UserService.create_user(db, "bench", email, "password123")
+        return user.id
+    finally:
+        db.close()
+
+
+def wait_until_serving(url: str, process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start in time")
+
+
+async def drive(url: str, concurrency: int, seconds: float):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def loop():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def load_process(args):
+    return asyncio.run(drive(*args))
+
+
+def percentile(sorted_values, p: float):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))] if sorted_values else 0.0
+
+
+def measure(workers: int, port: int, path: str, load_processes: int, concurrency: int, seconds: float, env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "server", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_until_serving(f"{base}/", process)
+        with multiprocessing.get_context("spawn").Pool(load_processes) as pool:
+            results = pool.map(load_process, [(f"{base}{path}", concurrency, seconds)] * load_processes)
+    finally:
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+        stop_seconds = time.perf_counter() - stopping
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(errors for _, errors in results)
+    return {
+        "rps": len(latencies) / seconds,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+        "stop": stop_seconds,
+    }
+
+
+def main(worker_counts, path: str, load_processes: int, concurrency: int, seconds: float, port: int):
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(scratch, 'worker_scaling.db')}")
+        os.environ.setdefault("APP_ENV", "test")
+        from server import available_cpus
+
+        user_id = seed("worker-scaling@example.com")
+        path = path.format(user_id=user_id)
+        # Keep the workers' log files out of logs/
+        env = dict(os.environ, LOG_FILE=os.path.join(scratch, "app.{pid}.log"))
+
+        print(f"GET {path}, {load_processes}x{concurrency} clients for {seconds:.0f}s, {available_cpus()} CPUs available")
+        print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'stop s':>8}{'scaling':>9}")
+        baseline = None
+        for workers in worker_counts:
+            result = measure(workers, port, path, load_processes, concurrency, seconds, env)
+            baseline = baseline or result["rps"]
+            print(
+                f"{workers:>8}{result['rps']:>10.0f}{result['p50']:>9.1f}{result['p99']:>9.1f}"
+                f"{result['errors']:>8}{result['stop']:>8.1f}{result['rps'] / baseline:>8.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--path", default="/users/{user_id}")
+    parser.add_argument("--load-processes", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight per load process")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    main([int(n) for n in args.workers.split(",")], args.path, args.load_processes, args.concurrency, args.seconds, args.port)
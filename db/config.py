@@ -0,0 +1,98 @@
+import os
+
+APP_ENV = os.getenv("APP_ENV", "dev")
+
+# Per-profile defaults. Every value can be overridden with the matching DB_* variable,
+# e.g. DB_POOL_SIZE=20 or DB_ECHO=false.
+PROFILES = {
+    "dev": {
+        "echo": True,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 0,
+        "pool_wait_warn_ms": 500,
+    },
+    "test": {
+        "echo": False,
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": False,
+        "statement_timeout_ms": 0,
+        "pool_wait_warn_ms": 500,
+    },
+    "prod": {
+        "echo": False,
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 5000,
+        "pool_wait_warn_ms": 100,
+    },
+}
+
+
+def _parse(value: str, default):
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+    return type(default)(value)
+
+
+class EngineConfig:
+    def __init__(self, profile: str = APP_ENV, **overrides):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown APP_ENV profile: {profile}")
+        self.profile = profile
+        values = dict(PROFILES[profile])
+        for name, default in values.items():
+            env_value = os.getenv(f"DB_{name.upper()}")
+            if env_value is not None:
+                values[name] = _parse(env_value, default)
+        values.update(overrides)
+
+        self.echo = values["echo"]
+        self.pool_size = values["pool_size"]
+        self.max_overflow = values["max_overflow"]
+        self.pool_timeout = values["pool_timeout"]
+        self.pool_recycle = values["pool_recycle"]
+        self.pool_pre_ping = values["pool_pre_ping"]
+        self.statement_timeout_ms = values["statement_timeout_ms"]
+        self.pool_wait_warn_ms = values["pool_wait_warn_ms"]
+
+    def engine_kwargs(self, url: str):
+        kwargs = {"echo": self.echo}
+        if url.startswith("sqlite"):
+            # SQLite picks its own pool; sizing and server-side timeouts don't apply
+            return kwargs
+
+        kwargs.update(
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=self.pool_pre_ping,
+        )
+        if self.statement_timeout_ms:
+            if "+asyncpg" in url:
+                kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(self.statement_timeout_ms)}}
+            else:
+                kwargs["connect_args"] = {"options": f"-c statement_timeout={self.statement_timeout_ms}"}
+        return kwargs
+
+    def as_dict(self):
+        return {
+            "profile": self.profile,
+            "echo": self.echo,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pool_pre_ping,
+            "statement_timeout_ms": self.statement_timeout_ms,
+        }
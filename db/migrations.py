@@ -0,0 +1,276 @@
+"""
+Versioned schema migrations, applied once per deploy as their own step, before any app
+worker starts:
+
+    python -m db.migrations             # upgrade to the latest version
+    python -m db.migrations --status    # applied and latest version
+
+Each migration runs in its own transaction and is recorded in schema_migrations; the app
+itself only compares the recorded version with LATEST_VERSION at startup (check_schema).
+Migrations are frozen: they spell out the schema as it was when they were written and
+never import the models. Change the schema by appending a migration, not by editing one.
+"""
+import argparse
+import sys
+from datetime import date, datetime
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, JSON, LargeBinary, MetaData, String, Table, Text,
+    inspect, select, text,
+)
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from utils.logger_conf import logger
+
+log = logger.bind(service="database")
+
+# Any constant will do; it keeps two concurrent `migrate` runs from interleaving on Postgres
+_ADVISORY_LOCK_ID = 7_314_002
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def _0001_baseline(conn):
+    # The tables as create_all made them until now. checkfirst, so a database that
+    # create_all already built is adopted as it is.
+    meta = MetaData()
+    Table(
+        "users", meta,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("uuid", String, unique=True, index=True),
+        Column("username", String, unique=True, index=True),
+        Column("email", String, unique=True, index=True),
+        Column("hashed_password", String),
+        Column("created_at", DateTime),
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
+    Table(
+        "chats", meta,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("request_type", String, nullable=False),
+        Column("created_at", DateTime),
+        Index("ix_chats_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+    Table(
+        "messages", meta,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("content", String),
+        Column("request_metadata", Text, nullable=True),
+        Column("file_path", String, nullable=True),
+        Column("chat_id", Integer, ForeignKey("chats.id")),
+        Column("created_at", DateTime),
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+    )
+    Table(
+        "user_actions", meta,
+        Column("id", BigInteger, primary_key=True, autoincrement=False),
+        Column("created_at", DateTime, primary_key=True),
+        Column("identifier", String(255), nullable=False),
+        Column("action", String(100), nullable=False),
+        Column("details", JSON, nullable=True),
+        Index("ix_user_actions_identifier_created_at_id", "identifier", "created_at", "id"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    meta.create_all(bind=conn, checkfirst=True)
+
+
+def _0002_message_search(conn):
+    # Full-text search (Postgres only): see models.Message.SEARCH_CONFIG
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+    conn.execute(text(
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_messages_chat_id_content_tsv ON messages USING gin (chat_id, content_tsv)"))
+
+
+def _0003_replica_heartbeat(conn):
+    # One row, stamped on the primary and read back from each replica: see db.routing
+    meta = MetaData()
+    heartbeat = Table(
+        "replica_heartbeat", meta,
+        Column("id", Integer, primary_key=True, autoincrement=False),
+        Column("beat_at", Float, nullable=False),
+    )
+    meta.create_all(bind=conn, checkfirst=True)
+    conn.execute(heartbeat.insert().values(id=1, beat_at=0))
+
+
+def _month_after(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+def _0004_message_partitions(conn):
+    # Archive of cold chats (see services.message_archive), on every database
+    meta = MetaData()
+    Table("chats", meta, Column("id", Integer, primary_key=True))
+    archives = Table(
+        "chat_archives", meta,
+        Column("chat_id", Integer, ForeignKey("chats.id"), primary_key=True, autoincrement=False),
+        Column("payload", LargeBinary, nullable=False),
+        Column("message_count", Integer, nullable=False),
+        Column("archived_at", DateTime, nullable=False),
+    )
+    archives.create(bind=conn, checkfirst=True)
+    if "archived_at" not in {column["name"] for column in inspect(conn).get_columns("chats")}:
+        conn.execute(text("ALTER TABLE chats ADD COLUMN archived_at TIMESTAMP"))
+
+    # Monthly range partitions of messages (Postgres only)
+    if conn.dialect.name != "postgresql":
+        return
+    if conn.execute(text("SELECT relkind FROM pg_class WHERE oid = 'messages'::regclass")).scalar() == "p":
+        return
+    # The partition key can't be NULL, and no message may predate its chat: reads bound
+    # messages.created_at by chats.created_at so that old partitions are pruned
+    conn.execute(text(
+        "UPDATE chats SET created_at = first.created_at "
+        "FROM (SELECT chat_id, min(created_at) AS created_at FROM messages GROUP BY chat_id) AS first "
+        "WHERE chats.id = first.chat_id AND (chats.created_at IS NULL OR first.created_at < chats.created_at)"
+    ))
+    conn.execute(text("UPDATE chats SET created_at = 'epoch' WHERE created_at IS NULL"))
+    conn.execute(text(
+        "UPDATE messages SET created_at = chats.created_at FROM chats "
+        "WHERE messages.created_at IS NULL AND chats.id = messages.chat_id"
+    ))
+    conn.execute(text("UPDATE messages SET created_at = 'epoch' WHERE created_at IS NULL"))
+    conn.execute(text("ALTER TABLE messages ALTER COLUMN created_at SET NOT NULL"))
+
+    # The existing table becomes the partition of everything up to `until`, rows and
+    # indexes as they are; monthly partitions take over from there
+    newest = conn.execute(text("SELECT max(created_at) FROM messages")).scalar()
+    until = date.today().replace(day=1)
+    if newest is not None and newest.date() >= until:
+        until = _month_after(newest)
+
+    conn.execute(text("ALTER TABLE messages RENAME TO messages_legacy"))
+    conn.execute(text("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey"))
+    for index in ("ix_messages_id", "ix_messages_chat_id_created_at_id", "ix_messages_chat_id_content_tsv"):
+        conn.execute(text(f"ALTER INDEX IF EXISTS {index} RENAME TO {index.replace('messages', 'messages_legacy', 1)}"))
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence('messages_legacy', 'id')")).scalar()
+    conn.execute(text(f"""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('{sequence}'::regclass),
+            content varchar,
+            request_metadata text,
+            file_path varchar,
+            chat_id integer REFERENCES chats (id),
+            created_at timestamp NOT NULL,
+            content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED,
+            CONSTRAINT messages_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """))
+    conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY messages.id"))
+    conn.execute(text("CREATE INDEX ix_messages_id ON messages (id)"))
+    conn.execute(text("CREATE INDEX ix_messages_chat_id_created_at_id ON messages (chat_id, created_at, id)"))
+    conn.execute(text("CREATE INDEX ix_messages_chat_id_content_tsv ON messages USING gin (chat_id, content_tsv)"))
+    # Scans messages_legacy once to check the bound, and gives it the (id, created_at) key
+    conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION messages_legacy FOR VALUES FROM (MINVALUE) TO ('{until}')"))
+    start = until
+    for _ in range(3):
+        end = _month_after(start)
+        conn.execute(text(f"CREATE TABLE messages_{start:%Y_%m} PARTITION OF messages FOR VALUES FROM ('{start}') TO ('{end}')"))
+        start = end
+    # Catches rows no partition covers rather than failing their insert
+    conn.execute(text("CREATE TABLE messages_default PARTITION OF messages DEFAULT"))
+
+
+def _0005_chat_rehydrated_at(conn):
+    # Reopened archived chats, so that archival finds them again: see services.message_archive
+    if "rehydrated_at" not in {column["name"] for column in inspect(conn).get_columns("chats")}:
+        conn.execute(text("ALTER TABLE chats ADD COLUMN rehydrated_at TIMESTAMP"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chats_rehydrated_at ON chats (rehydrated_at) WHERE rehydrated_at IS NOT NULL"
+    ))
+
+
+MIGRATIONS = (
+    (1, "baseline", _0001_baseline),
+    (2, "message_search", _0002_message_search),
+    (3, "replica_heartbeat", _0003_replica_heartbeat),
+    (4, "message_partitions", _0004_message_partitions),
+    (5, "chat_rehydrated_at", _0005_chat_rehydrated_at),
+)
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """The highest applied version; 0 for a database that has never been migrated."""
+    try:
+        return conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc()).limit(1)).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # No schema_migrations table yet
+        conn.rollback()
+        return 0
+
+
+def migrate(engine, target: int = LATEST_VERSION):
+    """Apply the pending migrations up to `target`; returns the versions applied."""
+    applied = []
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _ADVISORY_LOCK_ID})
+            conn.commit()
+        try:
+            _meta.create_all(bind=conn, checkfirst=True)
+            conn.commit()
+            current = current_version(conn)
+            conn.commit()
+            for version, name, upgrade in MIGRATIONS:
+                if version <= current or version > target:
+                    continue
+                started = datetime.now()
+                with conn.begin():
+                    upgrade(conn)
+                    conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.now()))
+                log.info(f"Applied migration {version:04d}_{name} in {(datetime.now() - started).total_seconds():.2f}s")
+                applied.append(version)
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _ADVISORY_LOCK_ID})
+                conn.commit()
+    return applied
+
+
+def check_schema(engine):
+    """One query at startup: refuse to serve against a database that hasn't been migrated."""
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version < LATEST_VERSION:
+        raise SchemaOutOfDate(
+            f"Database schema is at version {version}, this build needs {LATEST_VERSION}: run `python -m db.migrations`"
+        )
+    if version > LATEST_VERSION:
+        # A newer build has migrated already (rolling deploy); migrations only ever add
+        log.warning(f"Database schema is at version {version}, ahead of this build ({LATEST_VERSION})")
+    return version
+
+
+if __name__ == "__main__":
+    from db.database import get_engine
+    from utils.logger_conf import setup_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="print the applied and latest version and exit")
+    parser.add_argument("--target", type=int, default=LATEST_VERSION, help="migrate up to this version")
+    args = parser.parse_args()
+    setup_logging()
+    engine = get_engine()
+    if args.status:
+        with engine.connect() as conn:
+            version = current_version(conn)
+        print(f"applied: {version}, latest: {LATEST_VERSION}")
+        sys.exit(0 if version >= LATEST_VERSION else 1)
+    applied = migrate(engine, args.target)
+    print(f"applied: {', '.join(map(str, applied)) or 'nothing, already up to date'}")
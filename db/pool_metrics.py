@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from utils.logger_conf import logger
+
+# Upper bounds (ms) of the checkout wait histogram buckets; the last bucket is +Inf
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_registry = {}
+
+
+class PoolMetrics:
+    def __init__(self, name: str, warn_ms: float = 500):
+        self.name = name
+        self.warn_ms = warn_ms
+        self.pool = None
+        self._lock = threading.Lock()
+        self._buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_count = 0
+        self._wait_sum_ms = 0.0
+        self._timeouts = 0
+
+    def observe_wait(self, waited_ms: float):
+        index = len(WAIT_BUCKETS_MS)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if waited_ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self._buckets[index] += 1
+            self._wait_count += 1
+            self._wait_sum_ms += waited_ms
+
+    def record_timeout(self):
+        with self._lock:
+            self._timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets = list(self._buckets)
+            wait_count, wait_sum_ms, timeouts = self._wait_count, self._wait_sum_ms, self._timeouts
+
+        cumulative, histogram = 0, {}
+        for bound, count in zip(list(WAIT_BUCKETS_MS) + ["+Inf"], buckets):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+
+        pool = self.pool
+        stats = {
+            "name": self.name,
+            "wait_count": wait_count,
+            "wait_sum_ms": round(wait_sum_ms, 3),
+            "wait_histogram_ms": histogram,
+            "timeouts": timeouts,
+        }
+        if pool is not None:
+            stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        return stats
+
+
+class _TimedPoolMixin:
+    """Measures how long each checkout waits, including opening a new connection."""
+
+    metrics = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Pool.recreate() builds a fresh instance of the same class; follow it
+        self.metrics.pool = self
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            logger.bind(service="database").error(f"Pool checkout timed out on {self.metrics.name} | {json.dumps(self.metrics.snapshot())}")
+            raise
+        waited_ms = (time.perf_counter() - started) * 1000
+        self.metrics.observe_wait(waited_ms)
+        if waited_ms >= self.metrics.warn_ms:
+            logger.bind(service="database").warning(f"Slow pool checkout on {self.metrics.name}: waited {waited_ms:.0f}ms | {json.dumps(self.metrics.snapshot())}")
+        return conn
+
+
+def timed_pool_class(base, name: str, warn_ms: float = 500):
+    """Subclass `base` (e.g. QueuePool) so checkouts are recorded under `name`."""
+    metrics = PoolMetrics(name, warn_ms)
+    _registry[name] = metrics
+    return type(f"Timed{base.__name__}", (_TimedPoolMixin, base), {"metrics": metrics})
+
+
+def get_pool_stats():
+    return [metrics.snapshot() for metrics in _registry.values()]
@@ -0,0 +1,274 @@
+"""
+Read/write routing between the primary and the read replicas of db.database.
+
+Only SELECTs issued inside a replica_read service method may go to a replica, and only
+when all of these hold; otherwise they use the primary:
+
+- the session hasn't written anything yet,
+- the client (the user the request acts for, see bind_client) hasn't committed a write
+  in the last DB_READ_YOUR_WRITES_SECONDS, in any worker,
+- a replica is healthy: the lag monitor saw it answer and within
+  DB_REPLICA_MAX_LAG_SECONDS of the primary.
+
+Lag comes from a heartbeat row (replica_heartbeat) that the monitor stamps on the primary
+every DB_REPLICA_CHECK_INTERVAL seconds and reads back from each replica. This works
+for any replication method, and an idle primary still reports a lag of zero.
+"""
+import asyncio
+import functools
+import inspect
+import itertools
+import os
+import time
+from contextvars import ContextVar
+from sqlalchemy import Column, Float, Integer, MetaData, Table, event, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import database
+from utils.logger_conf import logger
+from utils.metrics import DB_REPLICA_HEALTHY, DB_REPLICA_LAG, DB_ROUTED_READS
+from utils.redis_client import get_redis, get_async_redis
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", 2))
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 1))
+# Covers the worst lag a replica can have and still serve: the limit, one check interval
+# before the monitor notices it was exceeded, and one of heartbeat resolution
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", 5))
+
+log = logger.bind(service="database")
+
+replica_heartbeat = Table(
+    "replica_heartbeat", MetaData(),
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("beat_at", Float, nullable=False),
+)
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_client = ContextVar("db_client", default=None)
+_round_robin = itertools.count()
+_monitor_task = None
+
+
+class _Client:
+    # Shared by reference, so a write committed in the threadpool or a greenlet pins
+    # the rest of the request too
+    __slots__ = ("key", "sticky")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.sticky = None
+
+
+def _sticky_key(key: str):
+    return f"db_sticky:{key}"
+
+
+def bind_client(key: str):
+    """Who the current request reads and writes for; read-your-writes holds per client."""
+    if key:
+        _client.set(_Client(key))
+
+
+async def bind_client_async(key: str):
+    """
+    bind_client for requests on the event loop. Whether the client wrote recently is
+    looked up here, once, through the async client: AsyncSessions never look it up
+    themselves, and without this read from the primary.
+    """
+    bind_client(key)
+    if not key or not database.replicas:
+        return
+    client = _client.get()
+    try:
+        client.sticky = bool(await get_async_redis().exists(_sticky_key(key)))
+    except Exception as e:
+        log.error(f"Read-your-writes check failed, reading from the primary: {e}")
+        client.sticky = True
+
+
+def replica_read(fn):
+    """Let the SELECTs of a read-only service method go to a replica."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = _replica_reads.set(True)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _replica_reads.set(True)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    return wrapper
+
+
+def _is_sticky(lookup: bool = True):
+    client = _client.get()
+    if client is None:
+        return False
+    if client.sticky is None:
+        if not lookup:
+            # Not bound through bind_client_async; the primary is never wrong
+            return True
+        try:
+            client.sticky = bool(get_redis().exists(_sticky_key(client.key)))
+        except Exception as e:
+            # Unknown; the primary is never wrong
+            log.error(f"Read-your-writes check failed, reading from the primary: {e}")
+            client.sticky = True
+    return client.sticky
+
+
+def _mark_written():
+    client = _client.get()
+    if client is None or not database.replicas:
+        return
+    client.sticky = True
+    try:
+        get_redis().set(_sticky_key(client.key), 1, px=int(READ_YOUR_WRITES_SECONDS * 1000))
+    except Exception as e:
+        log.error(f"Failed to record a write for read-your-writes: {e}")
+
+
+async def _mark_written_async():
+    client = _client.get()
+    if client is None or not database.replicas:
+        return
+    client.sticky = True
+    try:
+        await get_async_redis().set(_sticky_key(client.key), 1, px=int(READ_YOUR_WRITES_SECONDS * 1000))
+    except Exception as e:
+        log.error(f"Failed to record a write for read-your-writes: {e}")
+
+
+def _pick_replica():
+    healthy = [replica for replica in database.replicas if replica.healthy]
+    if not healthy:
+        return None
+    return healthy[next(_round_robin) % len(healthy)]
+
+
+class RoutingSession(Session):
+    _async = False
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        primary = super().get_bind(mapper, clause=clause, **kw)
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.info["wrote"] = self.info["write_pending"] = True
+            return primary
+        if not database.replicas or not _replica_reads.get() or not getattr(clause, "is_select", False):
+            return primary
+        if self.info.get("wrote") or _is_sticky(lookup=not self._async):
+            DB_ROUTED_READS.inc("primary_sticky")
+            return primary
+        replica = _pick_replica()
+        if replica is None:
+            DB_ROUTED_READS.inc("primary_fallback")
+            return primary
+        DB_ROUTED_READS.inc(replica.name)
+        return replica.get_async_engine().sync_engine if self._async else replica.get_engine()
+
+
+class AsyncRoutingSession(RoutingSession):
+    # The sync session behind an AsyncSession: binds must be the async engines' sync_engine
+    _async = True
+
+
+class RoutingAsyncSession(AsyncSession):
+    """The AsyncSession around AsyncRoutingSession: records its writes without blocking the loop."""
+
+    async def commit(self):
+        await super().commit()
+        if self.sync_session.info.pop("write_pending", False):
+            await _mark_written_async()
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    # An AsyncRoutingSession's writes are recorded by RoutingAsyncSession.commit, on the loop
+    if not session._async and session.info.pop("write_pending", False):
+        _mark_written()
+
+
+def _record(replica, lag: float = None, error: Exception = None):
+    was_healthy = replica.healthy
+    replica.checked_at = time.time()
+    replica.lag_seconds = lag
+    replica.error = str(error) if error else None
+    replica.healthy = error is None and lag <= REPLICA_MAX_LAG_SECONDS
+    DB_REPLICA_HEALTHY.set(replica.name, value=int(replica.healthy))
+    if lag is not None:
+        DB_REPLICA_LAG.set(replica.name, value=round(lag, 3))
+    if was_healthy and not replica.healthy:
+        reason = f"unreachable: {error}" if error else f"{lag:.1f}s behind"
+        log.warning(f"Replica {replica.name} taken out of rotation, {reason}")
+    elif replica.healthy and not was_healthy:
+        log.info(f"Replica {replica.name} serving reads, {lag:.1f}s behind")
+
+
+async def check_replicas():
+    """One heartbeat round: stamp the primary, then see how old each replica's copy is."""
+    try:
+        async with database.get_async_engine().begin() as conn:
+            await conn.execute(update(replica_heartbeat).where(replica_heartbeat.c.id == 1).values(beat_at=time.time()))
+    except Exception as e:
+        log.error(f"Failed to write the replication heartbeat: {e}")
+
+    for replica in database.replicas:
+        try:
+            async with replica.get_async_engine().connect() as conn:
+                beat_at = (await conn.execute(select(replica_heartbeat.c.beat_at).where(replica_heartbeat.c.id == 1))).scalar()
+        except Exception as e:
+            _record(replica, error=e)
+            continue
+        # A replica that keeps up has the previous round's beat at worst
+        _record(replica, lag=max(0.0, time.time() - (beat_at or 0) - REPLICA_CHECK_INTERVAL))
+
+
+async def _monitor():
+    while True:
+        try:
+            await check_replicas()
+        except Exception as e:
+            log.error(f"Replica check failed: {e}")
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+
+def start_replica_monitor():
+    global _monitor_task
+    if not database.replicas or _monitor_task is not None:
+        return
+    worst_lag = REPLICA_MAX_LAG_SECONDS + 2 * REPLICA_CHECK_INTERVAL
+    if READ_YOUR_WRITES_SECONDS < worst_lag:
+        log.warning(
+            f"DB_READ_YOUR_WRITES_SECONDS={READ_YOUR_WRITES_SECONDS} is shorter than the lag a serving replica "
+            f"may have ({worst_lag}s): users may not see their own writes"
+        )
+    _monitor_task = asyncio.get_running_loop().create_task(_monitor())
+
+
+async def stop_replica_monitor():
+    global _monitor_task
+    if _monitor_task is None:
+        return
+    _monitor_task.cancel()
+    try:
+        await _monitor_task
+    except asyncio.CancelledError:
+        pass
+    _monitor_task = None
+
+
+def get_replica_stats():
+    return {
+        "replicas": [replica.as_dict() for replica in database.replicas],
+        "reads": {
+            target: DB_ROUTED_READS.value(target)
+            for target in ("primary_sticky", "primary_fallback", *(replica.name for replica in database.replicas))
+        },
+    }
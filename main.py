@@ -1,22 +1,74 @@
-from utils.logger_conf import setup_logging
+from utils.logger_conf import setup_logging, write_logs_through
 setup_logging()
 
 from api.chat_routes import router as chat_router
 from api.message_routes import router as message_router
 from utils.logger_conf import logger
 from fastapi import FastAPI
-from db.database import engine, Base, SessionLocal
+from db.database import get_engine, get_async_engine, replicas
+from db.routing import start_replica_monitor, stop_replica_monitor
+from db.migrations import check_schema
 from api.user_routes import router as user_router
+from api.internal_routes import router as internal_router
+from utils.user_logger import flush_user_logs
+from utils.password_hasher import hashing_executor
+from utils.chat_events import chat_event_hub
+from utils.metrics import MetricsMiddleware, instrument_engine
+from utils.query_profiler import QUERY_PROFILING, QueryProfilerMiddleware, profile_engine
 
 
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="FastAPI PostgreSQl To Do App")
 logger.info("Starting FastAPI application...") # Goes to system.log
 
+app.add_middleware(MetricsMiddleware)
+if QUERY_PROFILING:
+    # Dev only: logs repeated (N+1) and slow statements per request
+    app.add_middleware(QueryProfilerMiddleware)
+
 app.include_router(user_router, prefix="/users", tags=["Users"])
 app.include_router(chat_router, prefix="/chats", tags=["Chats"])
 app.include_router(message_router, prefix="/messages", tags=["Messages"])
+app.include_router(internal_router, prefix="/internal", tags=["Internal"], include_in_schema=False)
+
+@app.on_event("startup")
+def startup():
+    # Importing main connects to nothing; the schema itself is migrated beforehand
+    # (python -m db.migrations), so a worker only checks the version it finds.
+    engine, async_engine = get_engine(), get_async_engine()
+    engines = {"primary": engine, "primary_async": async_engine.sync_engine}
+    for replica in replicas:
+        engines[replica.name] = replica.get_engine()
+        engines[f"{replica.name}_async"] = replica.get_async_engine().sync_engine
+    for name, target in engines.items():
+        instrument_engine(target, name)
+        if QUERY_PROFILING:
+            profile_engine(target)
+    check_schema(engine)
+
+@app.on_event("startup")
+async def start_replica_checks():
+    # Replicas only take reads once the lag monitor has seen them keep up
+    start_replica_monitor()
+
+@app.on_event("shutdown")
+def shutdown():
+    # Don't lose buffered user actions on a graceful stop
+    flush_user_logs()
+    hashing_executor.shutdown()
+
+@app.on_event("shutdown")
+async def close_chat_events():
+    await chat_event_hub.close()
+
+@app.on_event("shutdown")
+async def stop_replica_checks():
+    await stop_replica_monitor()
+
+@app.on_event("shutdown")
+def flush_logs():
+    # Registered last. uvicorn ends a graceful stop by re-raising SIGTERM, which kills
+    # the process before the log writer's next batch; write the rest synchronously.
+    write_logs_through()
 
 @app.get("/")
 def root():
@@ -1,15 +1,29 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, String
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, String, Index, text
 from sqlalchemy.orm import relationship
 from db.database import Base
 
 class Chat(Base):
     __tablename__ = "chats"
+    __table_args__ = (
+        # keyset pagination of a user's chat list
+        Index("ix_chats_user_id_created_at_id", "user_id", "created_at", "id"),
+        # the few reopened archived chats, for services.message_archive
+        Index(
+            "ix_chats_rehydrated_at", "rehydrated_at",
+            postgresql_where=text("rehydrated_at IS NOT NULL"), sqlite_where=text("rehydrated_at IS NOT NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    # Indexed as the leading column of ix_chats_user_id_created_at_id
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User", back_populates="chats")
-    messages = relationship("Message", back_populates="chat")
+    messages = relationship("Message", back_populates="chat", order_by="(Message.created_at, Message.id)")
     requestType = Column(String, default="text", nullable=False, name="request_type")
 
-    created_at = Column(DateTime, default=datetime.now)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.now)
+    # Set while older messages of the chat sit in chat_archives; opening the chat brings them back
+    archived_at = Column(DateTime, nullable=True)
+    # Set when the archived messages were brought back, until the chat is archived again
+    rehydrated_at = Column(DateTime, nullable=True)
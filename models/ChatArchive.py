@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, LargeBinary
+from db.database import Base
+
+
+class ChatArchive(Base):
+    """The messages of a cold chat, moved out of messages by services.message_archive."""
+
+    __tablename__ = "chat_archives"
+
+    chat_id = Column(Integer, ForeignKey("chats.id"), primary_key=True, autoincrement=False)
+    # zlib-compressed JSON list of the message rows, oldest first
+    payload = Column(LargeBinary, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, nullable=False)
@@ -1,17 +1,34 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from db.database import Base
 
+# Full-text search (Postgres only). The generated content_tsv column and its GIN index
+# (chat_id, content_tsv) come from migration 0002 (db/migrations.py), which has this
+# configuration spelled out; content_tsv is left unmapped so loading messages never drags it along.
+SEARCH_CONFIG = "english"
+
 
 class Message(Base):
+    # On Postgres the table is partitioned by month on created_at (migration 0004), with the
+    # primary key (id, created_at) there. Partitions are created ahead of time and emptied by
+    # services.message_archive; id alone stays unique, it comes from one sequence.
     __tablename__ = "messages"
+    __table_args__ = (
+        # keyset pagination of a chat's history: WHERE chat_id = ? AND (created_at, id) > (?, ?)
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+        # Archived messages keep their ids: SQLite must not hand them out again
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String)
     request_metadata = Column(Text, nullable=True)
     file_path = Column(String, nullable=True)
+    # Indexed as the leading column of ix_messages_chat_id_created_at_id
     chat_id = Column(Integer, ForeignKey("chats.id"))
     chat = relationship("Chat", back_populates="messages")
 
-    created_at = Column(DateTime, default=datetime.now)
\ No newline at end of file
+    # The partition key: never NULL
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, BigInteger, String, DateTime, JSON, Index
+from db.database import Base
+
+
+class UserAction(Base):
+    __tablename__ = "user_actions"
+    __table_args__ = (
+        # history of one user, newest first: WHERE identifier = ? AND (created_at, id) < (?, ?)
+        Index("ix_user_actions_identifier_created_at_id", "identifier", "created_at", "id"),
+        # Monthly range partitions on Postgres, created by the action log worker
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    # Derived from the Redis stream entry id, so redelivered entries insert as no-ops.
+    # The partition key has to be part of the primary key.
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, primary_key=True)
+    identifier = Column(String(255), nullable=False)
+    action = Column(String(100), nullable=False)
+    details = Column(JSON, nullable=True)
+
+    def as_log(self):
+        # Same shape as the entries kept in Redis
+        return {"timestamp": self.created_at.isoformat(), "action": self.action, "details": self.details or {}}
@@ -0,0 +1,217 @@
+"""
+Production entry point: serves main:app from several uvicorn worker processes that
+share one listening socket.
+
+    python -m server                  # one worker per CPU the container may use
+    python -m server --workers 4
+    python -m server --plan           # print the per-worker budget and exit
+
+The web tier's share of the database and Redis connection limits (DB_CONNECTION_BUDGET,
+REDIS_CONNECTION_BUDGET) is divided between the workers, so all of their pools together
+never open more than that. The profile's pool sizes are only ever shrunk to fit. Password
+hashing threads are split over the CPUs the same way, and every worker logs to a file of
+its own (logs/app.<pid>.log).
+
+Signals to the parent process:
+  SIGTERM, SIGINT   stop accepting, let in-flight requests finish for up to
+                    GRACEFUL_TIMEOUT seconds, run the shutdown hooks, exit
+  SIGHUP            rolling reload: each worker is retired only once its replacement
+                    is serving, so the socket is never left unserved
+  SIGTTOU           retire one worker (SIGTTIN is refused: the budgets are split for
+                    a fixed count, restart with another WEB_WORKERS instead)
+"""
+import argparse
+import json
+import math
+import os
+
+import uvicorn
+from uvicorn.supervisors.multiprocess import Multiprocess
+
+from db.config import EngineConfig
+
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", 8000))
+# 0: one worker per CPU available to the container
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 0))
+# Connections the web tier as a whole may hold. Leave room below Postgres'
+# max_connections (100 by default) for the action-log worker, migrations and psql.
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", 80))
+REDIS_CONNECTION_BUDGET = int(os.getenv("REDIS_CONNECTION_BUDGET", 400))
+# Keep below the container's stop timeout (docker-compose stop_grace_period)
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 20))
+WORKER_HEALTHCHECK_TIMEOUT = int(os.getenv("WORKER_HEALTHCHECK_TIMEOUT", 10))
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# Each worker's Redis connections are split between the sync client (threadpool routes,
+# rate limiter, action log writer) and the async one (everything on the event loop:
+# caches, read-your-writes, chat events). The chat-events subscription holds one of the
+# async connections for good, so that pool never gets fewer than this.
+MIN_ASYNC_REDIS_CONNECTIONS = 2
+
+
+def cgroup_cpu_quota(root: str = CGROUP_ROOT):
+    """CPUs the cgroup's CFS quota allows, possibly fractional; None when unlimited."""
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>"
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    for controller in ("cpu", "cpu,cpuacct"):
+        # cgroup v1: a quota of -1 means unlimited
+        try:
+            with open(os.path.join(root, controller, "cpu.cfs_quota_us")) as f:
+                quota = int(f.read())
+            with open(os.path.join(root, controller, "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            continue
+        return None if quota <= 0 else quota / period
+    return None
+
+
+def available_cpus(root: str = CGROUP_ROOT):
+    """CPUs this process can actually run on: its affinity mask, capped by the cgroup quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_quota(root)
+    if quota is not None:
+        # Rounded down: a worker for a partial CPU would only be throttled
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return cpus
+
+
+class WorkerPlan:
+    """How the server-wide connection limits and the CPUs are split between `workers` processes."""
+
+    def __init__(
+        self,
+        workers: int,
+        cpus: int,
+        db_budget: int = DB_CONNECTION_BUDGET,
+        redis_budget: int = REDIS_CONNECTION_BUDGET,
+        engine_config: EngineConfig | None = None,
+    ):
+        if workers < 1:
+            raise ValueError("At least one worker is needed")
+        engine_config = engine_config or EngineConfig()
+
+        # Every worker has a sync and an async engine, each with a pool of its own
+        per_engine = db_budget // (workers * 2)
+        if per_engine < 1:
+            raise ValueError(f"DB_CONNECTION_BUDGET={db_budget} is too small for {workers} workers")
+        pool_size, max_overflow = engine_config.pool_size, engine_config.max_overflow
+        if pool_size + max_overflow > per_engine:
+            # Keep the profile's ratio of steady to burst connections
+            pool_size = max(1, per_engine * pool_size // (pool_size + max_overflow))
+            max_overflow = per_engine - pool_size
+
+        per_worker = redis_budget // workers
+        redis_async_max_connections = max(MIN_ASYNC_REDIS_CONNECTIONS, per_worker // 2)
+        redis_max_connections = per_worker - redis_async_max_connections
+        if redis_max_connections < 1:
+            raise ValueError(f"REDIS_CONNECTION_BUDGET={redis_budget} is too small for {workers} workers")
+
+        self.workers = workers
+        self.cpus = cpus
+        self.db_pool_size = pool_size
+        self.db_max_overflow = max_overflow
+        self.redis_max_connections = redis_max_connections
+        self.redis_async_max_connections = redis_async_max_connections
+        self.password_hash_workers = max(1, min(4, cpus // workers))
+
+    @property
+    def db_connections(self):
+        return self.workers * 2 * (self.db_pool_size + self.db_max_overflow)
+
+    @property
+    def redis_connections(self):
+        return self.workers * (self.redis_max_connections + self.redis_async_max_connections)
+
+    def environ(self):
+        """What each worker reads at import: db.config, utils.redis_client, utils.password_hasher, utils.logger_conf."""
+        env = {
+            "DB_POOL_SIZE": str(self.db_pool_size),
+            "DB_MAX_OVERFLOW": str(self.db_max_overflow),
+            "REDIS_MAX_CONNECTIONS": str(self.redis_max_connections),
+            "REDIS_ASYNC_MAX_CONNECTIONS": str(self.redis_async_max_connections),
+            "PASSWORD_HASH_WORKERS": str(self.password_hash_workers),
+        }
+        if self.workers > 1:
+            env["LOG_FILE"] = "logs/app.{pid}.log"
+        return env
+
+    def as_dict(self):
+        return {
+            "workers": self.workers,
+            "cpus": self.cpus,
+            "db_pool_size": self.db_pool_size,
+            "db_max_overflow": self.db_max_overflow,
+            "db_connections": self.db_connections,
+            "redis_max_connections": self.redis_max_connections,
+            "redis_async_max_connections": self.redis_async_max_connections,
+            "redis_connections": self.redis_connections,
+            "password_hash_workers": self.password_hash_workers,
+        }
+
+
+class Supervisor(Multiprocess):
+    # uvicorn's supervisor already replaces workers one at a time on SIGHUP and
+    # restarts the ones that die; only growing the pool would break the budgets
+
+    def handle_ttin(self):
+        from utils.logger_conf import logger
+
+        logger.bind(service="system").warning(
+            f"Ignoring SIGTTIN: connection budgets are split for {self.processes_num} workers, restart with WEB_WORKERS instead"
+        )
+
+
+def run(workers: int = WEB_WORKERS, host: str = WEB_HOST, port: int = WEB_PORT):
+    cpus = available_cpus()
+    plan = WorkerPlan(workers or cpus, cpus)
+    env = plan.environ()
+    # An explicit log file or hashing pool wins; the connection budgets always apply
+    for name in ("LOG_FILE", "PASSWORD_HASH_WORKERS"):
+        if name in os.environ:
+            env.pop(name, None)
+    # Workers are spawned, so they start from this environment
+    os.environ.update(env)
+
+    from utils.logger_conf import logger, setup_logging
+
+    setup_logging()
+    logger.bind(service="system").info(f"Starting {plan.workers} workers: {plan.as_dict()}")
+    config = uvicorn.Config(
+        "main:app",
+        host=host,
+        port=port,
+        workers=plan.workers,
+        # Workers route uvicorn's loggers through ours when they import main
+        log_config=None,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_worker_healthcheck=WORKER_HEALTHCHECK_TIMEOUT,
+    )
+    sock = config.bind_socket()
+    try:
+        Supervisor(config, sockets=[sock]).run()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="worker processes (default: CPUs available)")
+    parser.add_argument("--host", default=WEB_HOST)
+    parser.add_argument("--port", type=int, default=WEB_PORT)
+    parser.add_argument("--plan", action="store_true", help="print the per-worker budget and exit")
+    args = parser.parse_args()
+    if args.plan:
+        cpus = available_cpus()
+        print(json.dumps(WorkerPlan(args.workers or cpus, cpus).as_dict(), indent=2))
+    else:
+        run(args.workers, args.host, args.port)
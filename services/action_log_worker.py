@@ -0,0 +1,262 @@
+import json
+import os
+import signal
+import socket
+import time
+from datetime import date, datetime
+from sqlalchemy import insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError, InterfaceError, SQLAlchemyError
+from db.database import get_engine, get_session_factory
+from db.migrations import check_schema
+from models.UserAction import UserAction
+from utils.redis_client import get_redis
+from utils.user_logger import ACTION_LOG_STREAM
+from utils.logger_conf import logger
+
+ACTION_LOG_GROUP = os.getenv("ACTION_LOG_GROUP", "user_actions_writer")
+ACTION_LOG_CONSUMER = os.getenv("ACTION_LOG_CONSUMER", f"{socket.gethostname()}-{os.getpid()}")
+ACTION_LOG_WORKER_BATCH = int(os.getenv("ACTION_LOG_WORKER_BATCH", 500))
+ACTION_LOG_WORKER_BLOCK_MS = int(os.getenv("ACTION_LOG_WORKER_BLOCK_MS", 2000))
+# A batch failing with a non-transient database error this many times goes to the dead letter stream
+ACTION_LOG_MAX_RETRIES = int(os.getenv("ACTION_LOG_MAX_RETRIES", 5))
+ACTION_LOG_MAX_BACKOFF = float(os.getenv("ACTION_LOG_MAX_BACKOFF", 30))
+# Entries delivered to a consumer that has been silent this long are taken over
+ACTION_LOG_CLAIM_IDLE_MS = int(os.getenv("ACTION_LOG_CLAIM_IDLE_MS", 60_000))
+ACTION_LOG_STATS_INTERVAL = float(os.getenv("ACTION_LOG_STATS_INTERVAL", 30))
+ACTION_LOG_DEAD_LETTER_STREAM = f"{ACTION_LOG_STREAM}:dead"
+
+log = logger.bind(service="action_log_worker")
+
+
+def entry_id_to_int(entry_id: str):
+    # "<ms>-<seq>" -> one sortable BIGINT; the sequence never gets near 2**20 within a millisecond
+    ms, seq = entry_id.split("-")
+    return (int(ms) << 20) | int(seq)
+
+
+def entry_age_ms(entry_id: str):
+    return max(0, int(time.time() * 1000) - int(entry_id.split("-")[0]))
+
+
+def to_row(fields: dict, entry_id: str):
+    entry = json.loads(fields["entry"])
+    return {
+        "id": entry_id_to_int(entry_id),
+        "created_at": datetime.fromisoformat(entry["timestamp"]),
+        "identifier": fields["identifier"],
+        "action": entry["action"],
+        "details": entry.get("details") or {},
+    }
+
+
+def _next_month(year: int, month: int):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class ActionLogWorker:
+    """
+    Drains the action stream into user_actions as a member of a consumer group.
+
+    Entries are acked only after their batch is committed, so a crash or a failed
+    insert leaves them pending; this consumer re-reads its own pending entries before
+    asking for new ones, and takes over entries left pending by dead consumers. While
+    a batch keeps failing nothing new is read, so the backlog stays in the stream
+    (capped by ACTION_LOG_STREAM_MAXLEN) rather than in memory.
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        session_factory=None,
+        consumer: str = ACTION_LOG_CONSUMER,
+        batch_size: int = ACTION_LOG_WORKER_BATCH,
+        block_ms: int = ACTION_LOG_WORKER_BLOCK_MS,
+        max_retries: int = ACTION_LOG_MAX_RETRIES,
+    ):
+        self.redis = redis or get_redis()
+        self.session_factory = session_factory or get_session_factory()
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.max_retries = max_retries
+        self._partitions = set()
+        self._attempts = 0
+        self._running = False
+        self.stats = {
+            "processed": 0,
+            "batches": 0,
+            "retries": 0,
+            "dead_lettered": 0,
+            "claimed": 0,
+            "last_batch_ms": 0.0,
+            "lag_ms": 0,
+        }
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(ACTION_LOG_STREAM, ACTION_LOG_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def claim_stale(self):
+        reply = self.redis.xautoclaim(
+            ACTION_LOG_STREAM, ACTION_LOG_GROUP, self.consumer,
+            min_idle_time=ACTION_LOG_CLAIM_IDLE_MS, start_id="0-0", count=self.batch_size,
+        )
+        claimed = len(reply[1]) if reply else 0
+        if claimed:
+            self.stats["claimed"] += claimed
+            log.warning(f"Claimed {claimed} stale entries from {ACTION_LOG_STREAM}")
+        return claimed
+
+    def read_batch(self):
+        # Own pending entries first (failed or interrupted batches), then new ones
+        reply = self.redis.xreadgroup(ACTION_LOG_GROUP, self.consumer, {ACTION_LOG_STREAM: "0"}, count=self.batch_size)
+        if reply and reply[0][1]:
+            return reply[0][1]
+        reply = self.redis.xreadgroup(
+            ACTION_LOG_GROUP, self.consumer, {ACTION_LOG_STREAM: ">"}, count=self.batch_size, block=self.block_ms
+        )
+        return reply[0][1] if reply else []
+
+    def ensure_partitions(self, db, months):
+        """Create the missing partitions in db's transaction; returns the months to remember once it commits."""
+        if db.bind.dialect.name != "postgresql":
+            return set()
+        missing = set(months) - self._partitions
+        for year, month in sorted(missing):
+            next_year, next_month = _next_month(year, month)
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS user_actions_{year}_{month:02d} PARTITION OF user_actions "
+                f"FOR VALUES FROM ('{date(year, month, 1)}') TO ('{date(next_year, next_month, 1)}')"
+            ))
+        return missing
+
+    def insert(self, rows):
+        with self.session_factory() as db:
+            created = self.ensure_partitions(db, {(row["created_at"].year, row["created_at"].month) for row in rows})
+            dialect = db.bind.dialect.name
+            if dialect == "postgresql":
+                stmt = pg_insert(UserAction).on_conflict_do_nothing()
+            elif dialect == "sqlite":
+                stmt = sqlite_insert(UserAction).on_conflict_do_nothing()
+            else:
+                stmt = insert(UserAction)
+            # A list of parameter sets is sent as multi-row INSERT ... VALUES batches
+            db.execute(stmt, rows)
+            db.commit()
+        # A failed insert rolls the CREATE TABLEs back with it: remembered only now
+        self._partitions |= created
+
+    def dead_letter(self, entries, reason: str):
+        pipeline = self.redis.pipeline(transaction=False)
+        for entry_id, fields in entries:
+            pipeline.xadd(ACTION_LOG_DEAD_LETTER_STREAM, {**fields, "source_id": entry_id, "reason": reason[:500]})
+        pipeline.xack(ACTION_LOG_STREAM, ACTION_LOG_GROUP, *[entry_id for entry_id, _ in entries])
+        pipeline.execute()
+        self.stats["dead_lettered"] += len(entries)
+        log.error(f"Moved {len(entries)} entries to {ACTION_LOG_DEAD_LETTER_STREAM}: {reason}")
+
+    def process(self, entries):
+        """Persist one batch. Returns False if it has to be retried."""
+        started = time.perf_counter()
+        rows, malformed = [], []
+        for entry_id, fields in entries:
+            try:
+                rows.append(to_row(fields, entry_id))
+            except (KeyError, ValueError, TypeError):
+                malformed.append((entry_id, fields))
+        if malformed:
+            self.dead_letter(malformed, "malformed entry")
+
+        malformed_ids = {entry_id for entry_id, _ in malformed}
+        good = [(entry_id, fields) for entry_id, fields in entries if entry_id not in malformed_ids]
+        if rows:
+            try:
+                self.insert(rows)
+            except (OperationalError, InterfaceError) as e:
+                # Database unreachable: keep the batch pending and retry without limit
+                self._attempts += 1
+                self.stats["retries"] += 1
+                log.warning(f"Database unavailable, retrying batch of {len(rows)} (attempt {self._attempts}): {e}")
+                return False
+            except SQLAlchemyError as e:
+                self._attempts += 1
+                self.stats["retries"] += 1
+                if self._attempts < self.max_retries:
+                    log.warning(f"Insert of {len(rows)} actions failed (attempt {self._attempts}): {e}")
+                    return False
+                self.dead_letter(good, str(e))
+                self._attempts = 0
+                return True
+            self.redis.xack(ACTION_LOG_STREAM, ACTION_LOG_GROUP, *[entry_id for entry_id, _ in good])
+
+        self._attempts = 0
+        self.stats["processed"] += len(rows)
+        self.stats["batches"] += 1
+        self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        self.stats["lag_ms"] = entry_age_ms(entries[-1][0])
+        return True
+
+    def backoff(self):
+        return min(ACTION_LOG_MAX_BACKOFF, 0.5 * 2 ** (self._attempts - 1))
+
+    def run_once(self):
+        entries = self.read_batch()
+        if not entries:
+            self.stats["lag_ms"] = 0
+            return True
+        return self.process(entries)
+
+    def run(self):
+        self.ensure_group()
+        self._running = True
+        last_claim = last_stats = 0.0
+        log.info(f"Consuming {ACTION_LOG_STREAM} as {ACTION_LOG_GROUP}/{self.consumer}")
+        while self._running:
+            now = time.monotonic()
+            if now - last_claim >= ACTION_LOG_CLAIM_IDLE_MS / 1000:
+                self.claim_stale()
+                last_claim = now
+            if now - last_stats >= ACTION_LOG_STATS_INTERVAL:
+                log.info(f"Action log worker stats | {json.dumps({**self.stats, **get_stream_stats(self.redis)})}")
+                last_stats = now
+            try:
+                if not self.run_once():
+                    time.sleep(self.backoff())
+            except Exception as e:
+                # Redis hiccups: back off and carry on, pending entries are re-read
+                self._attempts += 1
+                log.error(f"Action log worker error: {e}")
+                time.sleep(self.backoff())
+
+    def stop(self):
+        self._running = False
+
+
+def get_stream_stats(redis=None):
+    """Stream length plus pending/lag of the consumer group, read from Redis."""
+    redis = redis or get_redis()
+    try:
+        stats = {"stream_length": redis.xlen(ACTION_LOG_STREAM), "dead_letter_length": redis.xlen(ACTION_LOG_DEAD_LETTER_STREAM)}
+        for group in redis.xinfo_groups(ACTION_LOG_STREAM):
+            if group["name"] == ACTION_LOG_GROUP:
+                stats.update(pending=group["pending"], lag=group.get("lag"), consumers=group["consumers"])
+        return stats
+    except Exception as e:
+        return {"error": str(e)}
+
+
+if __name__ == "__main__":
+    from utils.logger_conf import setup_logging
+
+    setup_logging()
+    check_schema(get_engine())
+    worker = ActionLogWorker()
+    # Finish the batch in hand on docker stop / Ctrl+C; anything unacked stays pending
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
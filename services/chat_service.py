@@ -1,5 +1,29 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.Chat import Chat
+from db.routing import replica_read
+from services.message_archive import history_bound, rehydrate_if_archived, rehydrate_if_archived_async
+from utils.pagination import keyset, build_page, DEFAULT_PAGE_SIZE
+
+
+def _chat_with_messages(db: Session, chat_id: int):
+    # One LEFT OUTER JOIN instead of get_chat + a lazy load of chat.messages.
+    # Message.chat then resolves from the identity map without another query.
+    # Bounded by the chat's age, the join only visits the partitions since its creation.
+    return (
+        db.query(Chat)
+        .options(joinedload(Chat.messages.and_(history_bound(db.bind.dialect.name, Chat.created_at))))
+        .filter(Chat.id == chat_id)
+    )
+
+
+def _chat_with_messages_statement(db: AsyncSession, chat_id: int):
+    # Same single joined query as _chat_with_messages
+    return select(Chat).where(Chat.id == chat_id).options(
+        joinedload(Chat.messages.and_(history_bound(db.bind.dialect.name, Chat.created_at)))
+    )
+
 
 class ChatService:
     @staticmethod
@@ -15,12 +39,71 @@ class ChatService:
         return new_chat
 
     @staticmethod
-    def get_user_chats(db: Session, user_id: int):
-        return db.query(Chat).filter(Chat.user_id == user_id).all()
+    def get_existing_chat_ids(db: Session, chat_ids):
+        return set(db.execute(select(Chat.id).where(Chat.id.in_(set(chat_ids)))).scalars())
+
+    @staticmethod
+    @replica_read
+    def get_user_chats(db: Session, user_id: int, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        # Most recent chats first
+        query = keyset(db.query(Chat).filter(Chat.user_id == user_id), Chat, after, limit, descending=True)
+        return build_page(query.all(), limit)
 
     @staticmethod
     def get_chat_details(db: Session, chat_id: int):
-        chat = ChatService.get_chat(db, chat_id)
+        chat = ChatService._get_chat_with_messages(db, chat_id)
+        if chat is not None and chat.archived_at is not None:
+            # Archived as far as that read knows: decided on the primary, then read from there
+            rehydrate_if_archived(db, chat_id)
+            chat = _chat_with_messages(db, chat_id).populate_existing().one_or_none()
+        if not chat:
+            return None
+        return {
+            "chat_id": chat.id,
+            "type": chat.requestType,
+            "messages": chat.messages
+        }
+
+    @staticmethod
+    @replica_read
+    def _get_chat_with_messages(db: Session, chat_id: int):
+        return _chat_with_messages(db, chat_id).one_or_none()
+
+
+class AsyncChatService:
+    @staticmethod
+    async def get_chat(db: AsyncSession, chat_id: int):
+        result = await db.execute(select(Chat).where(Chat.id == chat_id))
+        return result.scalars().first()
+
+    @staticmethod
+    async def create_chat(db: AsyncSession, user_id: int, request_type: str = "text"):
+        new_chat = Chat(user_id=user_id, requestType=request_type)
+        db.add(new_chat)
+        await db.commit()
+        await db.refresh(new_chat)
+        return new_chat
+
+    @staticmethod
+    async def get_existing_chat_ids(db: AsyncSession, chat_ids):
+        result = await db.execute(select(Chat.id).where(Chat.id.in_(set(chat_ids))))
+        return set(result.scalars())
+
+    @staticmethod
+    @replica_read
+    async def get_user_chats(db: AsyncSession, user_id: int, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        # Most recent chats first
+        stmt = keyset(select(Chat).where(Chat.user_id == user_id), Chat, after, limit, descending=True)
+        result = await db.execute(stmt)
+        return build_page(result.scalars().all(), limit)
+
+    @staticmethod
+    async def get_chat_details(db: AsyncSession, chat_id: int):
+        chat = await AsyncChatService._get_chat_with_messages(db, chat_id)
+        if chat is not None and chat.archived_at is not None:
+            await rehydrate_if_archived_async(db, chat_id)
+            stmt = _chat_with_messages_statement(db, chat_id).execution_options(populate_existing=True)
+            chat = (await db.execute(stmt)).unique().scalars().one_or_none()
         if not chat:
             return None
         return {
@@ -28,3 +111,8 @@ class ChatService:
             "type": chat.requestType,
             "messages": chat.messages
         }
+
+    @staticmethod
+    @replica_read
+    async def _get_chat_with_messages(db: AsyncSession, chat_id: int):
+        return (await db.execute(_chat_with_messages_statement(db, chat_id))).unique().scalars().one_or_none()
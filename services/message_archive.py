@@ -0,0 +1,330 @@
+"""
+Keeps the messages table to recent history: creates its monthly partitions ahead of time
+(Postgres) and moves cold chats into compressed storage. Runs as a process of its own:
+
+    python -m services.message_archive           # a round every MESSAGE_MAINTENANCE_INTERVAL seconds
+    python -m services.message_archive --once    # one round, e.g. from cron
+    python -m services.message_archive --once --backfill    # one round over all of history
+
+A round
+- creates the partitions of this month and the next MESSAGE_PARTITIONS_AHEAD months, so
+  inserts never wait on DDL and never fall through to messages_default,
+- archives every chat without a message in CHAT_ARCHIVE_AFTER_DAYS: its messages become
+  one zlib-compressed row of chat_archives and chats.archived_at is set,
+- drops the partitions archival has emptied.
+
+A round only looks for chats whose last message went past the cutoff in the last
+CHAT_ARCHIVE_LOOKBACK_DAYS, and for reopened chats (chats.rehydrated_at): it scans the
+partitions of that window, not all of history. A --backfill round finds the rest: chats
+that went cold before archival was deployed, or while no round ran for longer than that.
+
+Each chat is archived in a transaction of its own, so a round can be stopped anywhere.
+Every read of a chat's history (details, pages, export, the realtime backlog) first
+calls rehydrate_if_archived, which puts an archived chat's messages back the first time
+the chat is opened again; they land in their month's partition, or in messages_default
+once that month has been dropped.
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import threading
+import zlib
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, exists, insert, select, text, true, update
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_engine, get_session_factory
+from db.migrations import check_schema
+from models.Chat import Chat
+from models.ChatArchive import ChatArchive
+from models.Message import Message
+from utils.chat_cache import invalidate_chat, invalidate_chat_async
+from utils.logger_conf import logger
+
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", 3))
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", 180))
+# Many rounds long, so a few failed or skipped rounds don't leave chats behind
+CHAT_ARCHIVE_LOOKBACK_DAYS = int(os.getenv("CHAT_ARCHIVE_LOOKBACK_DAYS", 7))
+CHAT_ARCHIVE_BATCH = int(os.getenv("CHAT_ARCHIVE_BATCH", 100))
+MESSAGE_MAINTENANCE_INTERVAL = float(os.getenv("MESSAGE_MAINTENANCE_INTERVAL", 3600))
+# Dropping a partition briefly locks all of messages: give up rather than queue traffic behind it
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "2s")
+# Chats and their messages are stamped by the clocks of different app hosts
+CLOCK_SKEW_MARGIN = timedelta(hours=1)
+
+log = logger.bind(service="message_archive")
+
+_RANGE = re.compile(r"FROM \((?:'([^']+)'|MINVALUE)\) TO \((?:'([^']+)'|MAXVALUE)\)")
+
+
+def history_bound(dialect: str, chat_created_at):
+    """
+    messages.created_at >= the chat's created_at. Implied by every chat's history, but on
+    Postgres it is what lets the planner skip the partitions from before the chat existed.
+    """
+    if dialect != "postgresql":
+        return true()
+    return Message.created_at >= chat_created_at - CLOCK_SKEW_MARGIN
+
+
+def pack(rows):
+    history = [
+        {
+            "id": row["id"],
+            "content": row["content"],
+            "request_metadata": row["request_metadata"],
+            "file_path": row["file_path"],
+            "created_at": row["created_at"].isoformat(),
+        }
+        for row in rows
+    ]
+    return zlib.compress(json.dumps(history, separators=(",", ":")).encode())
+
+
+def unpack(payload: bytes):
+    rows = json.loads(zlib.decompress(payload))
+    for row in rows:
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return rows
+
+
+def _month_after(day):
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+def list_partitions(db: Session):
+    """(name, from, to) of the range partitions of messages, oldest first; None for MINVALUE/MAXVALUE."""
+    rows = db.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'messages'::regclass"
+    ))
+    partitions = []
+    for name, bound in rows:
+        match = _RANGE.search(bound)
+        if match:
+            lower, upper = (datetime.fromisoformat(value) if value else None for value in match.groups())
+            partitions.append((name, lower, upper))
+    return sorted(partitions, key=lambda partition: partition[1] or datetime.min)
+
+
+def ensure_partitions(db: Session, today: date = None, ahead: int = MESSAGE_PARTITIONS_AHEAD):
+    """Create the monthly partitions from this month to `ahead` months on that no partition covers yet."""
+    if db.bind.dialect.name != "postgresql":
+        return []
+    existing = list_partitions(db)
+    created = []
+    start = (today or date.today()).replace(day=1)
+    for _ in range(ahead + 1):
+        end = _month_after(start)
+        lower, upper = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+        if not any((low is None or low < upper) and (high is None or high > lower) for _, low, high in existing):
+            name = f"messages_{start:%Y_%m}"
+            try:
+                db.execute(text(f"CREATE TABLE {name} PARTITION OF messages FOR VALUES FROM ('{start}') TO ('{end}')"))
+                db.commit()
+                created.append(name)
+            except Exception as e:
+                # e.g. messages_default already holds rows of that month
+                db.rollback()
+                log.error(f"Failed to create partition {name}: {e}")
+        start = end
+    return created
+
+
+def drop_empty_partitions(db: Session, before: datetime):
+    """Drop the partitions that end by `before` and hold no rows."""
+    if db.bind.dialect.name != "postgresql":
+        return []
+    dropped = []
+    for name, _, upper in list_partitions(db):
+        if upper is None or upper > before:
+            continue
+        try:
+            db.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+            # Parent first, like inserts: nothing can land in the partition between the check and the drop
+            db.execute(text(f"LOCK TABLE ONLY messages, {name} IN ACCESS EXCLUSIVE MODE"))
+            if db.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+                db.rollback()
+                continue
+            db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+            dropped.append(name)
+        except Exception as e:
+            db.rollback()
+            log.warning(f"Failed to drop partition {name}, retrying next round: {e}")
+    return dropped
+
+
+def cold_chat_ids(db: Session, cutoff: datetime, since: datetime = None, limit: int = CHAT_ARCHIVE_BATCH):
+    """
+    Chats with messages from before `cutoff` and none since: those with a message from
+    `since` on, plus reopened chats. Without `since`, all of history is scanned.
+    """
+    newer = aliased(Message)
+    idle = ~exists().where(newer.chat_id == Message.chat_id, newer.created_at >= cutoff)
+    stmt = select(Message.chat_id).where(Message.created_at < cutoff, Message.chat_id.isnot(None), idle)
+    if since is not None:
+        stmt = stmt.where(Message.created_at >= since)
+    chat_ids = db.execute(stmt.distinct().limit(limit)).scalars().all()
+    if len(chat_ids) < limit:
+        # Their restored messages may all predate `since`
+        reopened = (
+            select(Chat.id)
+            .where(Chat.rehydrated_at < cutoff)
+            .where(~exists().where(newer.chat_id == Chat.id, newer.created_at >= cutoff))
+            .limit(limit - len(chat_ids))
+        )
+        chat_ids += [chat_id for chat_id in db.execute(reopened).scalars() if chat_id not in chat_ids]
+    return chat_ids
+
+
+def archive_chat(db: Session, chat_id: int, cutoff: datetime):
+    """Move the messages of `chat_id` from before `cutoff` into its archive; returns how many."""
+    # Locked first: a rehydrate_chat of this chat waits for the commit, then restores all of it
+    archive = db.get(ChatArchive, chat_id, with_for_update=True)
+    rows = db.execute(
+        select(Message.id, Message.content, Message.request_metadata, Message.file_path, Message.created_at)
+        .where(Message.chat_id == chat_id, Message.created_at < cutoff)
+        .order_by(Message.created_at, Message.id)
+    ).mappings().all()
+    if not rows:
+        # Nothing left to archive, e.g. a reopened chat whose messages were all deleted
+        db.execute(update(Chat).where(Chat.id == chat_id).values(rehydrated_at=None).execution_options(synchronize_session=False))
+        db.commit()
+        return 0
+    # New messages in a chat that is still archived: the earlier archive predates them all
+    history = (unpack(archive.payload) if archive else []) + list(rows)
+    now = datetime.now()
+    if archive is None:
+        archive = ChatArchive(chat_id=chat_id)
+        db.add(archive)
+    archive.payload = pack(history)
+    archive.message_count = len(history)
+    archive.archived_at = now
+    db.execute(
+        delete(Message).where(Message.chat_id == chat_id, Message.created_at < cutoff).execution_options(synchronize_session=False)
+    )
+    db.execute(
+        update(Chat).where(Chat.id == chat_id).values(archived_at=now, rehydrated_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    invalidate_chat(chat_id)
+    return len(rows)
+
+
+def archive_cold_chats(db: Session, cutoff: datetime, since: datetime = None, batch_size: int = CHAT_ARCHIVE_BATCH):
+    """Archive every chat that has been inactive since `cutoff`; returns (chats, messages)."""
+    chats = messages = 0
+    done = set()
+    while True:
+        chat_ids = [chat_id for chat_id in cold_chat_ids(db, cutoff, since, batch_size) if chat_id not in done]
+        db.rollback()
+        if not chat_ids:
+            return chats, messages
+        for chat_id in chat_ids:
+            done.add(chat_id)
+            try:
+                archived = archive_chat(db, chat_id, cutoff)
+            except Exception as e:
+                db.rollback()
+                log.error(f"Failed to archive chat {chat_id}: {e}")
+                continue
+            if archived:
+                messages += archived
+                chats += 1
+
+
+def rehydrate_chat(db: Session, chat_id: int):
+    """Put the archived messages of `chat_id` back into messages; returns how many."""
+    # DELETE ... RETURNING: of two concurrent openers one gets the archive, the other
+    # waits for its commit and then reads the restored rows
+    payload = db.execute(
+        delete(ChatArchive).where(ChatArchive.chat_id == chat_id).returning(ChatArchive.payload)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    rows = unpack(payload) if payload is not None else []
+    if rows:
+        db.execute(insert(Message), [dict(row, chat_id=chat_id) for row in rows])
+    db.execute(update(Chat).where(Chat.id == chat_id).values(archived_at=None, rehydrated_at=datetime.now()))
+    db.commit()
+    invalidate_chat(chat_id)
+    log.info(f"Rehydrated {len(rows)} archived messages of chat {chat_id}")
+    return len(rows)
+
+
+def rehydrate_if_archived(db: Session, chat_id: int):
+    """
+    Restore the chat's archived messages, if any; call before reading its history.
+    Call it outside replica_read: a replica may not have seen the chat archived or restored.
+    """
+    if db.execute(select(Chat.archived_at).where(Chat.id == chat_id)).scalar() is None:
+        return 0
+    return rehydrate_chat(db, chat_id)
+
+
+async def rehydrate_if_archived_async(db: AsyncSession, chat_id: int):
+    if (await db.execute(select(Chat.archived_at).where(Chat.id == chat_id))).scalar() is None:
+        return 0
+    return await rehydrate_chat_async(db, chat_id)
+
+
+async def rehydrate_chat_async(db: AsyncSession, chat_id: int):
+    result = await db.execute(
+        delete(ChatArchive).where(ChatArchive.chat_id == chat_id).returning(ChatArchive.payload)
+        .execution_options(synchronize_session=False)
+    )
+    payload = result.scalar()
+    rows = unpack(payload) if payload is not None else []
+    if rows:
+        await db.execute(insert(Message), [dict(row, chat_id=chat_id) for row in rows])
+    await db.execute(update(Chat).where(Chat.id == chat_id).values(archived_at=None, rehydrated_at=datetime.now()))
+    await db.commit()
+    await invalidate_chat_async(chat_id)
+    log.info(f"Rehydrated {len(rows)} archived messages of chat {chat_id}")
+    return len(rows)
+
+
+def run_once(session_factory=None, now: datetime = None, backfill: bool = False):
+    """One maintenance round; returns what it did."""
+    session_factory = session_factory or get_session_factory()
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=CHAT_ARCHIVE_AFTER_DAYS)
+    since = None if backfill else cutoff - timedelta(days=CHAT_ARCHIVE_LOOKBACK_DAYS)
+    with session_factory() as db:
+        created = ensure_partitions(db, now.date())
+        chats, messages = archive_cold_chats(db, cutoff, since)
+        dropped = drop_empty_partitions(db, cutoff)
+    return {
+        "partitions_created": created,
+        "chats_archived": chats,
+        "messages_archived": messages,
+        "partitions_dropped": dropped,
+    }
+
+
+if __name__ == "__main__":
+    import models.User  # noqa: F401  (resolve relationships)
+    from utils.logger_conf import setup_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run one round and exit")
+    parser.add_argument("--backfill", action="store_true", help="look for cold chats in all of history, not just the lookback window")
+    args = parser.parse_args()
+    setup_logging()
+    check_schema(get_engine())
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    backfill = args.backfill
+    while True:
+        try:
+            log.info(f"Message maintenance round | {json.dumps(run_once(backfill=backfill))}")
+            # Later rounds only need the lookback window
+            backfill = False
+        except Exception as e:
+            log.error(f"Message maintenance round failed: {e}")
+        if args.once or stopping.wait(MESSAGE_MAINTENANCE_INTERVAL):
+            break
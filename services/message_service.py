@@ -1,5 +1,82 @@
+from datetime import datetime
+from sqlalchemy import select, insert, func, literal, literal_column, tuple_, Float
 from sqlalchemy.orm import Session
-from models.Message import Message
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.Chat import Chat
+from models.Message import Message, SEARCH_CONFIG
+from db.routing import replica_read
+from services.message_archive import history_bound, rehydrate_if_archived, rehydrate_if_archived_async
+from utils.pagination import keyset, build_page, encode_rank_cursor, DEFAULT_PAGE_SIZE
+from utils.chat_cache import invalidate_chat, invalidate_chat_async
+from utils.chat_events import publish_message_events, publish_message_events_async
+
+
+def _history_bound(db, chat_id: int):
+    # The chat's created_at as an InitPlan: Postgres prunes the partitions before it at execution
+    return history_bound(db.bind.dialect.name, select(Chat.created_at).where(Chat.id == chat_id).scalar_subquery())
+
+
+def _bulk_insert(messages: list):
+    # One timestamp for the batch, so (created_at, id) keeps the input order.
+    # Executed with a list of rows this becomes multi-row INSERT ... VALUES ... RETURNING
+    # statements, and sort_by_parameter_order maps the ids back to the input order.
+    now = datetime.now()
+    rows = [
+        {
+            "chat_id": message["chat_id"],
+            "content": message["content"],
+            "request_metadata": message.get("request_metadata"),
+            "file_path": message.get("file_path"),
+            "created_at": now,
+        }
+        for message in messages
+    ]
+    return insert(Message).returning(Message.id, sort_by_parameter_order=True), rows
+
+
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+
+
+def _search_statement(dialect: str, user_id: int, q: str, after=None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    One page (plus a row) of the messages in `user_id`'s chats that match `q`, best first,
+    continuing after `after` = (rank, id).
+
+    On Postgres `q` is parsed as web-search syntax and matched through the
+    (chat_id, content_tsv) GIN index, so only the user's matching rows are ranked;
+    ts_headline, which re-parses the text, runs on the page's rows only. Elsewhere
+    (SQLite in tests and dev) it is a substring match and every rank is 0.
+    """
+    user_chats = select(Chat.id).where(Chat.user_id == user_id)
+    if dialect == "postgresql":
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        tsv = literal_column("messages.content_tsv")
+        rank = func.ts_rank_cd(tsv, query, type_=Float)
+        matches = tsv.op("@@")(query)
+        highlight = func.ts_headline(SEARCH_CONFIG, Message.content, query, SEARCH_HEADLINE_OPTIONS)
+    else:
+        rank = literal(0.0, Float)
+        matches = Message.content.contains(q, autoescape=True)
+        highlight = Message.content
+
+    page = select(Message.id, rank.label("rank")).where(Message.chat_id.in_(user_chats), matches)
+    if after is not None:
+        page = page.where(tuple_(rank, Message.id) < after)
+    page = page.order_by(rank.desc(), Message.id.desc()).limit(limit + 1).subquery()
+    return (
+        select(Message.id, Message.chat_id, Message.created_at, page.c.rank, highlight.label("highlight"))
+        .join(page, page.c.id == Message.id)
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    )
+
+
+def _search_page(rows, limit: int):
+    rows = [dict(row) for row in rows]
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    next_cursor = encode_rank_cursor(items[-1]["rank"], items[-1]["id"]) if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
+
 
 class MessageService:
     @staticmethod
@@ -7,8 +84,21 @@ class MessageService:
         return db.query(Message).filter(Message.id == message_id).first()
 
     @staticmethod
-    def get_messages_by_chat(db: Session, chat_id: int):
-        return db.query(Message).filter(Message.chat_id == chat_id).all()
+    def get_messages_by_chat(db: Session, chat_id: int, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        rehydrate_if_archived(db, chat_id)
+        return MessageService._get_messages_by_chat(db, chat_id, after, limit)
+
+    @staticmethod
+    @replica_read
+    def _get_messages_by_chat(db: Session, chat_id: int, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        query = keyset(db.query(Message).filter(Message.chat_id == chat_id, _history_bound(db, chat_id)), Message, after, limit)
+        return build_page(query.all(), limit)
+
+    @staticmethod
+    @replica_read
+    def search_messages(db: Session, user_id: int, q: str, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        stmt = _search_statement(db.bind.dialect.name, user_id, q, after, limit)
+        return _search_page(db.execute(stmt).mappings().all(), limit)
 
     @staticmethod
     def create_message(db: Session, chat_id: int, content: str, request_metadata: str = None, file_path: str = None):
@@ -21,8 +111,24 @@ class MessageService:
         db.add(new_msg)
         db.commit()
         db.refresh(new_msg)
+        invalidate_chat(chat_id)
+        publish_message_events("message.created", [new_msg])
         return new_msg
 
+    @staticmethod
+    def create_messages(db: Session, messages: list):
+        """
+        Insert many messages in one transaction and return their ids in input order.
+        `messages` are dicts with chat_id, content and optionally request_metadata/file_path.
+        """
+        stmt, rows = _bulk_insert(messages)
+        ids = db.execute(stmt, rows).scalars().all()
+        db.commit()
+        for chat_id in {row["chat_id"] for row in rows}:
+            invalidate_chat(chat_id)
+        publish_message_events("message.created", [dict(row, id=id) for row, id in zip(rows, ids)])
+        return ids
+
     @staticmethod
     def update_message(db: Session, message_id: int, content: str = None, request_metadata: str = None):
         msg = db.query(Message).filter(Message.id == message_id).first()
@@ -33,6 +139,8 @@ class MessageService:
                 msg.request_metadata = request_metadata
             db.commit()
             db.refresh(msg)
+            invalidate_chat(msg.chat_id)
+            publish_message_events("message.updated", [msg])
             return msg
         return None
 
@@ -40,7 +148,118 @@ class MessageService:
     def delete_message(db: Session, message_id: int):
         msg = db.query(Message).filter(Message.id == message_id).first()
         if msg:
+            chat_id = msg.chat_id
             db.delete(msg)
             db.commit()
+            invalidate_chat(chat_id)
+            publish_message_events("message.deleted", [{"id": message_id, "chat_id": chat_id}])
+            return True
+        return False
+
+
+class AsyncMessageService:
+    @staticmethod
+    async def get_message(db: AsyncSession, message_id: int):
+        result = await db.execute(select(Message).where(Message.id == message_id))
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_user_message(db: AsyncSession, message_id: int, user_id: int):
+        """The message, if it is in one of the user's chats."""
+        stmt = select(Message).join(Chat, Message.chat_id == Chat.id).where(Message.id == message_id, Chat.user_id == user_id)
+        result = await db.execute(stmt)
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_messages_by_chat(db: AsyncSession, chat_id: int, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        await rehydrate_if_archived_async(db, chat_id)
+        return await AsyncMessageService._get_messages_by_chat(db, chat_id, after, limit)
+
+    @staticmethod
+    @replica_read
+    async def _get_messages_by_chat(db: AsyncSession, chat_id: int, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        stmt = keyset(select(Message).where(Message.chat_id == chat_id, _history_bound(db, chat_id)), Message, after, limit)
+        result = await db.execute(stmt)
+        return build_page(result.scalars().all(), limit)
+
+    @staticmethod
+    @replica_read
+    async def search_messages(db: AsyncSession, user_id: int, q: str, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        stmt = _search_statement(db.bind.dialect.name, user_id, q, after, limit)
+        result = await db.execute(stmt)
+        return _search_page(result.mappings().all(), limit)
+
+    @staticmethod
+    async def get_messages_after(db: AsyncSession, chat_id: int, last_id: int, limit: int):
+        # Messages a reconnecting subscriber missed, oldest first
+        await rehydrate_if_archived_async(db, chat_id)
+        stmt = select(Message).where(Message.chat_id == chat_id, Message.id > last_id).order_by(Message.id).limit(limit)
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+    @staticmethod
+    async def prepare_export(db: AsyncSession, chat_id: int):
+        """Call before streaming export_statement: an archived chat's history is restored first."""
+        await rehydrate_if_archived_async(db, chat_id)
+
+    @staticmethod
+    def export_statement(chat_id: int):
+        # Plain columns in history order, for utils.ndjson streaming
+        return (
+            select(Message.id, Message.chat_id, Message.content, Message.request_metadata, Message.file_path, Message.created_at)
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.created_at, Message.id)
+        )
+
+    @staticmethod
+    async def create_message(db: AsyncSession, chat_id: int, content: str, request_metadata: str = None, file_path: str = None):
+        new_msg = Message(
+            chat_id=chat_id,
+            content=content,
+            request_metadata=request_metadata,
+            file_path=file_path
+        )
+        db.add(new_msg)
+        await db.commit()
+        await db.refresh(new_msg)
+        await invalidate_chat_async(chat_id)
+        await publish_message_events_async("message.created", [new_msg])
+        return new_msg
+
+    @staticmethod
+    async def create_messages(db: AsyncSession, messages: list):
+        stmt, rows = _bulk_insert(messages)
+        result = await db.execute(stmt, rows)
+        ids = result.scalars().all()
+        await db.commit()
+        for chat_id in {row["chat_id"] for row in rows}:
+            await invalidate_chat_async(chat_id)
+        await publish_message_events_async("message.created", [dict(row, id=id) for row, id in zip(rows, ids)])
+        return ids
+
+    @staticmethod
+    async def update_message(db: AsyncSession, message_id: int, content: str = None, request_metadata: str = None):
+        msg = await AsyncMessageService.get_message(db, message_id)
+        if msg:
+            if content:
+                msg.content = content
+            if request_metadata:
+                msg.request_metadata = request_metadata
+            await db.commit()
+            await db.refresh(msg)
+            await invalidate_chat_async(msg.chat_id)
+            await publish_message_events_async("message.updated", [msg])
+            return msg
+        return None
+
+    @staticmethod
+    async def delete_message(db: AsyncSession, message_id: int):
+        msg = await AsyncMessageService.get_message(db, message_id)
+        if msg:
+            chat_id = msg.chat_id
+            await db.delete(msg)
+            await db.commit()
+            await invalidate_chat_async(chat_id)
+            await publish_message_events_async("message.deleted", [{"id": message_id, "chat_id": chat_id}])
             return True
         return False
@@ -0,0 +1,21 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.UserAction import UserAction
+from utils.pagination import keyset, DEFAULT_PAGE_SIZE
+
+
+class UserActionService:
+    @staticmethod
+    def get_history(db: Session, identifier: str, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        """Persisted actions older than `after`, newest first; up to limit + 1 rows."""
+        query = keyset(db.query(UserAction).filter(UserAction.identifier == identifier), UserAction, after, limit, descending=True)
+        return query.all()
+
+
+class AsyncUserActionService:
+    @staticmethod
+    async def get_history(db: AsyncSession, identifier: str, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        stmt = keyset(select(UserAction).where(UserAction.identifier == identifier), UserAction, after, limit, descending=True)
+        result = await db.execute(stmt)
+        return result.scalars().all()
@@ -1,15 +1,19 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.User import User
+from db.routing import replica_read
 from datetime import datetime, timedelta, timezone
 import jwt
-from pwdlib import PasswordHash
+from utils.identity_cache import invalidate_identity, invalidate_identity_async
+from utils.pagination import keyset, build_page, DEFAULT_PAGE_SIZE
+from utils import password_hasher
+from utils.password_hasher import hashing_executor
 
 SECRET_KEY = "your-super-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-password_hash = PasswordHash.recommended()
-
 class UserService:
 
     @staticmethod
@@ -21,11 +25,23 @@ class UserService:
 
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str):
-        return password_hash.verify(plain_password, hashed_password)
+        return password_hasher.verify_password(plain_password, hashed_password)
 
     @staticmethod
     def get_password_hash(password: str):
-        return password_hash.hash(password)
+        return password_hasher.hash_password(password)
+
+    @staticmethod
+    def check_password(db: Session, user: User, password: str):
+        hashed_password = user.hashed_password
+        # Don't hold a pooled connection for the duration of the hash
+        db.commit()
+        valid, new_hash = password_hasher.verify_and_update(password, hashed_password)
+        if valid and new_hash:
+            # Stored with outdated argon2 parameters; upgrade while we have the plaintext
+            user.hashed_password = new_hash
+            db.commit()
+        return valid
 
     @staticmethod
     def decode_access_token(token: str):
@@ -36,16 +52,19 @@ class UserService:
             return None
 
     @staticmethod
+    @replica_read
     def get_user_by_email(db: Session, email: str):
         return db.query(User).filter(User.email == email).first()
 
     @staticmethod
+    @replica_read
     def get_user(db: Session, user_id: int):
         return db.query(User).filter(User.id == user_id).first()
 
     @staticmethod
-    def get_all_users(db: Session):
-        return db.query(User).all()
+    @replica_read
+    def get_all_users(db: Session, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        return build_page(keyset(db.query(User), User, after, limit).all(), limit)
 
     @staticmethod
     def create_user(db: Session, username: str, email: str, password: str):
@@ -61,7 +80,80 @@ class UserService:
     def delete_user(db: Session, user_id: int):
         user = db.query(User).filter(User.id == user_id).first()
         if user:
+            email = user.email
             db.delete(user)
             db.commit()
+            invalidate_identity(email)
+            return True
+        return False
+
+
+class AsyncUserService:
+    # Token handling is pure CPU and cheap, so it is shared with UserService. Password
+    # hashing is deliberately slow and runs on the bounded hashing executor, which
+    # answers 503 when saturated.
+
+    @staticmethod
+    async def verify_password(plain_password: str, hashed_password: str):
+        return await hashing_executor.run(password_hasher.verify_password, plain_password, hashed_password)
+
+    @staticmethod
+    async def get_password_hash(password: str):
+        return await hashing_executor.run(password_hasher.hash_password, password)
+
+    @staticmethod
+    async def check_password(db: AsyncSession, user: User, password: str):
+        hashed_password = user.hashed_password
+        # Don't hold a pooled connection for the duration of the hash
+        await db.commit()
+        valid, new_hash = await hashing_executor.run(password_hasher.verify_and_update, password, hashed_password)
+        if valid and new_hash:
+            # Stored with outdated argon2 parameters; upgrade while we have the plaintext
+            user.hashed_password = new_hash
+            await db.commit()
+        return valid
+
+    @staticmethod
+    @replica_read
+    async def get_user_by_email(db: AsyncSession, email: str):
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalars().first()
+
+    @staticmethod
+    @replica_read
+    async def get_user(db: AsyncSession, user_id: int):
+        result = await db.execute(select(User).where(User.id == user_id))
+        return result.scalars().first()
+
+    @staticmethod
+    @replica_read
+    async def get_all_users(db: AsyncSession, after=None, limit: int = DEFAULT_PAGE_SIZE):
+        result = await db.execute(keyset(select(User), User, after, limit))
+        return build_page(result.scalars().all(), limit)
+
+    @staticmethod
+    def export_statement():
+        # Everything but the password hash, oldest first
+        return select(User.id, User.uuid, User.username, User.email, User.created_at).order_by(User.created_at, User.id)
+
+    @staticmethod
+    async def create_user(db: AsyncSession, username: str, email: str, password: str):
+        hashed_password = await AsyncUserService.get_password_hash(password)
+        # uuid is generated by the model default
+        new_user = User(username=username, email=email, hashed_password=hashed_password)
+        db.add(new_user)
+        await db.commit()
+        await db.refresh(new_user)
+        return new_user
+
+    @staticmethod
+    async def delete_user(db: AsyncSession, user_id: int):
+        # Not get_user: a replica may not have the user yet, or may still have a deleted one
+        user = await db.get(User, user_id)
+        if user:
+            email = user.email
+            await db.delete(user)
+            await db.commit()
+            await invalidate_identity_async(email)
             return True
         return False
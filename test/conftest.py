@@ -0,0 +1,151 @@
+import asyncio
+import os
+import tempfile
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+# Application modules are imported inside the fixtures: test_redis_features.py swaps the
+# redis module for a mock at import time, so nothing here may import utils.* during collection.
+
+
+def pytest_configure(config):
+    # Read by utils.logger_conf at import, during collection; subprocesses inherit it.
+    # Keeps test runs from writing into the working tree's logs/.
+    os.environ["LOG_FILE"] = os.path.join(tempfile.mkdtemp(prefix="pytest-logs-"), "app.{pid}.log")
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    # A file, so the sync engine (rate limiter) and the async engine (routes) share data
+    return tmp_path / "test.db"
+
+
+@pytest.fixture
+def engine(database_path):
+    from db.database import Base
+    import models.User, models.Chat, models.ChatArchive, models.Message, models.UserAction  # noqa: F401  (register tables)
+
+    engine = create_engine(f"sqlite:///{database_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def async_engine(engine, database_path):
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}")
+    yield async_engine
+    asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
+
+
+@pytest.fixture
+def async_session_factory(async_engine):
+    return async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+@pytest.fixture
+def statements(engine, async_engine):
+    """Every SQL statement executed on the test engines, in order."""
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    for target in (engine, async_engine.sync_engine):
+        event.remove(target, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def redis_mock(monkeypatch):
+    import utils.redis_client
+
+    mock = MagicMock()
+    # GCRA script reply: allowed, remaining, retry_after_ms, reset_after_ms
+    mock.register_script.return_value.return_value = [1, 9, 0, 6000]
+    # Empty caches
+    mock.get.return_value = None
+    monkeypatch.setattr(utils.redis_client, "redis_client", mock)
+    return mock
+
+
+@pytest.fixture
+def async_redis_mock(monkeypatch):
+    import utils.redis_client
+
+    mock = AsyncMock()
+    # Scripts are registered synchronously and awaited when called
+    mock.register_script = MagicMock()
+    mock.register_script.return_value = AsyncMock(return_value=[1, 9, 0, 6000])
+    # Empty caches
+    mock.get.return_value = None
+    # Commands are queued on a pipeline synchronously; only execute() is awaited
+    mock.pipeline = MagicMock()
+    mock.pipeline.return_value.execute = AsyncMock(return_value=[])
+    monkeypatch.setattr(utils.redis_client, "async_redis_client", mock)
+    return mock
+
+
+@pytest.fixture
+def app(session_factory, async_session_factory, redis_mock, async_redis_mock):
+    from fastapi import FastAPI
+    from db.database import get_db, get_async_db
+    from api.user_routes import router as user_router
+    from api.chat_routes import router as chat_router
+    from api.message_routes import router as message_router
+    from utils.identity_cache import clear_identity_cache
+    from utils.rate_limiter import _deny_cache
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with async_session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(user_router, prefix="/users")
+    app.include_router(chat_router, prefix="/chats")
+    app.include_router(message_router, prefix="/messages")
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    clear_identity_cache()
+    _deny_cache.clear()
+    yield app
+    clear_identity_cache()
+    _deny_cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def auth_headers(session_factory):
+    from services.user_service import UserService
+
+    db = session_factory()
+    try:
+        user = UserService.create_user(db, username="alice", email="alice@example.com", password="password123")
+        token = UserService.create_access_token(data={"sub": user.email})
+    finally:
+        db.close()
+    return {"Authorization": f"Bearer {token}"}
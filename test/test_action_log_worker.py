@@ -0,0 +1,110 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+import pytest
+
+
+def stream_entry(entry_id, action, timestamp, identifier="user_uuid:a"):
+    entry = {"timestamp": timestamp.isoformat(), "action": action, "details": {"n": 1}}
+    return entry_id, {"identifier": identifier, "entry": json.dumps(entry)}
+
+
+@pytest.fixture
+def worker(session_factory):
+    from services.action_log_worker import ActionLogWorker
+
+    return ActionLogWorker(redis=MagicMock(), session_factory=session_factory, consumer="test")
+
+
+def stored(session_factory):
+    from models.UserAction import UserAction
+
+    with session_factory() as db:
+        return db.query(UserAction).order_by(UserAction.id).all()
+
+
+def test_batch_is_inserted_then_acked(worker, session_factory):
+    now = datetime.now()
+    entries = [stream_entry("1700000000000-0", "login_success", now), stream_entry("1700000000000-1", "view_profile", now)]
+
+    assert worker.process(entries)
+    # Redelivery after a crash between commit and ack must not duplicate rows
+    assert worker.process(entries)
+
+    rows = stored(session_factory)
+    assert [row.action for row in rows] == ["login_success", "view_profile"]
+    assert rows[0].details == {"n": 1}
+    worker.redis.xack.assert_called_with("user_actions", "user_actions_writer", "1700000000000-0", "1700000000000-1")
+    assert worker.stats["processed"] == 4
+
+
+def test_malformed_entries_are_dead_lettered(worker, session_factory):
+    entries = [stream_entry("1700000000000-0", "login_success", datetime.now()), ("1700000000000-1", {"identifier": "x"})]
+
+    assert worker.process(entries)
+
+    assert len(stored(session_factory)) == 1
+    pipeline = worker.redis.pipeline.return_value
+    pipeline.xadd.assert_called_once()
+    assert pipeline.xadd.call_args.args[0] == "user_actions:dead"
+    pipeline.xack.assert_called_once_with("user_actions", "user_actions_writer", "1700000000000-1")
+    assert worker.stats["dead_lettered"] == 1
+
+
+def test_unavailable_database_leaves_batch_pending(worker):
+    from sqlalchemy.exc import OperationalError
+
+    def broken_session():
+        raise OperationalError("connect", {}, Exception("connection refused"))
+
+    worker.session_factory = broken_session
+    assert not worker.process([stream_entry("1700000000000-0", "login_success", datetime.now())])
+    worker.redis.xack.assert_not_called()
+    assert worker.stats["retries"] == 1
+    assert worker.backoff() == 0.5
+
+
+def test_logs_endpoint_continues_into_history(client, auth_headers, session_factory, redis_mock, monkeypatch):
+    import utils.user_logger
+    from models.UserAction import UserAction
+    from services.user_service import UserService
+    from utils.user_logger import ActionLogWriter
+
+    monkeypatch.setattr(utils.user_logger, "action_log_writer", ActionLogWriter(flush_interval=60))
+    now = datetime.now()
+    with session_factory() as db:
+        identifier = f"user_uuid:{UserService.get_user_by_email(db, 'alice@example.com').uuid}"
+        # Two entries also present in Redis, three older ones only in Postgres
+        for i in range(5):
+            db.add(UserAction(id=i + 1, created_at=now - timedelta(minutes=i), identifier=identifier, action=f"action_{i}", details={}))
+        db.commit()
+    redis_mock.lrange.return_value = [
+        json.dumps({"timestamp": (now - timedelta(minutes=i)).isoformat(), "action": f"action_{i}", "details": {}}) for i in range(2)
+    ]
+
+    first = client.get("/users/logs?limit=3", headers=auth_headers).json()
+    assert [item["action"] for item in first["items"]] == ["action_0", "action_1", "action_2"]
+
+    second = client.get(f"/users/logs?limit=3&cursor={first['next_cursor']}", headers=auth_headers).json()
+    assert [item["action"] for item in second["items"]] == ["action_3", "action_4"]
+    assert second["next_cursor"] is None
+
+
+def test_partitions_are_remembered_only_once_committed(worker):
+    from sqlalchemy.exc import IntegrityError
+
+    db = MagicMock()
+    db.bind.dialect.name = "postgresql"
+    db.__enter__.return_value = db
+    db.execute.side_effect = [None, IntegrityError("insert", {}, Exception("boom")), None, None]
+    worker.session_factory = lambda: db
+    rows = [{"created_at": datetime(2026, 3, 5)}]
+
+    with pytest.raises(IntegrityError):
+        worker.insert(rows)
+    assert worker._partitions == set()
+
+    # Rolled back with the batch, so created again on the retry
+    worker.insert(rows)
+    assert "CREATE TABLE IF NOT EXISTS user_actions_2026_03" in str(db.execute.call_args_list[2].args[0])
+    assert worker._partitions == {(2026, 3)}
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pytest
+
+AUDIO = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def storage_root(tmp_path, monkeypatch):
+    from utils.storage import storage
+
+    root = tmp_path / "storage"
+    monkeypatch.setattr(storage, "root", str(root))
+    monkeypatch.setattr(storage, "tmp_dir", str(root / "tmp"))
+    return root
+
+
+@pytest.fixture
+def chat_id(client, auth_headers):
+    return client.post("/chats/new", headers=auth_headers).json()["id"]
+
+
+def upload(client, auth_headers, chat_id, data, content_type="audio/mpeg"):
+    resp = client.post(
+        f"/messages/{chat_id}/send",
+        params={"content": "voice note"},
+        files={"file": ("note.mp3", data, content_type)},
+        headers=auth_headers,
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def stored_files(root):
+    return sorted(name for _, _, names in os.walk(root) for name in names)
+
+
+def test_upload_is_content_addressed_and_deduplicated(client, auth_headers, chat_id, storage_root, monkeypatch):
+    import utils.storage
+
+    # Several chunks per upload
+    monkeypatch.setattr(utils.storage, "STORAGE_CHUNK_SIZE", 1000)
+    first = upload(client, auth_headers, chat_id, AUDIO)
+    second = upload(client, auth_headers, chat_id, AUDIO)
+
+    key = hashlib.sha256(AUDIO).hexdigest()
+    assert first["file_path"] == second["file_path"] == key
+    assert first["id"] != second["id"]
+    assert stored_files(storage_root) == [key, f"{key}.json"]
+
+    resp = client.get(f"/messages/{first['id']}/attachment", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.content == AUDIO
+    assert resp.headers["content-type"] == "audio/mpeg"
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert resp.headers["etag"] == f'"{key}"'
+    assert resp.headers["content-disposition"] == "attachment"
+    assert resp.headers["x-content-type-options"] == "nosniff"
+
+
+def test_range_downloads(client, auth_headers, chat_id, storage_root):
+    message_id = upload(client, auth_headers, chat_id, AUDIO)["id"]
+    url = f"/messages/{message_id}/attachment"
+    size = len(AUDIO)
+
+    def get(**headers):
+        return client.get(url, headers={**auth_headers, **headers})
+
+    resp = get(Range="bytes=100-199")
+    assert resp.status_code == 206
+    assert resp.content == AUDIO[100:200]
+    assert resp.headers["content-range"] == f"bytes 100-199/{size}"
+    assert resp.headers["content-length"] == "100"
+
+    assert get(Range="bytes=-10").content == AUDIO[-10:]
+    assert get(Range=f"bytes={size - 5}-").content == AUDIO[-5:]
+    assert get(Range=f"bytes=0-{size * 2}").headers["content-range"] == f"bytes 0-{size - 1}/{size}"
+
+    resp = get(Range=f"bytes={size}-")
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == f"bytes */{size}"
+
+    # A stale If-Range gets the whole (changed) representation instead of a slice
+    resp = get(Range="bytes=0-9", **{"If-Range": '"other"'})
+    assert resp.status_code == 200 and resp.content == AUDIO
+
+    etag = get().headers["etag"]
+    assert get(**{"If-None-Match": etag}).status_code == 304
+
+
+def test_upload_over_limit_is_rejected(client, auth_headers, chat_id, storage_root, monkeypatch):
+    import utils.storage
+
+    monkeypatch.setattr(utils.storage, "MAX_UPLOAD_BYTES", 1000)
+    monkeypatch.setattr(utils.storage, "STORAGE_CHUNK_SIZE", 256)
+    resp = client.post(f"/messages/{chat_id}/send", files={"file": ("big.bin", AUDIO)}, headers=auth_headers)
+
+    assert resp.status_code == 413
+    # The partial temp file is gone and nothing was stored
+    assert stored_files(storage_root) == []
+
+
+def test_attachment_not_found(client, auth_headers, chat_id, storage_root):
+    message_id = client.post(f"/messages/{chat_id}/send", params={"content": "text only"}, headers=auth_headers).json()["id"]
+    assert client.get(f"/messages/{message_id}/attachment", headers=auth_headers).status_code == 404
+    assert client.get("/messages/999/attachment", headers=auth_headers).status_code == 404
+
+
+def test_attachment_of_another_users_chat_is_not_found(client, auth_headers, chat_id, storage_root, session_factory):
+    from services.user_service import UserService
+
+    message_id = upload(client, auth_headers, chat_id, AUDIO)["id"]
+    with session_factory() as db:
+        UserService.create_user(db, username="mallory", email="mallory@example.com", password="password123")
+    token = UserService.create_access_token(data={"sub": "mallory@example.com"})
+
+    resp = client.get(f"/messages/{message_id}/attachment", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 404
+
+
+def test_parse_range():
+    from utils.storage import parse_range, RangeNotSatisfiable
+
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-0", 100) == (0, 0)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-200", 100) == (0, 99)
+    # Multiple or malformed ranges fall back to the whole object
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("bytes=a-b", 100) is None
+    assert parse_range("items=0-1", 100) is None
+    for header in ("bytes=100-", "bytes=5-4", "bytes=-0"):
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range(header, 100)
@@ -0,0 +1,75 @@
+import pytest
+
+
+@pytest.fixture
+def memory_limiter(monkeypatch):
+    import utils.rate_limiter
+    from utils.rate_limit_backends import MemoryGCRABackend
+
+    monkeypatch.setattr(utils.rate_limiter, "_backend", MemoryGCRABackend())
+
+
+def test_bulk_insert_returns_ids_in_order(client, auth_headers, statements, memory_limiter):
+    first = client.post("/chats/new", headers=auth_headers).json()["id"]
+    second = client.post("/chats/new", headers=auth_headers).json()["id"]
+    messages = [{"chat_id": first if i % 2 else second, "content": f"m{i}"} for i in range(20)]
+
+    statements.clear()
+    resp = client.post("/messages/bulk", json={"messages": messages}, headers=auth_headers)
+
+    assert resp.status_code == 200
+    ids = resp.json()["ids"]
+    assert len(ids) == 20
+    # Postgres sends these as multi-row INSERT ... RETURNING batches. SQLite can't
+    # guarantee RETURNING order for those, so SQLAlchemy inserts row by row here.
+    assert any(s.lstrip().upper().startswith("INSERT INTO MESSAGES") for s in statements)
+
+    page = client.get(f"/messages/chat/{first}", params={"limit": 100}).json()
+    assert [(m["id"], m["content"]) for m in page["items"]] == [(ids[i], f"m{i}") for i in range(1, 20, 2)]
+
+
+def test_bulk_insert_is_all_or_nothing(client, auth_headers, memory_limiter):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    resp = client.post(
+        "/messages/bulk",
+        json={"messages": [{"chat_id": chat_id, "content": "a"}, {"chat_id": 999, "content": "b"}]},
+        headers=auth_headers,
+    )
+
+    assert resp.status_code == 404
+    assert client.get(f"/messages/chat/{chat_id}").json()["items"] == []
+
+
+def test_bulk_insert_is_charged_per_message(client, auth_headers, memory_limiter, monkeypatch):
+    from api.message_routes import bulk_rate_limiter
+
+    monkeypatch.setattr(bulk_rate_limiter, "limit", 10)
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    batch = {"messages": [{"chat_id": chat_id, "content": "m"}] * 6}
+
+    resp = client.post("/messages/bulk", json=batch, headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.headers["X-RateLimit-Remaining"] == "4"
+    assert client.post("/messages/bulk", json=batch, headers=auth_headers).status_code == 429
+
+
+def test_oversized_bulk_request_does_not_block_smaller_ones(client, auth_headers, memory_limiter, monkeypatch):
+    from api.message_routes import bulk_rate_limiter
+
+    monkeypatch.setattr(bulk_rate_limiter, "limit", 10)
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+
+    def send(count):
+        return client.post("/messages/bulk", json={"messages": [{"chat_id": chat_id, "content": "m"}] * count}, headers=auth_headers)
+
+    assert send(6).status_code == 200
+    assert send(6).status_code == 429
+    # 4 units are still free
+    resp = send(1)
+    assert resp.status_code == 200
+    assert resp.headers["X-RateLimit-Remaining"] == "3"
+    for _ in range(3):
+        assert send(1).status_code == 200
+    # Now nothing fits: rejected locally, until a unit frees up
+    assert send(1).status_code == 429
+    assert send(1).headers["Retry-After"] in ("6", "7")
@@ -0,0 +1,152 @@
+import pytest
+
+
+class FakeRedis:
+    """Just enough of redis-py for the chat cache; other commands are accepted and ignored."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name, lambda *a, **k: None)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeAsyncRedis:
+    """The same data through redis.asyncio's interface."""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __getattr__(self, name):
+        async def command(*args, **kwargs):
+            return getattr(self.redis, name)(*args, **kwargs)
+        return command
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self.redis)
+
+
+class FakeAsyncPipeline(FakePipeline):
+    async def execute(self):
+        return super().execute()
+
+
+@pytest.fixture
+def fake_redis(app, monkeypatch):
+    import utils.redis_client
+    import utils.rate_limiter
+    from utils.rate_limit_backends import MemoryGCRABackend
+
+    redis = FakeRedis()
+    monkeypatch.setattr(utils.redis_client, "redis_client", redis)
+    monkeypatch.setattr(utils.redis_client, "async_redis_client", FakeAsyncRedis(redis))
+    monkeypatch.setattr(utils.rate_limiter, "_backend", MemoryGCRABackend())
+    return redis
+
+
+def _selects(statements):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+
+def test_chat_details_are_cached_until_a_write(client, auth_headers, statements, fake_redis):
+    from utils.chat_cache import get_chat_cache_stats
+
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    client.post(f"/messages/{chat_id}/send", params={"content": "first"}, headers=auth_headers)
+    before = get_chat_cache_stats()
+
+    statements.clear()
+    miss = client.get(f"/messages/{chat_id}", headers=auth_headers)
+    hit = client.get(f"/messages/{chat_id}", headers=auth_headers)
+    assert len(_selects(statements)) == 1
+    assert hit.json() == miss.json()
+    assert hit.headers["ETag"] == miss.headers["ETag"]
+
+    statements.clear()
+    not_modified = client.get(f"/messages/{chat_id}", headers={**auth_headers, "If-None-Match": miss.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == miss.headers["ETag"]
+    assert statements == []
+
+    client.post(f"/messages/{chat_id}/send", params={"content": "second"}, headers=auth_headers)
+    fresh = client.get(f"/messages/{chat_id}", headers={**auth_headers, "If-None-Match": miss.headers["ETag"]})
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] != miss.headers["ETag"]
+    assert [m["content"] for m in fresh.json()["messages"]] == ["first", "second"]
+
+    stats = get_chat_cache_stats()
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["misses"] - before["misses"] == 2
+    assert stats["not_modified"] - before["not_modified"] == 1
+
+
+def test_message_pages_are_cached_per_cursor(client, auth_headers, fake_redis):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    for i in range(3):
+        client.post(f"/messages/{chat_id}/send", params={"content": f"m{i}"}, headers=auth_headers)
+
+    first = client.get(f"/messages/chat/{chat_id}", params={"limit": 2})
+    second = client.get(f"/messages/chat/{chat_id}", params={"limit": 2, "cursor": first.json()["next_cursor"]})
+    assert first.headers["ETag"] != second.headers["ETag"]
+    assert [m["content"] for m in second.json()["items"]] == ["m2"]
+
+    message_id = first.json()["items"][0]["id"]
+    client.delete(f"/messages/{message_id}")
+    assert [m["content"] for m in client.get(f"/messages/chat/{chat_id}", params={"limit": 2}).json()["items"]] == ["m1", "m2"]
+
+
+def test_redis_failure_falls_back_to_database(client, auth_headers, async_redis_mock):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    async_redis_mock.get.side_effect = ConnectionError("down")
+
+    resp = client.get(f"/messages/{chat_id}", headers=auth_headers)
+    assert resp.status_code == 200
+    assert "ETag" not in resp.headers
+
+
+def test_chats_that_dont_exist_leave_nothing_in_redis(client, fake_redis):
+    for _ in range(2):
+        resp = client.get("/messages/chat/424242")
+        assert resp.status_code == 200
+        assert "ETag" not in resp.headers
+    assert not [key for key in fake_redis.data if key.startswith(("chat_version:", "chat_cache:"))]
+
+
+def test_cached_reads_keep_rate_limit_headers(client, auth_headers, fake_redis):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+
+    miss = client.get(f"/messages/{chat_id}", headers=auth_headers)
+    hit = client.get(f"/messages/{chat_id}", headers=auth_headers)
+    not_modified = client.get(f"/messages/{chat_id}", headers={**auth_headers, "If-None-Match": miss.headers["ETag"]})
+
+    assert [resp.status_code for resp in (miss, hit, not_modified)] == [200, 200, 304]
+    assert [resp.headers["X-RateLimit-Remaining"] for resp in (miss, hit, not_modified)] == ["59", "58", "57"]
+    assert all(resp.headers["X-RateLimit-Limit"] == "60" for resp in (miss, hit, not_modified))
@@ -0,0 +1,37 @@
+from sqlalchemy import text
+
+
+def _selects(statements):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+
+def test_chat_detail_is_a_single_query(client, auth_headers, statements):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    for i in range(5):
+        client.post(f"/messages/{chat_id}/send", params={"content": f"m{i}"}, headers=auth_headers)
+
+    statements.clear()
+    resp = client.get(f"/messages/{chat_id}", headers=auth_headers)
+
+    assert resp.status_code == 200
+    assert [m["content"] for m in resp.json()["messages"]] == [f"m{i}" for i in range(5)]
+    # The user is already in the identity cache: the chat and its messages are one query
+    assert len(_selects(statements)) == 1
+
+
+def test_missing_chat_is_a_single_query(client, auth_headers, statements):
+    client.get("/users/me", headers=auth_headers)
+    statements.clear()
+
+    assert client.get("/messages/999", headers=auth_headers).status_code == 404
+    assert len(_selects(statements)) == 1
+
+
+def test_foreign_key_lookups_use_an_index(engine):
+    with engine.connect() as conn:
+        for sql, index in (
+            ("SELECT * FROM messages WHERE chat_id = 1", "ix_messages_chat_id_created_at_id"),
+            ("SELECT * FROM chats WHERE user_id = 1", "ix_chats_user_id_created_at_id"),
+        ):
+            plan = " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+            assert index in plan
@@ -0,0 +1,51 @@
+import json
+
+
+def test_chat_export_streams_ndjson(client, auth_headers, monkeypatch):
+    import utils.ndjson
+
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    client.post(
+        "/messages/bulk",
+        json={"messages": [{"chat_id": chat_id, "content": f"m{i}"} for i in range(25)]},
+        headers=auth_headers,
+    )
+    chunks = []
+    original = utils.ndjson.iter_ndjson
+
+    async def recording(db, stmt, chunk_size=None):
+        async for chunk in original(db, stmt, chunk_size=10):
+            chunks.append(chunk)
+            yield chunk
+
+    monkeypatch.setattr(utils.ndjson, "iter_ndjson", recording)
+    resp = client.get(f"/messages/chat/{chat_id}/export", headers=auth_headers)
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["content"] for line in lines] == [f"m{i}" for i in range(25)]
+    assert set(lines[0]) == {"id", "chat_id", "content", "request_metadata", "file_path", "created_at"}
+    # Written as the cursor is read, ten rows at a time
+    assert [chunk.count(b"\n") for chunk in chunks] == [10, 10, 5]
+
+
+def test_chat_export_of_missing_chat(client, auth_headers):
+    assert client.get("/messages/chat/999/export", headers=auth_headers).status_code == 404
+
+
+def test_user_export_requires_internal_token(client, auth_headers, monkeypatch):
+    import api.internal_routes
+
+    # No token configured: closed
+    assert client.get("/users/export").status_code == 403
+
+    monkeypatch.setattr(api.internal_routes, "INTERNAL_API_TOKEN", "secret")
+    assert client.get("/users/export").status_code == 403
+    assert client.get("/users/export", headers={"X-Internal-Token": "wrong"}).status_code == 403
+
+    resp = client.get("/users/export", headers={"X-Internal-Token": "secret"})
+    assert resp.status_code == 200
+    users = [json.loads(line) for line in resp.text.splitlines()]
+    assert [user["email"] for user in users] == ["alice@example.com"]
+    assert "hashed_password" not in users[0]
@@ -0,0 +1,73 @@
+def _user_selects(statements):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT") and "FROM users" in s]
+
+
+def test_user_resolved_once_per_request(client, auth_headers, statements):
+    resp = client.get("/users/me", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.json()["email"] == "alice@example.com"
+    assert len(_user_selects(statements)) == 1
+
+
+def test_identity_cache_serves_repeat_requests(client, auth_headers, statements):
+    client.get("/users/me", headers=auth_headers)
+    statements.clear()
+
+    resp = client.get("/users/me", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.json()["email"] == "alice@example.com"
+    assert _user_selects(statements) == []
+
+
+def test_delete_user_invalidates_identity(client, auth_headers, session_factory):
+    from services.user_service import UserService
+
+    user_id = client.get("/users/me", headers=auth_headers).json()["id"]
+    db = session_factory()
+    try:
+        assert UserService.delete_user(db, user_id)
+    finally:
+        db.close()
+
+    resp = client.get("/users/me", headers=auth_headers)
+    assert resp.status_code == 401
+
+
+class FakeAsyncRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_async_resolver_uses_the_async_redis_client(auth_headers, async_session_factory, redis_mock, monkeypatch):
+    import asyncio
+    from starlette.requests import Request
+    import utils.identity_cache
+    import utils.redis_client
+    from utils.identity import resolve_user_async
+
+    async_redis = FakeAsyncRedis()
+    monkeypatch.setattr(utils.redis_client, "async_redis_client", async_redis)
+    monkeypatch.setattr(utils.identity_cache, "IDENTITY_REDIS_ENABLED", True)
+    headers = [(b"authorization", auth_headers["Authorization"].encode())]
+
+    async def resolve():
+        async with async_session_factory() as db:
+            return await resolve_user_async(Request({"type": "http", "headers": headers}), db)
+
+    assert asyncio.run(resolve()).email == "alice@example.com"
+    assert "identity:alice@example.com" in async_redis.data
+    # Another worker: only the Redis tier has it
+    utils.identity_cache.clear_identity_cache()
+    assert asyncio.run(resolve()).email == "alice@example.com"
+    # Nothing blocking on the event loop
+    redis_mock.get.assert_not_called()
+    redis_mock.setex.assert_not_called()
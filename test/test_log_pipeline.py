@@ -0,0 +1,95 @@
+import json
+import threading
+from loguru import logger
+
+
+class BlockingWriter:
+    def __init__(self):
+        self.release = threading.Event()
+        self.lines = []
+
+    def write_lines(self, lines):
+        self.release.wait(5)
+        self.lines.extend(lines)
+
+    def close(self):
+        pass
+
+
+def test_batches_are_serialized_off_thread(tmp_path):
+    from utils.log_pipeline import BatchingSink, RotatingFileWriter
+    from utils.logger_conf import serialize
+
+    sink = BatchingSink([(serialize, RotatingFileWriter(str(tmp_path / "app.log")))], flush_interval=0.01)
+    handler_id = logger.add(sink, format="{message}", level="DEBUG")
+    try:
+        for i in range(10):
+            logger.bind(service="application", track="user_uuid:1").info(f"line {i}")
+        assert sink.drain()
+    finally:
+        logger.remove(handler_id)
+
+    lines = [json.loads(line) for line in (tmp_path / "app.log").read_text().splitlines()]
+    assert [line["message"] for line in lines] == [f"line {i}" for i in range(10)]
+    assert lines[0]["track"] == "user_uuid:1"
+    assert sink.get_stats()["written"] == 10
+
+
+def test_overflow_drops_and_counts():
+    from utils.log_pipeline import BatchingSink
+
+    writer = BlockingWriter()
+    sink = BatchingSink([(lambda record: record["message"], writer)], max_queue=10, batch_size=1, overflow_policy="drop", flush_interval=0.01)
+    handler_id = logger.add(sink, format="{message}", level="DEBUG")
+    try:
+        for i in range(50):
+            logger.info(f"line {i}")
+        stats = sink.get_stats()
+        assert stats["dropped"] > 0
+        assert stats["queue_depth"] <= 10
+        writer.release.set()
+        assert sink.drain()
+    finally:
+        logger.remove(handler_id)
+
+    assert len(writer.lines) + sink.get_stats()["dropped"] == 50
+
+
+def test_write_through_writes_on_the_calling_thread():
+    from utils.log_pipeline import BatchingSink
+
+    writer = BlockingWriter()
+    writer.release.set()
+    # Long enough that nothing would reach the writer before the assertion otherwise
+    sink = BatchingSink([(lambda record: record["message"], writer)], flush_interval=60)
+    handler_id = logger.add(sink, format="{message}", level="DEBUG")
+    try:
+        logger.info("buffered")
+        sink.write_through()
+        logger.info("direct")
+        assert writer.lines == ["buffered", "direct"]
+    finally:
+        logger.remove(handler_id)
+
+
+def test_stream_writes_stay_below_the_chunk_size():
+    from utils.log_pipeline import StreamWriter
+
+    class Stream:
+        def __init__(self):
+            self.pending, self.flushed = "", []
+
+        def write(self, text):
+            self.pending += text
+
+        def flush(self):
+            self.flushed.append(self.pending)
+            self.pending = ""
+
+    stream = Stream()
+    lines = [f"{i:03d}" + "x" * 95 + "\n" for i in range(100)]
+    StreamWriter(stream, chunk_bytes=4096).write_lines(lines)
+
+    assert "".join(stream.flushed) == "".join(lines)
+    assert all(len(chunk) <= 4096 and chunk.endswith("\n") for chunk in stream.flushed)
+    assert len(stream.flushed) == 3
@@ -0,0 +1,168 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+
+
+def seed_chat(session_factory, contents, created_at, user_id=None):
+    from models.Chat import Chat
+    from models.Message import Message
+
+    with session_factory() as db:
+        chat = Chat(user_id=user_id, created_at=created_at)
+        db.add(chat)
+        db.flush()
+        db.add_all(
+            Message(chat_id=chat.id, content=content, request_metadata="{}", created_at=created_at + timedelta(minutes=i))
+            for i, content in enumerate(contents)
+        )
+        db.commit()
+        return chat.id
+
+
+def message_rows(session_factory, chat_id):
+    from models.Message import Message
+
+    with session_factory() as db:
+        return db.execute(
+            select(Message.id, Message.content, Message.created_at).where(Message.chat_id == chat_id).order_by(Message.id)
+        ).all()
+
+
+def test_cold_chats_are_archived_and_come_back_when_opened(session_factory, client, auth_headers):
+    from models.Chat import Chat
+    from models.ChatArchive import ChatArchive
+    from models.Message import Message
+    from services.message_archive import archive_cold_chats
+
+    now = datetime.now()
+    cold = seed_chat(session_factory, [f"old message {i} " + "lorem ipsum " * 20 for i in range(50)], now - timedelta(days=400))
+    warm = seed_chat(session_factory, ["old", "recent"], now - timedelta(days=400))
+    # One message inside the window keeps the whole chat hot
+    with session_factory() as db:
+        db.execute(update(Message).where(Message.chat_id == warm, Message.content == "recent").values(created_at=now))
+        db.commit()
+    before = message_rows(session_factory, cold)
+
+    with session_factory() as db:
+        assert archive_cold_chats(db, now - timedelta(days=180)) == (1, 50)
+
+    assert message_rows(session_factory, cold) == []
+    assert len(message_rows(session_factory, warm)) == 2
+    with session_factory() as db:
+        archive = db.get(ChatArchive, cold)
+        assert archive.message_count == 50
+        assert len(archive.payload) < sum(len(content) for _, content, _ in before) / 4
+        assert db.get(Chat, cold).archived_at is not None
+
+    resp = client.get(f"/messages/{cold}", headers=auth_headers)
+
+    assert resp.status_code == 200
+    assert [(m["id"], m["content"]) for m in resp.json()["messages"]] == [(id, content) for id, content, _ in before]
+    # Restored as they were, and only once
+    assert message_rows(session_factory, cold) == before
+    with session_factory() as db:
+        assert db.get(ChatArchive, cold) is None
+        assert db.get(Chat, cold).archived_at is None
+    assert len(client.get(f"/messages/{cold}", headers=auth_headers).json()["messages"]) == 50
+
+
+def test_every_history_read_brings_an_archived_chat_back(session_factory, client, auth_headers, monkeypatch):
+    from models.User import User
+    from services.message_archive import archive_chat
+    from utils.chat_events import chat_event_hub
+
+    monkeypatch.setattr(chat_event_hub, "backend", "memory")
+    token = auth_headers["Authorization"].split(" ")[1]
+    now = datetime.now()
+    with session_factory() as db:
+        user_id = db.scalar(select(User.id).where(User.email == "alice@example.com"))
+    chat_id = seed_chat(session_factory, ["a", "b", "c"], now - timedelta(days=400), user_id=user_id)
+    first_id = message_rows(session_factory, chat_id)[0][0]
+
+    def archived():
+        with session_factory() as db:
+            assert archive_chat(db, chat_id, now - timedelta(days=180)) == 3
+
+    archived()
+    page = client.get(f"/messages/chat/{chat_id}", headers=auth_headers).json()
+    assert [m["content"] for m in page["items"]] == ["a", "b", "c"]
+
+    archived()
+    export = client.get(f"/messages/chat/{chat_id}/export", headers=auth_headers)
+    assert [json.loads(line)["content"] for line in export.text.splitlines()] == ["a", "b", "c"]
+
+    archived()
+    with client.websocket_connect(f"/messages/{chat_id}/ws?token={token}&last_id={first_id}") as ws:
+        replayed = [ws.receive_json(), ws.receive_json()]
+        assert [event["message"]["content"] for event in replayed] == ["b", "c"]
+        assert ws.receive_json() == {"type": "ready"}
+
+
+def test_a_reopened_chat_is_archived_again_with_its_earlier_archive(session_factory):
+    from models.ChatArchive import ChatArchive
+    from models.Message import Message
+    from services.chat_service import ChatService
+    from services.message_archive import archive_chat, unpack
+
+    now = datetime.now()
+    chat_id = seed_chat(session_factory, ["a", "b"], now - timedelta(days=400))
+    with session_factory() as db:
+        assert archive_chat(db, chat_id, now - timedelta(days=180)) == 2
+        # A new message without the chat being opened: the archive stays as it is
+        db.add(Message(chat_id=chat_id, content="c", created_at=now - timedelta(days=200)))
+        db.commit()
+        assert archive_chat(db, chat_id, now - timedelta(days=180)) == 1
+
+        history = unpack(db.get(ChatArchive, chat_id).payload)
+        assert [row["content"] for row in history] == ["a", "b", "c"]
+        assert db.scalar(select(func.count()).select_from(Message).where(Message.chat_id == chat_id)) == 0
+
+    with session_factory() as db:
+        details = ChatService.get_chat_details(db, chat_id)
+        assert [m.content for m in details["messages"]] == ["a", "b", "c"]
+
+
+def test_hot_queries_are_bounded_by_the_chat_for_partition_pruning():
+    from sqlalchemy.dialects import postgresql, sqlite
+    from sqlalchemy.orm import joinedload
+    from models.Chat import Chat
+    from models.Message import Message
+    from services.message_archive import history_bound
+    from utils.pagination import keyset
+
+    def chat_details(dialect):
+        stmt = select(Chat).where(Chat.id == 1).options(joinedload(Chat.messages.and_(history_bound(dialect.name, Chat.created_at))))
+        return str(stmt.compile(dialect=dialect))
+
+    assert "messages_1.created_at >= chats.created_at - " in chat_details(postgresql.dialect())
+    assert "chats.created_at -" not in chat_details(sqlite.dialect())
+
+    # Later pages carry their cursor as a plain bound too
+    page = keyset(select(Message).where(Message.chat_id == 1), Message, after=(datetime.now(), 5), limit=50)
+    assert "messages.created_at >= " in str(page.compile(dialect=postgresql.dialect()))
+
+
+def test_rounds_scan_the_lookback_window_and_reopened_chats(session_factory, redis_mock):
+    from services.chat_service import ChatService
+    from services.message_archive import archive_chat, cold_chat_ids
+
+    now = datetime.now()
+    cutoff = now - timedelta(days=180)
+    long_cold = seed_chat(session_factory, ["a"], now - timedelta(days=400))
+    just_cold = seed_chat(session_factory, ["b"], now - timedelta(days=183))
+    since = cutoff - timedelta(days=7)
+
+    with session_factory() as db:
+        assert cold_chat_ids(db, cutoff, since) == [just_cold]
+        # --backfill
+        assert sorted(cold_chat_ids(db, cutoff)) == [long_cold, just_cold]
+
+        assert archive_chat(db, long_cold, cutoff) == 1
+        redis_mock.pipeline.return_value.incr.assert_called_with(f"chat_version:{long_cold}")
+        redis_mock.reset_mock()
+        # Reopened: the cached chat goes, and the next round can archive it again
+        ChatService.get_chat_details(db, long_cold)
+        redis_mock.pipeline.return_value.incr.assert_called_with(f"chat_version:{long_cold}")
+        later = now + timedelta(days=1)
+        assert cold_chat_ids(db, cutoff, since) == [just_cold]
+        assert long_cold in cold_chat_ids(db, later, later - timedelta(days=7))
@@ -0,0 +1,65 @@
+import pytest
+
+
+@pytest.fixture
+def metrics_client(app, async_engine):
+    from fastapi.testclient import TestClient
+    from api.internal_routes import router as internal_router
+    from utils.metrics import MetricsMiddleware, instrument_engine
+
+    app.include_router(internal_router, prefix="/internal")
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(async_engine.sync_engine, "test")
+    with TestClient(app) as client:
+        yield client
+
+
+def test_requests_are_timed_per_route_with_db_and_redis_accounting(metrics_client, auth_headers, redis_mock):
+    from utils.metrics import REQUEST_LATENCY, REQUESTS, REQUEST_DB_QUERIES, REQUEST_REDIS_CALLS, IN_FLIGHT, DB_QUERIES
+
+    route = ("GET", "/messages/{chat_id}")
+    before = {
+        "latency": REQUEST_LATENCY.count(*route),
+        "ok": REQUESTS.value(*route, 200),
+        "not_found": REQUESTS.value(*route, 404),
+        "queries": REQUEST_DB_QUERIES.sum(*route),
+        "redis": REQUEST_REDIS_CALLS.sum(*route),
+        "db_total": DB_QUERIES.value("test"),
+    }
+    chat_id = metrics_client.post("/chats/new", headers=auth_headers).json()["id"]
+    metrics_client.get(f"/messages/{chat_id}", headers=auth_headers)
+    metrics_client.get("/messages/999", headers=auth_headers)
+
+    # Two requests on one route template, split by status
+    assert REQUEST_LATENCY.count(*route) - before["latency"] == 2
+    assert REQUESTS.value(*route, 200) - before["ok"] == 1
+    assert REQUESTS.value(*route, 404) - before["not_found"] == 1
+    # Chat details and the user lookup hit the database; each rate limit check is one Redis call
+    assert REQUEST_DB_QUERIES.sum(*route) - before["queries"] >= 2
+    assert REQUEST_REDIS_CALLS.sum(*route) - before["redis"] == 2
+    assert DB_QUERIES.value("test") - before["db_total"] >= REQUEST_DB_QUERIES.sum(*route) - before["queries"]
+    assert IN_FLIGHT.value("GET") == 0
+
+
+def test_unmatched_paths_share_a_label(metrics_client):
+    from utils.metrics import REQUESTS
+
+    before = REQUESTS.value("GET", "unmatched", 404)
+    metrics_client.get("/nope/1")
+    metrics_client.get("/nope/2")
+    assert REQUESTS.value("GET", "unmatched", 404) - before == 2
+
+
+def test_metrics_endpoint_serves_prometheus_text(metrics_client, monkeypatch):
+    import api.internal_routes
+
+    monkeypatch.setattr(api.internal_routes, "INTERNAL_API_OPEN", True)
+    metrics_client.get("/messages/chat/1")
+    resp = metrics_client.get("/internal/metrics")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = resp.text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/messages/chat/{chat_id}",le="+Inf"} ' in text
+    assert 'http_requests_total{method="GET",route="/messages/chat/{chat_id}",status="200"} ' in text
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy import create_engine, event, inspect
+
+
+@pytest.fixture
+def blank_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'blank.db'}")
+    yield engine
+    engine.dispose()
+
+
+def schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: (
+            {column["name"] for column in inspector.get_columns(table)},
+            {index["name"] for index in inspector.get_indexes(table)},
+        )
+        # Bookkeeping tables no model describes
+        for table in inspector.get_table_names() if table not in ("schema_migrations", "replica_heartbeat")
+    }
+
+
+def test_migrations_build_the_schema_the_models_describe(blank_engine, tmp_path):
+    from db.database import Base
+    from db.migrations import LATEST_VERSION, current_version, migrate
+    import models.User, models.Chat, models.ChatArchive, models.Message, models.UserAction  # noqa: F401  (register tables)
+
+    assert migrate(blank_engine) == list(range(1, LATEST_VERSION + 1))
+    assert migrate(blank_engine) == []
+    with blank_engine.connect() as conn:
+        assert current_version(conn) == LATEST_VERSION
+
+    from_models = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    Base.metadata.create_all(bind=from_models)
+    assert schema(blank_engine) == schema(from_models)
+    from_models.dispose()
+
+
+def test_a_database_built_by_create_all_is_adopted(engine):
+    from db.migrations import LATEST_VERSION, check_schema, migrate
+
+    # The conftest engine was made with create_all, like every database before migrations
+    assert migrate(engine) == list(range(1, LATEST_VERSION + 1))
+    assert check_schema(engine) == LATEST_VERSION
+
+
+def test_startup_check_is_one_query_and_refuses_an_unmigrated_database(blank_engine):
+    from db.migrations import SchemaOutOfDate, check_schema, migrate
+
+    with pytest.raises(SchemaOutOfDate, match="run `python -m db.migrations`"):
+        check_schema(blank_engine)
+    migrate(blank_engine, target=1)
+    with pytest.raises(SchemaOutOfDate, match="at version 1"):
+        check_schema(blank_engine)
+    migrate(blank_engine)
+
+    executed = []
+    event.listen(blank_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: executed.append(statement))
+    check_schema(blank_engine)
+    assert len(executed) == 1
+
+
+def test_search_migration_is_postgres_only():
+    from db.migrations import _0002_message_search
+
+    class Connection:
+        def __init__(self, dialect):
+            self.dialect = type("Dialect", (), {"name": dialect})
+            self.executed = []
+
+        def execute(self, statement):
+            self.executed.append(str(statement))
+
+    sqlite, postgres = Connection("sqlite"), Connection("postgresql")
+    _0002_message_search(sqlite)
+    _0002_message_search(postgres)
+
+    assert sqlite.executed == []
+    assert any("GENERATED ALWAYS AS (to_tsvector('english'" in statement for statement in postgres.executed)
+    assert any("USING gin (chat_id, content_tsv)" in statement for statement in postgres.executed)
+
+
+def test_importing_the_app_connects_to_nothing():
+    # A fresh interpreter: the test session has imported (and monkeypatched) all of these
+    code = (
+        "import sys, main, db.database, utils.redis_client\n"
+        "assert db.database._engine is None and db.database._async_engine is None\n"
+        "assert utils.redis_client.redis_client is None\n"
+        "assert not {'psycopg2', 'asyncpg', 'redis'} & set(sys.modules)\n"
+    )
+    env = {**os.environ, "DATABASE_URL": "postgresql://nobody@127.0.0.1:1/none", "APP_ENV": "test"}
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
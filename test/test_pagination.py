@@ -0,0 +1,38 @@
+from sqlalchemy import text
+
+
+def test_message_pages_cover_chat_in_order(client, auth_headers):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    for i in range(7):
+        client.post(f"/messages/{chat_id}/send", params={"content": f"m{i}"}, headers=auth_headers)
+
+    seen, params = [], {"limit": 3}
+    while True:
+        page = client.get(f"/messages/chat/{chat_id}", params=params).json()
+        assert len(page["items"]) <= 3
+        seen += [m["content"] for m in page["items"]]
+        if not page["next_cursor"]:
+            break
+        params["cursor"] = page["next_cursor"]
+
+    assert seen == [f"m{i}" for i in range(7)]
+
+
+def test_page_params_are_validated(client):
+    assert client.get("/users/", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/users/", params={"limit": 10_000}).status_code == 422
+
+
+def test_message_page_uses_composite_index(engine):
+    from sqlalchemy import select
+    from sqlalchemy.dialects import sqlite
+    from datetime import datetime
+    from models.Message import Message
+    from utils.pagination import keyset
+
+    stmt = keyset(select(Message).where(Message.chat_id == 1), Message, after=(datetime.now(), 1), limit=50)
+    sql = str(stmt.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        plan = " ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert "ix_messages_chat_id_created_at_id" in plan
+    assert "TEMP B-TREE" not in plan
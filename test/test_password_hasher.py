@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import pytest
+
+
+def test_saturated_executor_fails_fast():
+    from fastapi import HTTPException
+    from utils.password_hasher import HashingExecutor
+
+    executor = HashingExecutor(workers=1, queue_size=2)
+    release = threading.Event()
+    try:
+        futures = [executor.submit(release.wait, 5) for _ in range(2)]
+        with pytest.raises(HTTPException) as exc:
+            executor.submit(release.wait, 5)
+        assert exc.value.status_code == 503
+        assert exc.value.headers["Retry-After"] == "1"
+        assert executor.get_stats()["queue_depth"] == 1
+    finally:
+        release.set()
+    for future in futures:
+        future.result(timeout=5)
+
+    stats = executor.get_stats()
+    assert stats["completed"] == 2
+    assert stats["rejected"] == 1
+    assert stats["outstanding"] == 0
+    assert stats["hash_time_histogram_ms"]["+Inf"] == 2
+    executor.shutdown()
+
+
+def test_run_returns_result():
+    from utils.password_hasher import HashingExecutor, hash_password, verify_password
+
+    executor = HashingExecutor(workers=1, queue_size=1)
+    hashed = asyncio.run(executor.run(hash_password, "secret"))
+    assert asyncio.run(executor.run(verify_password, "secret", hashed))
+    executor.shutdown()
+
+
+def test_login_rehashes_outdated_hash(client, session_factory):
+    from pwdlib import PasswordHash
+    from pwdlib.hashers.argon2 import Argon2Hasher
+    from models.User import User
+    from utils.password_hasher import ARGON2_TIME_COST
+
+    outdated = PasswordHash((Argon2Hasher(time_cost=1, memory_cost=8192, parallelism=1),)).hash("password123")
+    with session_factory() as db:
+        db.add(User(username="bob", email="bob@example.com", hashed_password=outdated))
+        db.commit()
+
+    resp = client.post("/users/login", data={"username": "bob@example.com", "password": "password123"})
+    assert resp.status_code == 200
+
+    with session_factory() as db:
+        stored = db.query(User).filter(User.email == "bob@example.com").one().hashed_password
+    assert stored != outdated
+    assert f"t={ARGON2_TIME_COST}" in stored
+    # The upgraded hash still verifies
+    assert client.post("/users/login", data={"username": "bob@example.com", "password": "password123"}).status_code == 200
@@ -0,0 +1,34 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+
+def test_engine_config_profiles(monkeypatch):
+    from db.config import EngineConfig
+
+    prod = EngineConfig("prod")
+    assert prod.echo is False
+    assert prod.engine_kwargs("postgresql://db/app")["connect_args"] == {"options": "-c statement_timeout=5000"}
+    assert prod.engine_kwargs("postgresql+asyncpg://db/app")["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_ECHO", "false")
+    dev = EngineConfig("dev")
+    assert dev.pool_size == 3
+    assert dev.echo is False
+    assert "pool_size" not in dev.engine_kwargs("sqlite:///app.db")
+
+
+def test_timed_pool_records_checkouts(tmp_path):
+    from db.pool_metrics import timed_pool_class, get_pool_stats
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=timed_pool_class(QueuePool, "test_pool"), pool_size=2)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        stats = next(s for s in get_pool_stats() if s["name"] == "test_pool")
+        assert stats["checked_out"] == 1
+    engine.dispose()
+
+    stats = next(s for s in get_pool_stats() if s["name"] == "test_pool")
+    assert stats["wait_count"] == 1
+    assert stats["wait_histogram_ms"]["+Inf"] == 1
+    assert stats["checked_out"] == 0
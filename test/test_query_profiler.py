@@ -0,0 +1,92 @@
+import pytest
+
+
+@pytest.fixture
+def profiled_client(app, engine, async_engine):
+    from fastapi import Depends
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from db.database import get_db
+    from models.Chat import Chat
+    from utils.query_profiler import QueryProfilerMiddleware, profile_engine
+
+    @app.get("/n-plus-one")
+    def n_plus_one(db=Depends(get_db)):
+        counts = []
+        for chat in db.query(Chat).all():
+            # Lazy Chat.messages, one query per chat
+            counts.append(len(chat.messages))
+        return counts
+
+    app.add_middleware(QueryProfilerMiddleware)
+    listeners = [(target, *listener) for target in (engine, async_engine.sync_engine) for listener in profile_engine(target)]
+    with TestClient(app) as client:
+        yield client
+    for target, identifier, fn in listeners:
+        event.remove(target, identifier, fn)
+
+
+@pytest.fixture
+def findings():
+    from utils.logger_conf import logger
+
+    records = []
+    sink = logger.add(lambda message: records.append(message.record), level="WARNING", filter=lambda record: record["extra"].get("service") == "database")
+    yield records
+    logger.remove(sink)
+
+
+def test_statement_shape_folds_literals_and_in_lists():
+    from utils.query_profiler import statement_shape
+
+    assert statement_shape("SELECT * FROM chats\n  WHERE id IN (?, ?, ?) AND request_type = 'text' LIMIT 20") == (
+        "SELECT * FROM chats WHERE id IN (...) AND request_type = ? LIMIT ?"
+    )
+    assert statement_shape("SELECT 1 FROM messages WHERE chat_id IN (__[POSTCOMPILE_chat_id_1])") == statement_shape(
+        "SELECT 2 FROM messages WHERE chat_id IN (%(p1)s, %(p2)s)"
+    )
+
+
+def test_repeated_statements_are_reported_with_route_and_call_site(profiled_client, session_factory, findings):
+    from services.chat_service import ChatService
+
+    db = session_factory()
+    try:
+        for _ in range(6):
+            ChatService.create_chat(db, user_id=None)
+    finally:
+        db.close()
+
+    assert profiled_client.get("/n-plus-one").json() == [0] * 6
+
+    [record] = [r for r in findings if "N+1" in r["message"]]
+    assert record["extra"]["track"] == "route:GET /n-plus-one"
+    assert "6x SELECT messages.id" in record["message"]
+    assert "test/test_query_profiler.py" in record["message"] and "in n_plus_one" in record["message"]
+
+
+def test_slow_queries_are_reported(profiled_client, auth_headers, findings, monkeypatch):
+    import utils.query_profiler
+
+    monkeypatch.setattr(utils.query_profiler, "SLOW_QUERY_MS", 0)
+    profiled_client.get("/chats/", headers=auth_headers)
+
+    slow = [r for r in findings if r["message"].startswith("Slow query in GET /chats/")]
+    # The async route's queries are traced back through the session's greenlet
+    assert any("services/chat_service.py" in r["message"] for r in slow)
+
+
+def test_query_budget(profiled_client, auth_headers):
+    from utils.query_profiler import QueryBudgetExceeded, query_budget
+
+    chat_id = profiled_client.post("/chats/new", headers=auth_headers).json()["id"]
+
+    # The identity is cached by the request above: one query, the chat with its messages
+    with query_budget(1) as profiles:
+        assert profiled_client.get(f"/messages/{chat_id}", headers=auth_headers).status_code == 200
+    assert [profile.route for profile in profiles] == ["GET /messages/{chat_id}"]
+
+    with pytest.raises(QueryBudgetExceeded, match="query budget of 0 exceeded") as exc:
+        with query_budget(0):
+            profiled_client.get(f"/messages/{chat_id}", headers=auth_headers)
+    assert "services/chat_service.py" in str(exc.value)
@@ -0,0 +1,96 @@
+import pytest
+
+
+@pytest.fixture
+def memory_backend(monkeypatch):
+    import utils.rate_limiter
+    from utils.rate_limit_backends import MemoryGCRABackend
+
+    backend = MemoryGCRABackend()
+    monkeypatch.setattr(utils.rate_limiter, "_backend", backend)
+    return backend
+
+
+def test_gcra_allows_burst_then_rejects(memory_backend):
+    results = [memory_backend.hit("key", limit=5, period=60) for _ in range(6)]
+    assert [r.allowed for r in results] == [True] * 5 + [False]
+    assert [r.remaining for r in results[:5]] == [4, 3, 2, 1, 0]
+    assert results[-1].retry_after == pytest.approx(12, abs=0.1)
+
+
+def test_gcra_rejected_requests_do_not_consume(memory_backend):
+    for _ in range(5):
+        memory_backend.hit("key", limit=5, period=60)
+    first = memory_backend.hit("key", limit=5, period=60)
+    second = memory_backend.hit("key", limit=5, period=60)
+    assert not first.allowed and not second.allowed
+    assert second.reset_after == pytest.approx(first.reset_after, abs=0.1)
+
+
+def test_gcra_weighted_cost(memory_backend):
+    assert memory_backend.hit("key", limit=10, period=60, cost=8).remaining == 2
+    assert not memory_backend.hit("key", limit=10, period=60, cost=3).allowed
+
+
+def test_route_returns_rate_limit_headers(client, auth_headers, memory_backend):
+    resp = client.get("/users/me", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.headers["X-RateLimit-Limit"] == "30"
+    assert resp.headers["X-RateLimit-Remaining"] == "29"
+    assert "X-RateLimit-Reset" in resp.headers
+
+
+def test_route_rejects_over_limit(client, auth_headers, memory_backend):
+    for _ in range(30):
+        assert client.get("/users/me", headers=auth_headers).status_code == 200
+    resp = client.get("/users/me", headers=auth_headers)
+    assert resp.status_code == 429
+    assert resp.headers["X-RateLimit-Remaining"] == "0"
+    assert int(resp.headers["Retry-After"]) >= 1
+
+
+def test_blocked_client_is_rejected_locally(client, auth_headers, memory_backend, statements, monkeypatch):
+    from utils.rate_limiter import get_rate_limit_stats
+
+    for _ in range(31):
+        client.get("/users/me", headers=auth_headers)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("backend must not be consulted for a blocked client")
+
+    monkeypatch.setattr(memory_backend, "hit", fail)
+    before = get_rate_limit_stats()
+    statements.clear()
+
+    resp = client.get("/users/me", headers=auth_headers)
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert statements == []
+    assert get_rate_limit_stats()["local_denied"] == before["local_denied"] + 1
+
+
+def test_rate_limited_routes_stay_on_the_async_session(app, client, auth_headers, memory_backend):
+    from db.database import get_db
+
+    def no_sync_session():
+        raise AssertionError("a rate-limited route opened a sync session")
+        yield
+
+    app.dependency_overrides[get_db] = no_sync_session
+    resp = client.get("/users/me", headers=auth_headers)
+    assert resp.status_code == 200
+    assert resp.headers["X-RateLimit-Remaining"] == "29"
+
+
+def test_stats_are_served_to_internal_callers(app, client, auth_headers, memory_backend, monkeypatch):
+    import api.internal_routes
+    from api.internal_routes import router as internal_router
+
+    app.include_router(internal_router, prefix="/internal")
+    monkeypatch.setattr(api.internal_routes, "INTERNAL_API_TOKEN", "secret")
+    client.get("/users/me", headers=auth_headers)
+
+    assert client.get("/internal/rate-limit").status_code == 403
+    stats = client.get("/internal/rate-limit", headers={"X-Internal-Token": "secret"}).json()
+    assert stats["remote_allowed"] >= 1
+    assert {"local_denied", "remote_denied", "backend_errors", "deny_cache_size"} <= set(stats)
@@ -0,0 +1,152 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+# Two local databases: the test engines are the primary, replica.db stands in for a replica
+# that replicates whatever a test copies into it.
+
+
+@pytest.fixture
+def replica(tmp_path, engine, async_engine, monkeypatch):
+    import db.database
+    from db.migrations import migrate
+
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    migrate(create_engine(replica_url))
+    migrate(engine)
+    replica = db.database.Replica("replica1", replica_url)
+    monkeypatch.setattr(db.database, "replicas", [replica])
+    monkeypatch.setattr(db.database, "_async_engine", async_engine)
+    yield replica
+    if replica._async_engine is not None:
+        asyncio.run(replica._async_engine.dispose())
+
+
+@pytest.fixture
+def routed_sessions(engine, async_engine):
+    from db.routing import AsyncRoutingSession, RoutingAsyncSession, RoutingSession
+
+    return (
+        sessionmaker(bind=engine, class_=RoutingSession),
+        async_sessionmaker(
+            bind=async_engine, class_=RoutingAsyncSession, sync_session_class=AsyncRoutingSession, expire_on_commit=False
+        ),
+    )
+
+
+def add_user(engine, email):
+    from models.User import User
+
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(uuid=email, username=email, email=email, hashed_password="x"))
+        db.commit()
+
+
+def test_replica_reads_writes_and_fallback(engine, replica, routed_sessions):
+    from models.User import User
+    from services.chat_service import AsyncChatService
+    from services.user_service import AsyncUserService, UserService
+
+    add_user(engine, "alice@example.com")
+    add_user(replica.get_engine(), "bob@example.com")
+    session_factory, async_session_factory = routed_sessions
+    replica.healthy = True
+
+    with session_factory() as db:
+        assert UserService.get_user_by_email(db, "bob@example.com") is not None
+
+    async def scenario():
+        async with async_session_factory() as db:
+            assert await AsyncUserService.get_user_by_email(db, "bob@example.com") is not None
+            assert await AsyncUserService.get_user_by_email(db, "alice@example.com") is None
+            # Not a replica_read method
+            alice = (await db.execute(select(User).where(User.email == "alice@example.com"))).scalar_one()
+
+            await AsyncChatService.create_chat(db, user_id=alice.id)
+            # Once the session has written, it reads its own writes
+            assert await AsyncUserService.get_user_by_email(db, "bob@example.com") is None
+
+        replica.healthy = False
+        async with async_session_factory() as db:
+            assert await AsyncUserService.get_user_by_email(db, "alice@example.com") is not None
+
+    asyncio.run(scenario())
+
+
+def test_read_your_writes_across_requests(engine, replica, routed_sessions, redis_mock, async_redis_mock):
+    from db.routing import bind_client, bind_client_async
+    from services.chat_service import AsyncChatService
+    from services.user_service import AsyncUserService
+
+    add_user(engine, "alice@example.com")
+    _, async_session_factory = routed_sessions
+    replica.healthy = True
+    async_redis_mock.exists.return_value = 0
+
+    async def write_request():
+        await bind_client_async("alice@example.com")
+        async with async_session_factory() as db:
+            await AsyncChatService.create_chat(db, user_id=1)
+
+    async def read_request(client, bind=bind_client_async):
+        await bind(client)
+        async with async_session_factory() as db:
+            return await AsyncUserService.get_user_by_email(db, "alice@example.com")
+
+    async def bind_sync(client):
+        bind_client(client)
+
+    asyncio.run(write_request())
+    async_redis_mock.set.assert_awaited_once_with("db_sticky:alice@example.com", 1, px=5000)
+
+    # Pinned to the primary while the key lives, in any worker
+    async_redis_mock.exists.return_value = 1
+    assert asyncio.run(read_request("alice@example.com")) is not None
+    async_redis_mock.exists.return_value = 0
+    assert asyncio.run(read_request("alice@example.com")) is None
+    # Stickiness unknown: the primary, rather than a lookup blocking the loop
+    assert asyncio.run(read_request("alice@example.com", bind=bind_sync)) is not None
+    redis_mock.exists.assert_not_called()
+    redis_mock.set.assert_not_called()
+
+
+def test_delete_user_finds_the_user_on_the_primary(engine, replica, routed_sessions):
+    from services.user_service import AsyncUserService
+
+    add_user(engine, "alice@example.com")
+    _, async_session_factory = routed_sessions
+    replica.healthy = True
+
+    async def delete():
+        async with async_session_factory() as db:
+            return await AsyncUserService.delete_user(db, 1)
+
+    # Not replicated yet
+    assert asyncio.run(delete()) is True
+
+
+def test_lag_monitor_takes_replicas_in_and_out(engine, replica):
+    from db.routing import check_replicas, replica_heartbeat
+
+    def replicate_heartbeat():
+        with engine.connect() as conn:
+            beat_at = conn.execute(select(replica_heartbeat.c.beat_at)).scalar()
+        with replica.get_engine().begin() as conn:
+            conn.execute(update(replica_heartbeat).values(beat_at=beat_at))
+
+    # Still at the migration's heartbeat: far behind
+    asyncio.run(check_replicas())
+    assert not replica.healthy and replica.lag_seconds > 60
+
+    replicate_heartbeat()
+    asyncio.run(check_replicas())
+    assert replica.healthy and replica.lag_seconds == 0
+
+    replica.get_engine().dispose()
+    asyncio.run(replica.get_async_engine().dispose())
+    replica.async_url = "sqlite+aiosqlite:////nonexistent/replica.db"
+    replica._async_engine = None
+    asyncio.run(check_replicas())
+    assert not replica.healthy and replica.error
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import pytest
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    from utils.chat_events import chat_event_hub
+
+    monkeypatch.setattr(chat_event_hub, "backend", "memory")
+    return chat_event_hub
+
+
+@pytest.fixture
+def token(auth_headers):
+    return auth_headers["Authorization"].split(" ")[1]
+
+
+def test_websocket_receives_message_events(client, auth_headers, token, hub):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+
+    with client.websocket_connect(f"/messages/{chat_id}/ws?token={token}") as ws:
+        assert ws.receive_json() == {"type": "ready"}
+        message_id = client.post(f"/messages/{chat_id}/send", params={"content": "hi"}, headers=auth_headers).json()["id"]
+        client.put(f"/messages/{message_id}", params={"content": "hello"})
+        client.delete(f"/messages/{message_id}")
+
+        created, updated, deleted = ws.receive_json(), ws.receive_json(), ws.receive_json()
+        assert created["type"] == "message.created"
+        assert created["message"]["id"] == message_id
+        assert created["message"]["content"] == "hi"
+        assert (updated["type"], updated["message"]["content"]) == ("message.updated", "hello")
+        assert deleted == {"type": "message.deleted", "chat_id": chat_id, "message": {"id": message_id, "chat_id": chat_id}}
+
+    assert hub.get_stats()["subscribers"] == 0
+
+
+def test_websocket_resumes_after_last_id(client, auth_headers, token, hub):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    ids = client.post(
+        "/messages/bulk",
+        json={"messages": [{"chat_id": chat_id, "content": f"m{i}"} for i in range(3)]},
+        headers=auth_headers,
+    ).json()["ids"]
+
+    with client.websocket_connect(f"/messages/{chat_id}/ws?token={token}&last_id={ids[0]}") as ws:
+        replayed = [ws.receive_json(), ws.receive_json()]
+        assert [event["message"]["content"] for event in replayed] == ["m1", "m2"]
+        assert ws.receive_json() == {"type": "ready"}
+
+
+def test_websocket_rejects_bad_token_and_missing_chat(client, auth_headers, token, hub):
+    from starlette.websockets import WebSocketDisconnect
+
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    for path in (f"/messages/{chat_id}/ws?token=nope", f"/messages/999/ws?token={token}"):
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect(path) as ws:
+                ws.receive_json()
+        assert exc.value.code == 1008
+
+
+def test_sse_replays_from_last_event_id(client, auth_headers, hub, monkeypatch):
+    import api.message_routes
+
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    ids = client.post(
+        "/messages/bulk",
+        json={"messages": [{"chat_id": chat_id, "content": f"m{i}"} for i in range(3)]},
+        headers=auth_headers,
+    ).json()["ids"]
+    original = api.message_routes.iter_chat_events
+
+    async def until_ready(*args):
+        # The test client waits for the whole body, so end the stream once it goes live
+        async for event in original(*args):
+            yield event
+            if event["type"] == "ready":
+                return
+
+    monkeypatch.setattr(api.message_routes, "iter_chat_events", until_ready)
+    resp = client.get(f"/messages/{chat_id}/events", headers={**auth_headers, "Last-Event-ID": str(ids[0])})
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    frames = [frame.splitlines() for frame in resp.text.strip().split("\n\n")]
+    assert frames[0][:2] == [f"id: {ids[1]}", "event: message.created"]
+    assert json.loads(frames[1][2][len("data: "):])["message"]["content"] == "m2"
+    assert frames[2] == ["event: ready", 'data: {"type": "ready"}']
+
+
+def test_sse_requires_auth(client, auth_headers, hub):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    assert client.get(f"/messages/{chat_id}/events").status_code == 401
+
+
+def test_slow_subscriber_is_told_to_resync():
+    from utils.chat_events import ChatEventHub, RESYNC
+
+    async def scenario():
+        hub = ChatEventHub(backend="memory", queue_size=2)
+        subscription = await hub.subscribe(1)
+        hub.publish([{"type": "message.created", "chat_id": 1, "message": {"id": i, "chat_id": 1}} for i in range(3)])
+        hub.publish([{"type": "message.created", "chat_id": 2, "message": {"id": 9, "chat_id": 2}}])
+        queued = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        await hub.unsubscribe(subscription)
+        return queued, hub.get_stats()
+
+    queued, stats = asyncio.run(scenario())
+    # The overflowing event replaced everything queued, so the client refetches instead of missing one
+    assert queued == [RESYNC]
+    assert stats["delivered"] == 2
+    assert stats["resyncs"] == 1
+    assert stats["subscribers"] == 0
+
+
+def test_async_services_publish_through_the_async_client(client, auth_headers, redis_mock, async_redis_mock):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    message_id = client.post(f"/messages/{chat_id}/send", params={"content": "hi"}, headers=auth_headers).json()["id"]
+
+    publish = async_redis_mock.pipeline.return_value.publish
+    publish.assert_called_once()
+    channel, payload = publish.call_args.args
+    assert (channel, json.loads(payload)["message"]["id"]) == (f"chat_events:{chat_id}", message_id)
+    redis_mock.pipeline.return_value.publish.assert_not_called()
+
+
+def test_other_users_chats_cannot_be_subscribed_to(client, auth_headers, hub, session_factory):
+    from starlette.websockets import WebSocketDisconnect
+    from services.user_service import UserService
+
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    with session_factory() as db:
+        UserService.create_user(db, username="mallory", email="mallory@example.com", password="password123")
+    token = UserService.create_access_token(data={"sub": "mallory@example.com"})
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(f"/messages/{chat_id}/ws?token={token}&last_id=0") as ws:
+            ws.receive_json()
+    assert exc.value.code == 1008
+    assert client.get(f"/messages/{chat_id}/events", params={"token": token, "last_id": 0}).status_code == 404
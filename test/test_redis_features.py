@@ -13,7 +13,7 @@ class MockRedisError(Exception): pass
 mock_redis_module.RedisError = MockRedisError
 
 from utils.rate_limiter import rate_limiter
-from utils.user_logger import log_user_action, get_user_logs
+from utils.user_logger import log_user_action, get_user_logs, flush_user_logs
 from fastapi import Request, HTTPException
 
 def test_rate_limiter_initialization():
@@ -22,8 +22,11 @@ def test_rate_limiter_initialization():
 
 def test_user_logging():
     log_user_action("test_action", {"key": "value"}, user_uuid="test-uuid")
-    mock_redis.lpush.assert_called()
-    mock_redis.ltrim.assert_called_with("user_logs:user_uuid:test-uuid", 0, 99)
+    flush_user_logs()
+    pipeline = mock_redis.pipeline.return_value
+    pipeline.lpush.assert_called()
+    pipeline.ltrim.assert_called_with("user_logs:user_uuid:test-uuid", 0, 99)
+    pipeline.execute.assert_called()
 
 if __name__ == "__main__":
     # Simple manual run if pytest is not used
@@ -0,0 +1,35 @@
+def test_user_responses_never_carry_the_password_hash(client, auth_headers):
+    me = client.get("/users/me", headers=auth_headers).json()
+    listing = client.get("/users/").json()
+    one = client.get(f"/users/{me['id']}").json()
+
+    assert set(me) == {"id", "uuid", "username", "email", "created_at"}
+    assert [user["email"] for user in listing["items"]] == ["alice@example.com"]
+    assert one == me
+    assert all("hashed_password" not in user for user in [me, one, *listing["items"]])
+
+
+def test_chat_and_message_shapes(client, auth_headers):
+    chat = client.post("/chats/new", headers=auth_headers).json()
+    message = client.post(f"/chats/{chat['id']}/messages", params={"content": "hi"}, headers=auth_headers).json()
+
+    assert set(chat) == {"id", "user_id", "requestType", "created_at"}
+    assert message["content"] == "hi" and message["chat_id"] == chat["id"]
+    assert set(message) == {"id", "chat_id", "content", "request_metadata", "file_path", "created_at"}
+    assert client.get("/chats/", headers=auth_headers).json()["items"] == [chat]
+
+
+def test_cache_and_response_model_serialize_chats_alike(client, auth_headers, monkeypatch):
+    import utils.chat_cache
+
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    client.post("/messages/bulk", json={"messages": [{"chat_id": chat_id, "content": f"m{i}"} for i in range(3)]}, headers=auth_headers)
+
+    # redis_mock misses every lookup, so the cache serializes the body itself
+    cached = client.get(f"/messages/{chat_id}", headers=auth_headers)
+    monkeypatch.setattr(utils.chat_cache, "CHAT_CACHE_ENABLED", False)
+    uncached = client.get(f"/messages/{chat_id}", headers=auth_headers)
+
+    assert "ETag" in cached.headers and "ETag" not in uncached.headers
+    assert [message["content"] for message in uncached.json()["messages"]] == ["m0", "m1", "m2"]
+    assert cached.json() == uncached.json()
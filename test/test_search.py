@@ -0,0 +1,59 @@
+def seed_messages(client, auth_headers, contents):
+    chat_id = client.post("/chats/new", headers=auth_headers).json()["id"]
+    client.post("/messages/bulk", json={"messages": [{"chat_id": chat_id, "content": c} for c in contents]}, headers=auth_headers)
+    return chat_id
+
+
+def test_search_is_scoped_to_own_chats(client, auth_headers, session_factory):
+    from services.chat_service import ChatService
+    from services.message_service import MessageService
+    from services.user_service import UserService
+
+    db = session_factory()
+    try:
+        bob = UserService.create_user(db, username="bob", email="bob@example.com", password="password123")
+        MessageService.create_message(db, chat_id=ChatService.create_chat(db, user_id=bob.id).id, content="bob's audio note")
+    finally:
+        db.close()
+    chat_id = seed_messages(client, auth_headers, ["an audio note", "nothing here", "another Audio clip"])
+
+    resp = client.get("/messages/search", params={"q": "audio"}, headers=auth_headers)
+
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [item["highlight"] for item in body["items"]] == ["another Audio clip", "an audio note"]
+    assert {item["chat_id"] for item in body["items"]} == {chat_id}
+    assert body["next_cursor"] is None
+
+
+def test_search_pages_with_cursor(client, auth_headers):
+    seed_messages(client, auth_headers, [f"match {i}" for i in range(5)])
+
+    seen, cursor = [], None
+    while True:
+        params = {"q": "match", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/messages/search", params=params, headers=auth_headers).json()
+        seen += [item["highlight"] for item in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"match {i}" for i in reversed(range(5))]
+
+
+def test_search_rejects_bad_input(client, auth_headers):
+    assert client.get("/messages/search", params={"q": "x", "cursor": "nope"}, headers=auth_headers).status_code == 400
+    assert client.get("/messages/search", params={"q": ""}, headers=auth_headers).status_code == 422
+    assert client.get("/messages/search", params={"q": "x"}).status_code == 401
+
+
+def test_postgres_search_uses_the_gin_index_and_headlines_only_the_page():
+    from sqlalchemy.dialects import postgresql
+    import models.User  # noqa: F401  (resolve relationships)
+    from services.message_service import _search_statement
+
+    sql = str(_search_statement("postgresql", 1, "audio", after=(0.5, 10), limit=20).compile(dialect=postgresql.dialect()))
+    page, outer = sql.split("FROM messages JOIN (", 1)[1], sql.split("FROM messages JOIN (", 1)[0]
+
+    assert "messages.content_tsv @@ websearch_to_tsquery" in page
+    assert "messages.chat_id IN (SELECT chats.id" in page
+    assert "ts_headline" in outer and "ts_headline" not in page
@@ -0,0 +1,62 @@
+import pytest
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_cpu_quota_from_cgroup_v2_and_v1(tmp_path):
+    from server import cgroup_cpu_quota
+
+    write(tmp_path / "v2" / "cpu.max", "250000 100000\n")
+    write(tmp_path / "unlimited" / "cpu.max", "max 100000\n")
+    write(tmp_path / "v1" / "cpu,cpuacct" / "cpu.cfs_quota_us", "150000\n")
+    write(tmp_path / "v1" / "cpu,cpuacct" / "cpu.cfs_period_us", "100000\n")
+    write(tmp_path / "v1-unlimited" / "cpu" / "cpu.cfs_quota_us", "-1\n")
+    write(tmp_path / "v1-unlimited" / "cpu" / "cpu.cfs_period_us", "100000\n")
+
+    assert cgroup_cpu_quota(str(tmp_path / "v2")) == 2.5
+    assert cgroup_cpu_quota(str(tmp_path / "unlimited")) is None
+    assert cgroup_cpu_quota(str(tmp_path / "v1")) == 1.5
+    assert cgroup_cpu_quota(str(tmp_path / "v1-unlimited")) is None
+    assert cgroup_cpu_quota(str(tmp_path / "missing")) is None
+
+
+def test_workers_follow_the_quota(tmp_path, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server.os, "sched_getaffinity", lambda pid: set(range(8)))
+    write(tmp_path / "cpu.max", "250000 100000\n")
+    assert server.available_cpus(str(tmp_path)) == 2
+    write(tmp_path / "cpu.max", "50000 100000\n")
+    assert server.available_cpus(str(tmp_path)) == 1
+    write(tmp_path / "cpu.max", "max 100000\n")
+    assert server.available_cpus(str(tmp_path)) == 8
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3, 8])
+def test_plan_stays_within_the_budgets(workers):
+    from db.config import EngineConfig
+    from server import WorkerPlan
+
+    plan = WorkerPlan(workers, cpus=4, db_budget=80, redis_budget=100, engine_config=EngineConfig("prod"))
+
+    assert plan.db_connections <= 80 and plan.redis_connections <= 100
+    assert plan.db_pool_size >= 1 and plan.redis_max_connections >= 1
+    if workers == 1:
+        # Only ever shrunk: a single worker keeps the profile's pools
+        assert (plan.db_pool_size, plan.db_max_overflow) == (10, 20)
+    env = plan.environ()
+    assert env["DB_POOL_SIZE"] == str(plan.db_pool_size)
+    assert ("LOG_FILE" in env) == (workers > 1)
+
+
+def test_plan_rejects_budgets_too_small_for_the_workers():
+    from db.config import EngineConfig
+    from server import WorkerPlan
+
+    with pytest.raises(ValueError, match="DB_CONNECTION_BUDGET"):
+        WorkerPlan(8, cpus=8, db_budget=10, engine_config=EngineConfig("prod"))
+    with pytest.raises(ValueError, match="REDIS_CONNECTION_BUDGET"):
+        WorkerPlan(8, cpus=8, redis_budget=16, engine_config=EngineConfig("prod"))
@@ -0,0 +1,66 @@
+import json
+from unittest.mock import MagicMock
+import pytest
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    import utils.user_logger
+    from utils.user_logger import ActionLogWriter
+
+    redis = MagicMock()
+    redis.lrange.return_value = []
+    monkeypatch.setattr(utils.user_logger, "get_redis", lambda: redis)
+    # Flushes only happen when the test asks for them
+    writer = ActionLogWriter(batch_size=1000, flush_interval=60)
+    monkeypatch.setattr(utils.user_logger, "action_log_writer", writer)
+    yield writer, redis
+    writer.stop()
+
+
+def test_flush_coalesces_into_one_pipeline(writer):
+    from utils.user_logger import log_user_action, flush_user_logs
+
+    writer, redis = writer
+    for i in range(3):
+        log_user_action("view_chat", {"chat_id": i}, user_uuid="a")
+    log_user_action("login_success", user_uuid="b")
+
+    redis.pipeline.assert_not_called()
+    flush_user_logs()
+
+    pipeline = redis.pipeline.return_value
+    redis.pipeline.assert_called_once_with(transaction=False)
+    pipeline.execute.assert_called_once()
+    assert pipeline.lpush.call_count == 2
+    key, *entries = pipeline.lpush.call_args_list[0].args
+    assert key == "user_logs:user_uuid:a"
+    assert [json.loads(entry)["details"]["chat_id"] for entry in entries] == [0, 1, 2]
+    pipeline.ltrim.assert_any_call("user_logs:user_uuid:a", 0, 99)
+    pipeline.ltrim.assert_any_call("user_logs:user_uuid:b", 0, 99)
+    assert writer.get_stats() == {"flushed": 4, "batches": 1, "failed": 0, "dropped": 0, "pending": 0}
+
+
+def test_get_user_logs_includes_unflushed_entries(writer):
+    from utils.user_logger import log_user_action, get_user_logs
+
+    writer, redis = writer
+    redis.lrange.return_value = [json.dumps({"timestamp": "t0", "action": "login_success", "details": {}})]
+    log_user_action("view_profile", user_uuid="a")
+    log_user_action("view_chat", {"chat_id": 1}, user_uuid="a")
+
+    logs = get_user_logs("user_uuid:a", limit=3)
+    assert [log["action"] for log in logs] == ["view_chat", "view_profile", "login_success"]
+    redis.lrange.assert_called_once_with("user_logs:user_uuid:a", 0, 0)
+
+
+def test_failed_flush_is_counted(writer):
+    from utils.user_logger import log_user_action, flush_user_logs
+
+    writer, redis = writer
+    redis.pipeline.return_value.execute.side_effect = ConnectionError("down")
+    log_user_action("view_profile", user_uuid="a")
+    flush_user_logs()
+
+    assert writer.get_stats()["failed"] == 1
+    assert writer.unflushed("user_logs:user_uuid:a") == []
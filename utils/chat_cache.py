@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+import time
+from fastapi import Request, Response
+from utils.redis_client import get_redis, get_async_redis
+from utils.logger_conf import logger
+
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", 300))
+# Bodies larger than this are served but not stored
+CHAT_CACHE_MAX_BYTES = int(os.getenv("CHAT_CACHE_MAX_BYTES", 256 * 1024))
+# Refreshed by every write and every stored body, so a version outlives the bodies stored under it
+CHAT_VERSION_TTL = max(int(os.getenv("CHAT_VERSION_TTL", 24 * 3600)), CHAT_CACHE_TTL)
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "not_modified": 0, "stored": 0, "skipped_large": 0, "invalidations": 0, "errors": 0}
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_chat_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _version_key(chat_id: int):
+    return f"chat_version:{chat_id}"
+
+
+def _body_key(chat_id: int, version: str, variant: str):
+    return f"chat_cache:{chat_id}:{version}:{variant}"
+
+
+def _new_version():
+    # Versions start from the clock rather than 0, so a version key lost to eviction or
+    # expiry never comes back with a number an old ETag was issued for
+    return time.time_ns()
+
+
+def _bump_version(pipeline, chat_id: int):
+    key = _version_key(chat_id)
+    pipeline.set(key, _new_version(), nx=True, ex=CHAT_VERSION_TTL)
+    pipeline.incr(key)
+    pipeline.expire(key, CHAT_VERSION_TTL)
+
+
+def invalidate_chat(chat_id: int):
+    """Bump the chat's version. Call after the write is committed."""
+    if not CHAT_CACHE_ENABLED:
+        return
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        _bump_version(pipeline, chat_id)
+        pipeline.execute()
+        _count("invalidations")
+    except Exception as e:
+        _count("errors")
+        logger.bind(service="redis").error(f"Failed to invalidate chat cache for chat {chat_id}: {e}")
+
+
+async def invalidate_chat_async(chat_id: int):
+    """invalidate_chat, for callers on the event loop."""
+    if not CHAT_CACHE_ENABLED:
+        return
+    try:
+        pipeline = get_async_redis().pipeline(transaction=False)
+        _bump_version(pipeline, chat_id)
+        await pipeline.execute()
+        _count("invalidations")
+    except Exception as e:
+        _count("errors")
+        logger.bind(service="redis").error(f"Failed to invalidate chat cache for chat {chat_id}: {e}")
+
+
+def _etag(chat_id: int, version: str, variant: str):
+    digest = hashlib.sha1(variant.encode()).hexdigest()[:8]
+    return f'"{chat_id}-{version}-{digest}"'
+
+
+def _matches(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def _json(body: str, headers=None, etag: str = None):
+    headers = dict(headers or {})
+    if etag:
+        headers["ETag"] = etag
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def cached_chat_response(request: Request, chat_id: int, variant: str, load, schema, found=None, headers=None):
+    """
+    Serve `await load()` for a chat from Redis, keyed by the chat's current version,
+    as JSON of the response model `schema`.
+
+    A matching If-None-Match is answered with 304 from the version alone; a stored
+    body is returned as is. Only a miss runs `load`. Returns None when `load` does.
+    A chat without a version gets one only once `found(data)` says the chat exists,
+    so requests for ids that don't exist leave nothing behind in Redis.
+    Any Redis failure falls back to loading from the database, without an ETag.
+
+    Pass the route's injected `response.headers` as `headers`: FastAPI drops them once a
+    Response is returned, so they are copied onto every one built here (rate limits).
+    """
+    if not CHAT_CACHE_ENABLED:
+        # The route's response_model does the serializing
+        return await load()
+
+    redis = get_async_redis()
+    body = None
+    try:
+        version = await redis.get(_version_key(chat_id))
+        if version is not None:
+            etag = _etag(chat_id, version, variant)
+            if _matches(request, etag):
+                _count("not_modified")
+                return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
+            body = await redis.get(_body_key(chat_id, version, variant))
+    except Exception as e:
+        _count("errors")
+        logger.bind(service="redis").error(f"Chat cache unavailable, reading chat {chat_id} from the database: {e}")
+        return await load()
+
+    if body is not None:
+        _count("hits")
+        return _json(body, headers, etag)
+
+    _count("misses")
+    data = await load()
+    if data is None:
+        return None
+    body = schema.model_validate(data).model_dump_json()
+    if version is None and found is not None and not found(data):
+        return _json(body, headers)
+    try:
+        if version is None:
+            # Seeded after the load: if a writer bumped the version meanwhile, what was
+            # loaded may predate its write, so it is neither stored nor given an ETag
+            seeded = _new_version()
+            if not await redis.set(_version_key(chat_id), seeded, nx=True, ex=CHAT_VERSION_TTL):
+                return _json(body, headers)
+            version = str(seeded)
+            etag = _etag(chat_id, version, variant)
+        if len(body) > CHAT_CACHE_MAX_BYTES:
+            _count("skipped_large")
+        else:
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.setex(_body_key(chat_id, version, variant), CHAT_CACHE_TTL, body)
+            pipeline.expire(_version_key(chat_id), CHAT_VERSION_TTL)
+            await pipeline.execute()
+            _count("stored")
+    except Exception as e:
+        _count("errors")
+        logger.bind(service="redis").error(f"Failed to store chat {chat_id} in cache: {e}")
+        return _json(body, headers)
+    return _json(body, headers, etag)
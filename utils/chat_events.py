@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import threading
+from datetime import date, datetime
+from utils.redis_client import get_redis, get_async_redis
+from utils.logger_conf import logger
+
+# "redis": events published by any worker reach subscribers on every worker
+# "memory": delivery within this process only (single worker, tests)
+CHAT_EVENTS_BACKEND = os.getenv("CHAT_EVENTS_BACKEND", "redis")
+# Events buffered per subscriber; a subscriber that falls further behind is told to resync
+CHAT_EVENTS_QUEUE_SIZE = int(os.getenv("CHAT_EVENTS_QUEUE_SIZE", 100))
+CHAT_EVENTS_HEARTBEAT = float(os.getenv("CHAT_EVENTS_HEARTBEAT", 15))
+# Most messages replayed on resume; a client further behind is told to resync
+CHAT_EVENTS_BACKLOG_LIMIT = int(os.getenv("CHAT_EVENTS_BACKLOG_LIMIT", 500))
+
+RESYNC = {"type": "resync"}
+PING = {"type": "ping"}
+READY = {"type": "ready"}
+
+
+def _channel(chat_id: int):
+    return f"chat_events:{chat_id}"
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def message_event(event_type: str, message):
+    """Event for a Message instance or a dict of its columns."""
+    if not isinstance(message, dict):
+        message = {
+            "id": message.id,
+            "chat_id": message.chat_id,
+            "content": message.content,
+            "request_metadata": message.request_metadata,
+            "file_path": message.file_path,
+            "created_at": message.created_at,
+        }
+    return {"type": event_type, "chat_id": message["chat_id"], "message": message}
+
+
+class Subscription:
+    def __init__(self, chat_id: int, queue_size: int):
+        self.chat_id = chat_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def offer(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # Too slow to keep up: what's queued is incomplete anyway, replace it with a resync
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return False
+
+    async def get(self, timeout: float = CHAT_EVENTS_HEARTBEAT):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return PING
+
+
+class ChatEventHub:
+    """
+    Per-worker fan-out of chat events to locally connected clients.
+
+    With the redis backend the worker holds a single pub/sub connection, subscribed to
+    the channels of chats that have at least one local subscriber; one listener task
+    decodes each event once and hands it to every local subscriber's queue. Publishing
+    is a plain PUBLISH from whichever worker handled the write.
+    """
+
+    def __init__(self, backend: str = CHAT_EVENTS_BACKEND, queue_size: int = CHAT_EVENTS_QUEUE_SIZE):
+        if backend not in ("redis", "memory"):
+            raise ValueError(f"Unknown chat events backend: {backend}")
+        self.backend = backend
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._loop = None
+        self._pubsub = None
+        self._listener = None
+        self._lock = None
+        self._stats_lock = threading.Lock()
+        self.stats = {"published": 0, "received": 0, "delivered": 0, "resyncs": 0, "publish_errors": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+    # Publishing: called from services after commit; publish_async on the loop, publish from worker threads
+
+    def publish(self, events):
+        if not events:
+            return
+        if self.backend == "memory":
+            for event in events:
+                self._deliver_threadsafe(event["chat_id"], event)
+            self._count("published", len(events))
+            return
+        try:
+            pipeline = get_redis().pipeline(transaction=False)
+            for event in events:
+                pipeline.publish(_channel(event["chat_id"]), json.dumps(event, default=_default))
+            pipeline.execute()
+            self._count("published", len(events))
+        except Exception as e:
+            self._count("publish_errors")
+            logger.bind(service="redis").error(f"Failed to publish {len(events)} chat events: {e}")
+
+    async def publish_async(self, events):
+        """publish, for callers on the event loop."""
+        if not events:
+            return
+        if self.backend == "memory":
+            self.publish(events)
+            return
+        try:
+            pipeline = get_async_redis().pipeline(transaction=False)
+            for event in events:
+                pipeline.publish(_channel(event["chat_id"]), json.dumps(event, default=_default))
+            await pipeline.execute()
+            self._count("published", len(events))
+        except Exception as e:
+            self._count("publish_errors")
+            logger.bind(service="redis").error(f"Failed to publish {len(events)} chat events: {e}")
+
+    def _deliver_threadsafe(self, chat_id: int, event: dict):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        # Round-trip through JSON so every backend hands subscribers the same shape
+        event = json.loads(json.dumps(event, default=_default))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(chat_id, event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, chat_id, event)
+
+    def _deliver(self, chat_id: int, event: dict):
+        for subscription in list(self._subscribers.get(chat_id, ())):
+            if subscription.offer(event):
+                self._count("delivered")
+            else:
+                self._count("resyncs")
+
+    # Subscribing: on the event loop
+
+    async def subscribe(self, chat_id: int):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # First subscriber, or a new event loop (tests, reloads): start over on this one
+            self._loop, self._lock = loop, asyncio.Lock()
+            self._subscribers, self._pubsub, self._listener = {}, None, None
+        subscription = Subscription(chat_id, self.queue_size)
+        async with self._lock:
+            subscribers = self._subscribers.setdefault(chat_id, set())
+            if not subscribers and self.backend == "redis":
+                if self._pubsub is None:
+                    self._pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+                await self._pubsub.subscribe(_channel(chat_id))
+                if self._listener is None:
+                    self._listener = asyncio.create_task(self._listen(self._pubsub))
+            subscribers.add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription):
+        async with self._lock:
+            subscribers = self._subscribers.get(subscription.chat_id)
+            if not subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.chat_id]
+                if self.backend == "redis" and self._pubsub is not None:
+                    try:
+                        await self._pubsub.unsubscribe(_channel(subscription.chat_id))
+                    except Exception as e:
+                        logger.bind(service="redis").error(f"Failed to unsubscribe from chat {subscription.chat_id}: {e}")
+
+    async def _listen(self, pubsub):
+        # Runs until close() (or a new event loop) detaches this pub/sub connection
+        while self._pubsub is pubsub:
+            try:
+                if not pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Anything published meanwhile is lost: have every local subscriber resync.
+                # The pub/sub connection resubscribes its channels when it reconnects.
+                logger.bind(service="redis").error(f"Chat events subscription failed, resyncing subscribers: {e}")
+                for subscriptions in list(self._subscribers.values()):
+                    for subscription in list(subscriptions):
+                        subscription.offer(RESYNC)
+                await asyncio.sleep(1)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            self._count("received")
+            try:
+                chat_id = int(message["channel"].split(":", 1)[1])
+                event = json.loads(message["data"])
+            except (ValueError, IndexError):
+                continue
+            self._deliver(chat_id, event)
+
+    async def close(self):
+        pubsub, self._pubsub = self._pubsub, None
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.cancel()
+            await asyncio.wait({listener}, timeout=2)
+        if pubsub is not None:
+            await pubsub.aclose()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update(
+            backend=self.backend,
+            chats=len(self._subscribers),
+            subscribers=sum(len(subscribers) for subscribers in self._subscribers.values()),
+        )
+        return stats
+
+
+chat_event_hub = ChatEventHub()
+
+
+def publish_message_events(event_type: str, messages):
+    chat_event_hub.publish([message_event(event_type, message) for message in messages])
+
+
+async def publish_message_events_async(event_type: str, messages):
+    await chat_event_hub.publish_async([message_event(event_type, message) for message in messages])
+
+
+async def iter_chat_events(chat_id: int, last_id: int = None, load_backlog=None):
+    """
+    Events for one chat, as dicts, until the consumer stops iterating.
+
+    With `last_id`, messages created after it are replayed first through
+    `load_backlog(last_id, limit)`; the subscription is opened before that query so
+    nothing created in between is missed, and live duplicates of replayed messages
+    are skipped. A PING is yielded after CHAT_EVENTS_HEARTBEAT idle seconds.
+    """
+    subscription = await chat_event_hub.subscribe(chat_id)
+    try:
+        seen = last_id
+        if last_id is not None and load_backlog is not None:
+            backlog = await load_backlog(last_id, CHAT_EVENTS_BACKLOG_LIMIT + 1)
+            if len(backlog) > CHAT_EVENTS_BACKLOG_LIMIT:
+                yield RESYNC
+            else:
+                for message in backlog:
+                    yield json.loads(json.dumps(message_event("message.created", message), default=_default))
+                    seen = message.id
+        # Everything from here on is live
+        yield READY
+        while True:
+            event = await subscription.get()
+            if event.get("type") == "message.created" and seen is not None and event["message"]["id"] <= seen:
+                continue
+            yield event
+    finally:
+        await chat_event_hub.unsubscribe(subscription)
+
+
+def get_chat_event_stats():
+    return chat_event_hub.get_stats()
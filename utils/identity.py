@@ -0,0 +1,70 @@
+from datetime import datetime
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.routing import bind_client_async
+from models.User import User
+from services.user_service import UserService, AsyncUserService
+from utils.identity_cache import get_identity_async, set_identity_async
+
+# hashed_password is deliberately left out of the cached snapshot
+_SNAPSHOT_FIELDS = ("id", "uuid", "username", "email")
+
+
+def _snapshot(user: User):
+    data = {field: getattr(user, field) for field in _SNAPSHOT_FIELDS}
+    data["created_at"] = user.created_at.isoformat() if user.created_at else None
+    return data
+
+
+def _from_snapshot(data: dict):
+    created_at = data.get("created_at")
+    return User(
+        **{field: data.get(field) for field in _SNAPSHOT_FIELDS},
+        created_at=datetime.fromisoformat(created_at) if created_at else None,
+    )
+
+
+def get_token_payload(request: Request, token: str = None):
+    """Decode the bearer token at most once per request."""
+    if hasattr(request.state, "token_payload"):
+        return request.state.token_payload
+
+    if token is None:
+        auth_header = request.headers.get("Authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            token = auth_header.split(" ")[1]
+
+    payload = UserService.decode_access_token(token) if token else None
+    request.state.token_payload = payload
+    return payload
+
+
+async def resolve_user_async(request: Request, db: AsyncSession, token: str = None):
+    """
+    Resolve the authenticated user once per request and memoize it on request.state,
+    so RateLimiter and get_current_user share one JWT decode and at most one query.
+    """
+    if getattr(request.state, "identity_resolved", False):
+        return request.state.user
+    # Dependencies and the route run in one context: bound once, it holds for the request
+    email = _subject(request, token)
+    await bind_client_async(email)
+
+    data = await get_identity_async(email) if email else None
+    user = _from_snapshot(data) if data is not None else None
+    if email and user is None:
+        user = await AsyncUserService.get_user_by_email(db, email)
+        if user:
+            await set_identity_async(email, _snapshot(user))
+    return _remember(request, user)
+
+
+def _subject(request: Request, token: str = None):
+    payload = get_token_payload(request, token)
+    return payload.get("sub") if payload else None
+
+
+def _remember(request: Request, user):
+    request.state.user = user
+    request.state.identity_resolved = True
+    return user
@@ -0,0 +1,101 @@
+import json
+import os
+from utils.lru_cache import LRUCache
+from utils.redis_client import get_redis, get_async_redis
+from utils.logger_conf import logger
+
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", 1024))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", 60))
+IDENTITY_REDIS_ENABLED = os.getenv("IDENTITY_REDIS_ENABLED", "false").lower() in ("1", "true", "yes")
+IDENTITY_REDIS_TTL = int(os.getenv("IDENTITY_REDIS_TTL", 300))
+
+# In-process tier. Other workers only see an invalidation through the Redis tier,
+# so the local TTL is what bounds staleness after a user is deleted elsewhere.
+_local_cache = LRUCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL)
+
+
+def _redis_key(subject: str):
+    return f"identity:{subject}"
+
+
+def get_identity(subject: str):
+    data = _local_cache.get(subject)
+    if data is not None:
+        return data
+
+    if not IDENTITY_REDIS_ENABLED:
+        return None
+
+    try:
+        raw = get_redis().get(_redis_key(subject))
+    except Exception as e:
+        logger.bind(service="redis").error(f"Failed to read identity cache: {e}")
+        return None
+
+    if not raw:
+        return None
+    data = json.loads(raw)
+    _local_cache.set(subject, data)
+    return data
+
+
+async def get_identity_async(subject: str):
+    """get_identity for the event loop: the Redis tier goes through the async client."""
+    data = _local_cache.get(subject)
+    if data is not None:
+        return data
+
+    if not IDENTITY_REDIS_ENABLED:
+        return None
+
+    try:
+        raw = await get_async_redis().get(_redis_key(subject))
+    except Exception as e:
+        logger.bind(service="redis").error(f"Failed to read identity cache: {e}")
+        return None
+
+    if not raw:
+        return None
+    data = json.loads(raw)
+    _local_cache.set(subject, data)
+    return data
+
+
+def set_identity(subject: str, data: dict):
+    _local_cache.set(subject, data)
+    if IDENTITY_REDIS_ENABLED:
+        try:
+            get_redis().setex(_redis_key(subject), IDENTITY_REDIS_TTL, json.dumps(data))
+        except Exception as e:
+            logger.bind(service="redis").error(f"Failed to write identity cache: {e}")
+
+
+async def set_identity_async(subject: str, data: dict):
+    _local_cache.set(subject, data)
+    if IDENTITY_REDIS_ENABLED:
+        try:
+            await get_async_redis().setex(_redis_key(subject), IDENTITY_REDIS_TTL, json.dumps(data))
+        except Exception as e:
+            logger.bind(service="redis").error(f"Failed to write identity cache: {e}")
+
+
+def invalidate_identity(subject: str):
+    _local_cache.pop(subject)
+    if IDENTITY_REDIS_ENABLED:
+        try:
+            get_redis().delete(_redis_key(subject))
+        except Exception as e:
+            logger.bind(service="redis").error(f"Failed to invalidate identity cache: {e}")
+
+
+async def invalidate_identity_async(subject: str):
+    _local_cache.pop(subject)
+    if IDENTITY_REDIS_ENABLED:
+        try:
+            await get_async_redis().delete(_redis_key(subject))
+        except Exception as e:
+            logger.bind(service="redis").error(f"Failed to invalidate identity cache: {e}")
+
+
+def clear_identity_cache():
+    _local_cache.clear()
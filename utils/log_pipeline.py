@@ -0,0 +1,206 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 256))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.2))
+# "drop": discard new records while the queue is full
+# "sample": past the high watermark keep only 1 in LOG_SAMPLE_RATE records below WARNING
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "sample")
+LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", 10))
+LOG_HIGH_WATERMARK = float(os.getenv("LOG_HIGH_WATERMARK", 0.8))
+
+WARNING_NO = 30
+
+
+class RotatingFileWriter:
+    """Appends already-formatted lines to `path`, rotating it once it exceeds `max_bytes`."""
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write_lines(self, lines):
+        self._file.write("".join(lines))
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        root, ext = os.path.splitext(self.path)
+        os.rename(self.path, f"{root}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')}{ext}")
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
+
+
+class StreamWriter:
+    """
+    Writes lines to `stream`, flushing at most `chunk_bytes` of whole lines at a time.
+    Several processes sharing one stdout pipe each write below PIPE_BUF, so a write
+    lands in one piece and their lines never interleave mid-line.
+    """
+
+    def __init__(self, stream, chunk_bytes: int | None = None):
+        self._stream = stream
+        self.chunk_bytes = chunk_bytes
+
+    def write_lines(self, lines):
+        if not self.chunk_bytes:
+            self._stream.write("".join(lines))
+            self._stream.flush()
+            return
+        chunk, size = [], 0
+        for line in lines:
+            length = len(line) if line.isascii() else len(line.encode())
+            if chunk and size + length > self.chunk_bytes:
+                self._stream.write("".join(chunk))
+                self._stream.flush()
+                chunk, size = [], 0
+            chunk.append(line)
+            size += length
+        if chunk:
+            self._stream.write("".join(chunk))
+            self._stream.flush()
+
+    def close(self):
+        pass
+
+
+class BatchingSink:
+    """
+    Loguru sink that only appends the record to an in-memory buffer on the calling
+    thread. A background thread formats and writes records in batches, so request
+    handlers never wait on serialization or file/console IO.
+
+    Each output is a (formatter, writer) pair: formatter(record) -> str line.
+    """
+
+    def __init__(
+        self,
+        outputs,
+        max_queue: int = LOG_QUEUE_SIZE,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        overflow_policy: str = LOG_OVERFLOW_POLICY,
+        sample_rate: int = LOG_SAMPLE_RATE,
+        high_watermark: float = LOG_HIGH_WATERMARK,
+    ):
+        if overflow_policy not in ("drop", "sample"):
+            raise ValueError(f"Unknown log overflow policy: {overflow_policy}")
+        self.outputs = outputs
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.sample_rate = max(1, sample_rate)
+        self._high_watermark = int(max_queue * high_watermark)
+        # deque.append/popleft are atomic, so the hot path takes no lock
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._writing = False
+        self._write_through = False
+        self._write_lock = threading.Lock()
+        self._sample_counter = 0
+        self._stats_lock = threading.Lock()
+        self.stats = {"written": 0, "dropped": 0, "sampled_out": 0, "batches": 0, "write_errors": 0}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+    # Called by loguru on the logging thread. Must stay cheap.
+    def write(self, message):
+        record = message.record
+        if self._write_through:
+            self._write_batch([record])
+            return
+        depth = len(self._buffer)
+        if depth >= self._high_watermark:
+            if depth >= self.max_queue:
+                self._count("dropped")
+                return
+            if self.overflow_policy == "sample" and record["level"].no < WARNING_NO:
+                self._sample_counter += 1
+                if self._sample_counter % self.sample_rate:
+                    self._count("sampled_out")
+                    return
+        self._buffer.append(record)
+        if depth + 1 >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while self._buffer:
+                self._writing = True
+                batch = []
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(self._buffer.popleft())
+                except IndexError:
+                    pass
+                self._write_batch(batch)
+            self._writing = False
+            if self._stopped.is_set() and not self._buffer:
+                return
+
+    def _write_batch(self, batch):
+        with self._write_lock:
+            for formatter, writer in self.outputs:
+                try:
+                    writer.write_lines([formatter(record) for record in batch])
+                except Exception:
+                    # Can't log about logging failures; count them instead
+                    self._count("write_errors")
+        self._count("written", len(batch))
+        self._count("batches")
+
+    def drain(self, timeout: float = 5.0):
+        """Block until everything buffered so far has been written."""
+        deadline = time.monotonic() + timeout
+        self._wakeup.set()
+        while time.monotonic() < deadline:
+            if not self._buffer and not self._writing:
+                return True
+            time.sleep(0.005)
+        return False
+
+    def write_through(self, timeout: float = 5.0):
+        """
+        Write what is buffered, then write every later record on the calling thread.
+        For shutdown paths that end without atexit: uvicorn finishes a graceful stop
+        by re-raising SIGTERM with its default action.
+        """
+        self.drain(timeout)
+        self._write_through = True
+        # A record may have been queued between the drain and the switch
+        self.drain(timeout)
+
+    # Called by loguru on logger.remove(), and at interpreter exit
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        for _, writer in self.outputs:
+            writer.close()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = len(self._buffer)
+        return stats
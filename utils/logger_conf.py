@@ -2,8 +2,18 @@ import logging
 import sys
 import os
 import json
+import select
 from datetime import datetime
 from loguru import logger
+from db.config import EngineConfig
+from utils.log_pipeline import BatchingSink, RotatingFileWriter, StreamWriter
+
+# Each process needs a file of its own: rotation renames the file under every other
+# writer. "{pid}" is replaced with the process id; the multi-worker runner sets
+# logs/app.{pid}.log.
+LOG_FILE = os.getenv("LOG_FILE", "logs/app.log")
+
+_log_sink = None
 
 class InterceptHandler(logging.Handler):
     def emit(self, record):
@@ -21,12 +31,10 @@ class InterceptHandler(logging.Handler):
         elif "redis" in record.name:
             service = "redis"
         
-        frame, depth = sys._getframe(6), 6
-        while frame and frame.f_code.co_filename == logging.__file__:
-            frame = frame.f_back
-            depth += 1
-        
-        logger.opt(depth=depth, exception=record.exc_info).bind(service=service).log(level, record.getMessage())
+        # The stdlib record already carries its call site, so bind it instead of
+        # walking the stack to find the caller's frame
+        origin = (record.name, record.funcName, record.lineno)
+        logger.opt(exception=record.exc_info).bind(service=service, origin=origin).log(level, record.getMessage())
 
 def serialize(record):
     service = record["extra"].get("service")
@@ -60,26 +68,41 @@ def serialize(record):
 
     return json.dumps(subset) + "\n"
 
-def setup_logging():
-    if not os.path.exists("logs"):
-        os.makedirs("logs")
+def format_console(record):
+    name, function, line = record["extra"].get("origin") or (record["name"], record["function"], record["line"])
+    timestamp = record["time"].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    text = f"{timestamp} | {record['level'].name:<8} | {name}:{function}:{line} - {record['message']}\n"
+    if record["exception"]:
+        import traceback
+        text += "".join(traceback.format_exception(record["exception"].type, record["exception"].value, record["exception"].traceback))
+    return text
 
-    logger.remove()
+def get_log_stats():
+    return _log_sink.get_stats() if _log_sink else {}
+
+def write_logs_through():
+    # For the last moments of a process that may be killed rather than exit
+    if _log_sink:
+        _log_sink.write_through()
+
+def setup_logging():
+    global _log_sink
 
-    def json_injector(record):
-        record["extra"]["json_format"] = serialize(record)
-        return True
+    log_file = LOG_FILE.format(pid=os.getpid())
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
 
-    # 1. CONSOLE (Keep colorful for dev)
-    logger.add(sys.stdout, colorize=True, level="DEBUG")
+    logger.remove()
 
-    # 2. Unified JSON Log File
+    # Console and the unified JSON log file share one background writer: the request
+    # thread only enqueues the record, formatting and IO happen in batches off-thread.
+    _log_sink = BatchingSink([
+        (format_console, StreamWriter(sys.stdout, chunk_bytes=select.PIPE_BUF)),
+        (serialize, RotatingFileWriter(log_file, max_bytes=10 * 1024 * 1024)),
+    ])
     logger.add(
-        "logs/app.log",
-        format="{extra[json_format]}",
-        filter=json_injector,
+        _log_sink,
+        format="{message}",
         level="DEBUG",
-        rotation="10 MB",
         backtrace=False,
         diagnose=False,
         catch=False
@@ -106,7 +129,13 @@ def setup_logging():
 
     sys.excepthook = handle_exception
 
+    # The root logger is at level 0, so without an explicit level SQLAlchemy would log
+    # every statement even with echo=False. SQL is only logged when the profile echoes.
+    sql_level = logging.INFO if EngineConfig().echo else logging.WARNING
+
     for name in loggers:
         _logger = logging.getLogger(name)
         _logger.handlers = [InterceptHandler()]
-        _logger.propagate = False
\ No newline at end of file
+        _logger.propagate = False
+        if name.startswith("sqlalchemy"):
+            _logger.setLevel(sql_level)
\ No newline at end of file
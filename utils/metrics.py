@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+
+# Prometheus text exposition, without a client library: a handful of labelled counters,
+# gauges and histograms, updated under one lock per metric.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return series[2] if series else 0
+
+    def sum(self, *labels):
+        series = self._values.get(labels)
+        return series[1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(series[0]), series[1], series[2]) for labels, series in self._values.items()}
+        names = self.labels + ("le",)
+        for labels, (buckets, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), buckets):
+                cumulative += bucket
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {count}"
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency, until the response body is sent", ("method", "route"))
+REQUESTS = Counter("http_requests_total", "Requests by status code", ("method", "route", "status"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled", ("method",))
+REQUEST_DB_QUERIES = Histogram("http_request_db_queries", "Database queries per request", ("method", "route"), COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time in database queries per request", ("method", "route"))
+REQUEST_REDIS_CALLS = Histogram("http_request_redis_calls", "Redis round trips per request", ("method", "route"), COUNT_BUCKETS)
+DB_QUERIES = Counter("db_queries_total", "Database queries, in and out of requests", ("engine",))
+DB_SECONDS = Counter("db_query_seconds_total", "Time in database queries", ("engine",))
+REDIS_CALLS = Counter("redis_calls_total", "Redis round trips", ("component",))
+DB_ROUTED_READS = Counter("db_routed_reads_total", "Replica-eligible reads by where they went", ("target",))
+DB_REPLICA_LAG = Gauge("db_replica_lag_seconds", "Replica lag at the last heartbeat check", ("replica",))
+DB_REPLICA_HEALTHY = Gauge("db_replica_healthy", "1 while the replica serves reads", ("replica",))
+
+METRICS = (
+    REQUEST_LATENCY, REQUESTS, IN_FLIGHT, REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, REQUEST_REDIS_CALLS,
+    DB_QUERIES, DB_SECONDS, REDIS_CALLS, DB_ROUTED_READS, DB_REPLICA_LAG, DB_REPLICA_HEALTHY,
+)
+
+
+class RequestStats:
+    __slots__ = ("db_queries", "db_seconds", "redis_calls")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_calls = 0
+
+
+# Set by the middleware for the duration of a request. The object is shared, not copied,
+# so queries run in the threadpool or in SQLAlchemy's greenlets still add to it.
+_request_stats = ContextVar("request_stats", default=None)
+
+
+def count_redis(component: str, calls: int = 1):
+    """Record Redis round trips; attributed to the current request when there is one."""
+    if not METRICS_ENABLED:
+        return
+    REDIS_CALLS.inc(component, amount=calls)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.redis_calls += calls
+
+
+def instrument_engine(engine, name: str):
+    """
+    Time every statement on a (sync) engine; pass async_engine.sync_engine for async ones.
+    Returns the (event, listener) pairs registered, for event.remove().
+    """
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+        DB_QUERIES.inc(name)
+        DB_SECONDS.inc(name, amount=elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += elapsed
+
+    listeners = [("before_cursor_execute", before_cursor_execute), ("after_cursor_execute", after_cursor_execute)]
+    for identifier, fn in listeners:
+        event.listen(engine, identifier, fn)
+    return listeners
+
+
+def _route_template(scope):
+    # Included routers keep their routes' own paths ("/{chat_id}"), so put the mount
+    # prefix back from the concrete path. Unmatched paths share one label.
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    template = getattr(route, "path_format", None) or route.path
+    try:
+        concrete = template.format(**{key: str(value) for key, value in scope.get("path_params", {}).items()})
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope.get("path", "")
+    if path.endswith(concrete):
+        return path[: len(path) - len(concrete)] + template
+    return template
+
+
+class MetricsMiddleware:
+    """Pure ASGI, so streaming responses aren't buffered and the per-request cost stays small."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec(method)
+            _request_stats.reset(token)
+            route = _route_template(scope)
+            REQUEST_LATENCY.observe(elapsed, method, route)
+            REQUESTS.inc(method, route, status)
+            REQUEST_DB_QUERIES.observe(stats.db_queries, method, route)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, method, route)
+            REQUEST_REDIS_CALLS.observe(stats.redis_calls, method, route)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,31 @@
+import json
+import os
+from datetime import date, datetime
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+async def iter_ndjson(db: AsyncSession, stmt, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Run `stmt` on a server-side cursor and yield its rows as NDJSON, one chunk of
+    `chunk_size` rows per yield. Only the current chunk is ever held in memory, so
+    this stays flat however many rows the statement returns. `stmt` should select
+    columns rather than entities, to skip building ORM objects.
+    """
+    result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+    async for rows in result.mappings().partitions():
+        yield "".join(json.dumps(dict(row), default=_default, separators=(",", ":")) + "\n" for row in rows).encode()
+
+
+def ndjson_response(db: AsyncSession, stmt, filename: str = None):
+    # The request's session stays open until the body has been streamed
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'} if filename else None
+    return StreamingResponse(iter_ndjson(db, stmt), media_type="application/x-ndjson", headers=headers)
@@ -0,0 +1,78 @@
+import base64
+import json
+import os
+from datetime import datetime
+from fastapi import HTTPException, Query
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 100))
+
+
+def encode_cursor(created_at: datetime, row_id: int):
+    raw = json.dumps({"c": created_at.isoformat(), "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data["c"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def encode_rank_cursor(rank: float, row_id: int):
+    # Search results are ordered by (rank, id) rather than (created_at, id)
+    raw = json.dumps({"r": rank, "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(data["r"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+class PageParams:
+    """Query parameters of a keyset-paginated listing: ?cursor=...&limit=..."""
+
+    def __init__(self, cursor: str = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+        self.cursor = cursor
+        self.limit = limit
+        try:
+            self.after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+def keyset(stmt, model, after=None, limit: int = DEFAULT_PAGE_SIZE, descending: bool = False):
+    """
+    Order `stmt` by (created_at, id) and start right after the `after` position.
+    With a composite index ending in (created_at, id) every page is a single index
+    range scan, so page N costs the same as page 1. Fetches one extra row to detect
+    whether another page exists.
+    """
+    key = tuple_(model.created_at, model.id)
+    if after is not None:
+        # The bare created_at bound is implied by the row comparison; it is what Postgres
+        # prunes the partitions of a partitioned table (messages, user_actions) by
+        stmt = stmt.filter(model.created_at <= after[0] if descending else model.created_at >= after[0])
+        stmt = stmt.filter(key < after if descending else key > after)
+    if descending:
+        stmt = stmt.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        stmt = stmt.order_by(model.created_at, model.id)
+    return stmt.limit(limit + 1)
+
+
+def build_page(rows, limit: int):
+    rows = list(rows)
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from utils.logger_conf import logger
+
+# "thread" is enough for argon2, which releases the GIL while hashing; "process" also
+# isolates the memory_cost allocations from the API process
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Hashes running or waiting; past this, login and signup answer 503 right away
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", PASSWORD_HASH_WORKERS * 8))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", 1))
+# Changing these rehashes stored passwords on the next successful login
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+
+# Upper bounds (ms) of the hash time histogram buckets; the last bucket is +Inf
+HASH_TIME_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+
+password_hash = PasswordHash((
+    Argon2Hasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST, parallelism=ARGON2_PARALLELISM),
+))
+
+
+# Module level so they can be sent to a process pool
+def hash_password(password: str):
+    return password_hash.hash(password)
+
+
+def verify_password(password: str, hashed_password: str):
+    return password_hash.verify(password, hashed_password)
+
+
+def verify_and_update(password: str, hashed_password: str):
+    """(valid, new_hash); new_hash is set when the stored hash used outdated parameters."""
+    return password_hash.verify_and_update(password, hashed_password)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+class HashingExecutor:
+    """
+    Dedicated, bounded pool for password hashing, so a burst of logins can't occupy
+    the threadpool every other sync route and dependency runs on. Work beyond
+    `queue_size` outstanding hashes is rejected with 503 instead of queueing.
+    """
+
+    def __init__(
+        self,
+        kind: str = PASSWORD_HASH_EXECUTOR,
+        workers: int = PASSWORD_HASH_WORKERS,
+        queue_size: int = PASSWORD_HASH_QUEUE_SIZE,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = max(workers, queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._buckets = [0] * (len(HASH_TIME_BUCKETS_MS) + 1)
+        self.stats = {"completed": 0, "rejected": 0, "errors": 0, "hash_time_sum_ms": 0.0, "hash_time_max_ms": 0.0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _reserve(self):
+        with self._lock:
+            if self._outstanding >= self.queue_size:
+                self.stats["rejected"] += 1
+                rejected = True
+            else:
+                self._outstanding += 1
+                rejected = False
+        if rejected:
+            logger.bind(service="security").warning(f"Password hashing saturated ({self.queue_size} outstanding), rejecting")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, try again shortly",
+                headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+            )
+
+    def _observe(self, elapsed_ms: float):
+        index = len(HASH_TIME_BUCKETS_MS)
+        for i, bound in enumerate(HASH_TIME_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self._buckets[index] += 1
+            self.stats["completed"] += 1
+            self.stats["hash_time_sum_ms"] += elapsed_ms
+            self.stats["hash_time_max_ms"] = max(self.stats["hash_time_max_ms"], elapsed_ms)
+
+    def _release(self, future):
+        with self._lock:
+            self._outstanding -= 1
+        if future.cancelled() or future.exception() is not None:
+            with self._lock:
+                self.stats["errors"] += 1
+            return
+        self._observe(future.result()[1])
+
+    def submit(self, fn, *args):
+        """concurrent.futures.Future of (result, elapsed_ms); raises 503 when saturated."""
+        self._reserve()
+        try:
+            future = self._get_executor().submit(_timed, fn, *args)
+        except BaseException:
+            with self._lock:
+                self._outstanding -= 1
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args):
+        result, _ = await asyncio.wrap_future(self.submit(fn, *args))
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            buckets = list(self._buckets)
+            outstanding = self._outstanding
+        cumulative, histogram = 0, {}
+        for bound, count in zip(list(HASH_TIME_BUCKETS_MS) + ["+Inf"], buckets):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        stats.update(
+            executor=self.kind,
+            workers=self.workers,
+            queue_size=self.queue_size,
+            outstanding=outstanding,
+            # Submitted but not picked up by a worker yet
+            queue_depth=max(0, outstanding - self.workers),
+            hash_time_sum_ms=round(stats["hash_time_sum_ms"], 3),
+            hash_time_max_ms=round(stats["hash_time_max_ms"], 3),
+            hash_time_histogram_ms=histogram,
+        )
+        return stats
+
+
+hashing_executor = HashingExecutor()
+
+
+def get_hashing_stats():
+    return hashing_executor.get_stats()
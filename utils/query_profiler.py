@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import greenlet
+from sqlalchemy import event
+from utils.logger_conf import logger
+from utils.metrics import _route_template
+
+# Dev-mode statement profiling: every query of a request is recorded with the line of
+# application code that issued it. Off by default; it walks the stack on every query.
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", "false").lower() == "true"
+# The same statement shape this many times in one request is reported as a likely N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_DIRS = (os.path.join(_ROOT, "db") + os.sep, os.path.join(_ROOT, "utils") + os.sep)
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|\$\d+|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)", re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str):
+    """The statement with literals and IN lists folded, so repeats with other values match."""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return _LITERAL.sub("?", shape)
+
+
+def _call_site():
+    # Innermost application frame outside db/ and utils/ (sessions, caches, this module)
+    frame, current = sys._getframe(2), greenlet.getcurrent()
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and not filename.startswith(_SKIP_DIRS) and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, _ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+        if frame is None and current.parent is not None:
+            # The greenlet's stack ends at its spawn; the awaiting coroutines are in its parent
+            current = current.parent
+            frame = current.gr_frame
+    return "unknown"
+
+
+class QueryRecord:
+    __slots__ = ("statement", "shape", "duration_ms", "call_site")
+
+    def __init__(self, statement: str, duration_ms: float, call_site: str):
+        self.statement = statement
+        self.shape = statement_shape(statement)
+        self.duration_ms = duration_ms
+        self.call_site = call_site
+
+
+class QueryProfile:
+    def __init__(self, route: str = ""):
+        self.route = route
+        self.queries = []
+
+    def repeated(self, threshold: int = None):
+        """(shape, count, first call site) for shapes issued at least `threshold` times."""
+        threshold = QUERY_REPEAT_THRESHOLD if threshold is None else threshold
+        by_shape = {}
+        for query in self.queries:
+            by_shape.setdefault(query.shape, []).append(query)
+        return [(shape, len(queries), queries[0].call_site) for shape, queries in by_shape.items() if len(queries) >= threshold]
+
+    def slow(self, budget_ms: float = None):
+        budget_ms = SLOW_QUERY_MS if budget_ms is None else budget_ms
+        return [query for query in self.queries if query.duration_ms >= budget_ms]
+
+    def describe(self):
+        lines = [f"{len(self.queries)} queries in {self.route or 'this block'}:"]
+        lines += [f"  {query.duration_ms:7.2f}ms  {query.call_site}  {query.shape}" for query in self.queries]
+        return "\n".join(lines)
+
+
+_profile = ContextVar("query_profile", default=None)
+# Finished request profiles are handed to these (see query_budget)
+_collectors = []
+
+
+def profile_engine(engine):
+    """Record statements on a (sync) engine into the active profile; returns the listeners."""
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _profile.get() is not None:
+            conn.info["profile_started"] = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _profile.get()
+        started = conn.info.pop("profile_started", None)
+        if profile is None or started is None:
+            return
+        profile.queries.append(QueryRecord(statement, (time.perf_counter() - started) * 1000, _call_site()))
+
+    listeners = [("before_cursor_execute", before_cursor_execute), ("after_cursor_execute", after_cursor_execute)]
+    for identifier, fn in listeners:
+        event.listen(engine, identifier, fn)
+    return listeners
+
+
+@contextmanager
+def profile_queries(route: str = ""):
+    """Profile the statements run in this block (and in tasks or threads it starts)."""
+    profile = QueryProfile(route)
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def report(profile: QueryProfile):
+    log = logger.bind(service="database", track=f"route:{profile.route}")
+    for shape, count, call_site in profile.repeated():
+        log.warning(f"Possible N+1 in {profile.route}: {count}x {shape} | first at {call_site}")
+    for query in profile.slow():
+        log.warning(f"Slow query in {profile.route}: {query.duration_ms:.0f}ms {query.shape} | at {query.call_site}")
+
+
+class QueryProfilerMiddleware:
+    """Profiles each HTTP request and reports repeated and slow statements to the log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries() as profile:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profile.route = f"{scope['method']} {_route_template(scope)}"
+                report(profile)
+                for collect in list(_collectors):
+                    collect(profile)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """
+    Fail if any request profiled by QueryProfilerMiddleware inside the block runs more
+    than `max_queries` statements. Yields the list of request profiles.
+    """
+    profiles = []
+    _collectors.append(profiles.append)
+    try:
+        yield profiles
+    finally:
+        _collectors.remove(profiles.append)
+    over = [profile for profile in profiles if len(profile.queries) > max_queries]
+    if over:
+        raise QueryBudgetExceeded(f"query budget of {max_queries} exceeded\n" + "\n".join(profile.describe() for profile in over))
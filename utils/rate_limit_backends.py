@@ -0,0 +1,152 @@
+import math
+import os
+import threading
+import time
+from utils.lru_cache import LRUCache
+from utils.redis_client import get_redis, get_async_redis
+from utils.metrics import count_redis
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "redis")
+RATE_LIMIT_MEMORY_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_KEYS", 100_000))
+
+
+class RateLimitResult:
+    __slots__ = ("allowed", "limit", "remaining", "retry_after", "reset_after")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, retry_after: float, reset_after: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        # Seconds until this request would be allowed (0 when allowed)
+        self.retry_after = retry_after
+        # Seconds until the bucket is completely full again
+        self.reset_after = reset_after
+
+    def headers(self):
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+# GCRA (generic cell rate algorithm): the only state per key is the "theoretical arrival
+# time" (TAT) of the next request, stored as a single integer in milliseconds. The whole
+# check-and-update runs inside Redis, so it is atomic and costs one round trip.
+# Rejected requests do not modify the stored TAT.
+GCRA_SCRIPT = """
+local emission_interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+
+local new_tat = tat + emission_interval * cost
+local diff = now - (new_tat - emission_interval * burst)
+
+if diff < 0 then
+    return {0, math.floor((now - (tat - emission_interval * burst)) / emission_interval), -diff, tat - now}
+end
+
+local reset_after = new_tat - now
+redis.call('SET', KEYS[1], new_tat, 'PX', reset_after)
+return {1, math.floor(diff / emission_interval), 0, reset_after}
+"""
+
+
+def _gcra_params(limit: int, period: float):
+    # emission interval in ms: how much "time credit" one request consumes
+    return max(1, int(period * 1000 / limit)), limit
+
+
+def _script_result(limit: int, reply):
+    allowed, remaining, retry_after_ms, reset_after_ms = reply
+    return RateLimitResult(
+        allowed=bool(allowed),
+        limit=limit,
+        remaining=max(0, int(remaining)),
+        retry_after=int(retry_after_ms) / 1000,
+        reset_after=max(0, int(reset_after_ms)) / 1000,
+    )
+
+
+class RedisGCRABackend:
+    def __init__(self):
+        self._script = None
+        self._client = None
+        self._async_script = None
+        self._async_client = None
+
+    def _get_script(self):
+        redis = get_redis()
+        # Re-register if the client was swapped (e.g. reconnect or tests)
+        if self._script is None or self._client is not redis:
+            self._script = redis.register_script(GCRA_SCRIPT)
+            self._client = redis
+        return self._script
+
+    def _get_async_script(self):
+        redis = get_async_redis()
+        if self._async_script is None or self._async_client is not redis:
+            self._async_script = redis.register_script(GCRA_SCRIPT)
+            self._async_client = redis
+        return self._async_script
+
+    def hit(self, key: str, limit: int, period: float, cost: int = 1):
+        emission_interval, burst = _gcra_params(limit, period)
+        count_redis("rate_limiter")
+        return _script_result(limit, self._get_script()(keys=[key], args=[emission_interval, burst, cost]))
+
+    async def hit_async(self, key: str, limit: int, period: float, cost: int = 1):
+        emission_interval, burst = _gcra_params(limit, period)
+        count_redis("rate_limiter")
+        return _script_result(limit, await self._get_async_script()(keys=[key], args=[emission_interval, burst, cost]))
+
+
+class MemoryGCRABackend:
+    """Same algorithm as RedisGCRABackend, kept per process. For dev, tests and single-worker setups."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MEMORY_KEYS):
+        self._tats = LRUCache(maxsize=max_keys)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, period: float, cost: int = 1):
+        emission_interval, burst = _gcra_params(limit, period)
+        now = int(time.time() * 1000)
+        with self._lock:
+            tat = self._tats.get(key)
+            if tat is None or tat < now:
+                tat = now
+            new_tat = tat + emission_interval * cost
+            diff = now - (new_tat - emission_interval * burst)
+            if diff < 0:
+                remaining = (now - (tat - emission_interval * burst)) // emission_interval
+                return RateLimitResult(False, limit, max(0, remaining), -diff / 1000, (tat - now) / 1000)
+            self._tats.set(key, new_tat, ttl=(new_tat - now) / 1000)
+        return RateLimitResult(True, limit, diff // emission_interval, 0, (new_tat - now) / 1000)
+
+    async def hit_async(self, key: str, limit: int, period: float, cost: int = 1):
+        # No I/O: the lock is only ever held for the arithmetic
+        return self.hit(key, limit, period, cost)
+
+
+_backends = {
+    "redis": RedisGCRABackend,
+    "memory": MemoryGCRABackend,
+}
+
+
+def get_backend(name: str = RATE_LIMIT_BACKEND):
+    try:
+        return _backends[name]()
+    except KeyError:
+        raise ValueError(f"Unknown rate limit backend: {name}")
@@ -1,74 +1,136 @@
+import os
+import threading
 import time
-from fastapi import Request, HTTPException, Depends
-from utils.redis_client import get_redis
+from fastapi import Request, Response, HTTPException, Depends
 from utils.logger_conf import logger
-from services.user_service import UserService
-from db.database import SessionLocal
-import jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
+from utils.identity import get_token_payload, resolve_user_async
+from utils.lru_cache import LRUCache
+from utils.rate_limit_backends import RateLimitResult, get_backend, _gcra_params
 
-def rate_limiter(request: Request):
-    redis = get_redis()
-    
+RATE_LIMIT_DENY_CACHE_SIZE = int(os.getenv("RATE_LIMIT_DENY_CACHE_SIZE", 10_000))
+
+_backend = get_backend()
+
+# Negative cache: "client X is blocked on scope S until T". While an entry is live the
+# request is rejected in-process, without a Redis round trip or a user lookup.
+_deny_cache = LRUCache(maxsize=RATE_LIMIT_DENY_CACHE_SIZE)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "local_denied": 0,
+    "remote_allowed": 0,
+    "remote_denied": 0,
+    "backend_errors": 0,
+}
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_rate_limit_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["deny_cache_size"] = len(_deny_cache)
+    return stats
+
+
+def get_identifier(request: Request, user=None):
     # Identify user: use user.uuid if authenticated, otherwise use UUID from header or fallback to IP
-    user = getattr(request.state, "user", None)
-    
-    # If user is not already set by get_current_user (happens if rate_limiter runs first)
-    if not user:
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
-            payload = UserService.decode_access_token(token)
-            if payload:
-                email = payload.get("sub")
-                if email:
-                    # Use a fresh DB session to get the user
-                    db = SessionLocal()
-                    try:
-                        user = UserService.get_user_by_email(db, email)
-                    finally:
-                        db.close()
-    
     if user and hasattr(user, "uuid"):
-        identifier = f"user_uuid:{user.uuid}"
-        track = f"user_uuid:{user.uuid}"
-    else:
-        # For unauthenticated users, try to get UUID from header, fallback to IP
-        client_uuid = request.headers.get("X-User-UUID")
-        if client_uuid:
-            identifier = f"guest_uuid:{client_uuid}"
-            track = f"guest_uuid:{client_uuid}"
-        else:
-            ip = request.client.host
-            identifier = f"ip:{ip}"
-            track = f"ip:{ip}"
-    
-    key = f"rate_limit:{identifier}"
-    limit = 10
-    period = 60  # 1 minute
-    
-    try:
-        # sliding window counter using Redis
-        current_time = time.time()
-        pipeline = redis.pipeline()
-        # Remove timestamps older than the window
-        pipeline.zremrangebyscore(key, 0, current_time - period)
-        # Count remaining timestamps
-        pipeline.zcard(key)
-        # Add current timestamp
-        pipeline.zadd(key, {str(current_time): current_time})
-        # Set expiry for the key to cleanup
-        pipeline.expire(key, period)
-        
-        results = pipeline.execute()
-        request_count = results[1]
-        
-        if request_count >= limit:
-            logger.bind(service="redis", track=track).warning(f"Rate limit exceeded for {identifier}: {request_count + 1} requests in {period}s")
-            raise HTTPException(status_code=429, detail="Too many requests. Limit is 10 per minute.")
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.bind(service="redis").error(f"Rate limiter error: {e}")
-        # In case of redis failure, we allow the request but log the error
-        return
+        return f"user_uuid:{user.uuid}"
+    # For unauthenticated users, try to get UUID from header, fallback to IP
+    client_uuid = request.headers.get("X-User-UUID")
+    if client_uuid:
+        return f"guest_uuid:{client_uuid}"
+    return f"ip:{request.client.host}"
+
+
+def _client_key(request: Request):
+    # Cheap pre-auth identity for the deny cache: the token subject needs a JWT decode
+    # (memoized for the request) but no database lookup.
+    payload = get_token_payload(request)
+    if payload and payload.get("sub"):
+        return f"sub:{payload['sub']}"
+    return get_identifier(request)
+
+
+class RateLimiter:
+    """
+    Per-route rate limit dependency:
+
+        @router.post("/new", dependencies=[Depends(RateLimiter(limit=10, period=60))])
+
+    Each declared limit gets its own bucket per client, named after the route unless
+    `scope` is given. Remaining/reset headers are added to the response.
+
+    Routes whose cost depends on the request body call `check` themselves with a
+    weight instead, once the body is parsed:
+
+        await limiter.check(request, response, db, cost=len(items))
+    """
+
+    def __init__(self, limit: int = 10, period: int = 60, scope: str = None):
+        self.limit = limit
+        self.period = period
+        self.scope = scope
+
+    async def __call__(self, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+        await self.check(request, response, db)
+
+    async def check(self, request: Request, response: Response, db: AsyncSession, cost: int = 1):
+        route = request.scope.get("route")
+        scope = self.scope or getattr(route, "path", request.url.path)
+
+        deny_key = f"{scope}:{_client_key(request)}"
+        denied = _deny_cache.get(deny_key)
+        if denied is not None:
+            retry_at, reset_at = denied
+            now = time.time()
+            _count("local_denied")
+            result = RateLimitResult(False, self.limit, 0, max(0.0, retry_at - now), max(0.0, reset_at - now))
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many requests. Limit is {self.limit} per {self.period} seconds.",
+                headers=result.headers(),
+            )
+
+        # The resolved user is memoized on request.state and shared with get_current_user;
+        # get_async_db is cached per request, so db is the session the route receives too
+        user = await resolve_user_async(request, db)
+        identifier = get_identifier(request, user)
+        key = f"rate_limit:{scope}:{identifier}"
+
+        try:
+            result = await _backend.hit_async(key, self.limit, self.period, cost=cost)
+        except Exception as e:
+            _count("backend_errors")
+            logger.bind(service="redis").error(f"Rate limiter error: {e}")
+            # In case of redis failure, we allow the request but log the error
+            return
+
+        headers = result.headers()
+        if not result.allowed:
+            _count("remote_denied")
+            if result.remaining == 0:
+                # Only while not even one unit is free, and until one is: a weighted request
+                # that didn't fit says nothing about a smaller one
+                emission_interval, burst = _gcra_params(self.limit, self.period)
+                retry_after = max(0.0, result.reset_after - (burst - 1) * emission_interval / 1000)
+                now = time.time()
+                _deny_cache.set(deny_key, (now + retry_after, now + result.reset_after), ttl=retry_after)
+            logger.bind(service="redis", track=identifier).warning(f"Rate limit exceeded for {identifier} on {scope}: limit {self.limit} per {self.period}s")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many requests. Limit is {self.limit} per {self.period} seconds.",
+                headers=headers,
+            )
+        _count("remote_allowed")
+        response.headers.update(headers)
+
+
+# Default limit for routes that don't declare their own
+rate_limiter = RateLimiter(limit=10, period=60)
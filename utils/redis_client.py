@@ -1,16 +1,47 @@
-import redis
 import os
 
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+# Connections this process may open. Unset means unbounded; the multi-worker runner
+# (python -m server) sets them so every worker together stays within the server's limit.
+REDIS_MAX_CONNECTIONS = os.getenv("REDIS_MAX_CONNECTIONS")
+REDIS_ASYNC_MAX_CONNECTIONS = os.getenv("REDIS_ASYNC_MAX_CONNECTIONS")
+# Seconds a command waits for a free connection once the pool is exhausted
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
 
-redis_client = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    db=REDIS_DB,
-    decode_responses=True
-)
+# Created on first use, so importing this module doesn't import the client library
+redis_client = None
+
+def _connection_kwargs():
+    return {"host": REDIS_HOST, "port": REDIS_PORT, "db": REDIS_DB, "decode_responses": True}
 
 def get_redis():
+    global redis_client
+    if redis_client is None:
+        import redis
+        if REDIS_MAX_CONNECTIONS:
+            # Blocking, so a burst waits for a connection instead of failing past the cap
+            pool = redis.BlockingConnectionPool(
+                max_connections=int(REDIS_MAX_CONNECTIONS), timeout=REDIS_POOL_TIMEOUT, **_connection_kwargs()
+            )
+            redis_client = redis.Redis(connection_pool=pool)
+        else:
+            redis_client = redis.Redis(**_connection_kwargs())
     return redis_client
+
+async_redis_client = None
+
+def get_async_redis():
+    # For everything running on the event loop, which must never wait on a socket
+    global async_redis_client
+    if async_redis_client is None:
+        import redis.asyncio
+        if REDIS_ASYNC_MAX_CONNECTIONS:
+            pool = redis.asyncio.BlockingConnectionPool(
+                max_connections=int(REDIS_ASYNC_MAX_CONNECTIONS), timeout=REDIS_POOL_TIMEOUT, **_connection_kwargs()
+            )
+            async_redis_client = redis.asyncio.Redis(connection_pool=pool)
+        else:
+            async_redis_client = redis.asyncio.Redis(**_connection_kwargs())
+    return async_redis_client
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from fastapi import HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", "storage")
+# Bytes read, hashed and written per step; the most an upload or download holds in memory
+STORAGE_CHUNK_SIZE = int(os.getenv("STORAGE_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+
+_stats_lock = threading.Lock()
+_stats = {"uploads": 0, "deduplicated": 0, "bytes_stored": 0, "rejected_large": 0, "downloads": 0, "range_requests": 0, "bytes_served": 0}
+
+
+def _count(name: str, n: int = 1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def get_storage_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+class StoredObject:
+    __slots__ = ("key", "size", "content_type", "deduplicated")
+
+    def __init__(self, key: str, size: int, content_type: str, deduplicated: bool = False):
+        # key is the SHA-256 of the content, so identical uploads share one object
+        self.key = key
+        self.size = size
+        self.content_type = content_type
+        self.deduplicated = deduplicated
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class LocalWriter:
+    """Streams one upload to a temp file, hashing as it goes; commit() files it under its hash."""
+
+    def __init__(self, storage, content_type: str, max_bytes: int):
+        self.storage = storage
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        os.makedirs(storage.tmp_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=storage.tmp_dir, delete=False)
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        key = self._hash.hexdigest()
+        path = self.storage.path(key)
+        if os.path.exists(path):
+            os.unlink(self._file.name)
+            return StoredObject(key, self.size, self.storage.stat(key).content_type, deduplicated=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Metadata first, so an object never exists without it; replace() is atomic, and two
+        # concurrent uploads of the same content write the same bytes
+        with open(f"{path}.json", "w") as meta:
+            json.dump({"content_type": self.content_type, "size": self.size}, meta)
+        os.replace(self._file.name, path)
+        return StoredObject(key, self.size, self.content_type)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class LocalStorage:
+    """Content-addressed files under STORAGE_ROOT: ab/cd/abcd..., with a .json sidecar for metadata."""
+
+    def __init__(self, root: str = STORAGE_ROOT):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path(self, key: str):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def writer(self, content_type: str, max_bytes: int = MAX_UPLOAD_BYTES):
+        return LocalWriter(self, content_type, max_bytes)
+
+    def stat(self, key: str):
+        path = self.path(key)
+        try:
+            with open(f"{path}.json") as meta:
+                content_type = json.load(meta)["content_type"]
+            return StoredObject(key, os.path.getsize(path), content_type)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int = STORAGE_CHUNK_SIZE):
+        # Synchronous on purpose: StreamingResponse runs it in the threadpool, a chunk at a time
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                _count("bytes_served", len(chunk))
+                yield chunk
+
+    def delete(self, key: str):
+        path = self.path(key)
+        for name in (path, f"{path}.json"):
+            try:
+                os.unlink(name)
+            except FileNotFoundError:
+                pass
+
+
+_backends = {
+    "local": LocalStorage,
+}
+
+
+def get_backend(name: str = STORAGE_BACKEND):
+    try:
+        return _backends[name]()
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {name}")
+
+
+storage = get_backend()
+
+
+async def save_upload(file: UploadFile, max_bytes: int = None):
+    """Copy an upload into storage one chunk at a time; raises 413 past `max_bytes` (MAX_UPLOAD_BYTES)."""
+    writer = await run_in_threadpool(storage.writer, file.content_type or "application/octet-stream", max_bytes or MAX_UPLOAD_BYTES)
+    try:
+        while chunk := await file.read(STORAGE_CHUNK_SIZE):
+            await run_in_threadpool(writer.write, chunk)
+        stored = await run_in_threadpool(writer.commit)
+    except UploadTooLarge as e:
+        await run_in_threadpool(writer.abort)
+        _count("rejected_large")
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        await run_in_threadpool(writer.abort)
+        raise
+    _count("deduplicated" if stored.deduplicated else "uploads")
+    if not stored.deduplicated:
+        _count("bytes_stored", stored.size)
+    return stored
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end), inclusive, for a single "bytes=" range; None to serve the whole object.
+    Multiple ranges and malformed headers get the whole object too, as RFC 9110 allows.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def stored_response(request: Request, stored: StoredObject):
+    """Stream an object, honouring Range/If-Range for seeking and If-None-Match for caching."""
+    etag = f'"{stored.key}"'
+    # Content-addressed: the bytes behind a key never change
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
+        # The content type is whatever the uploader claimed: never render it in our origin.
+        # Media elements still play and seek it.
+        "Content-Disposition": "attachment",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), stored.size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{stored.size}"})
+    start, end = byte_range or (0, stored.size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{stored.size}"
+        _count("range_requests")
+    _count("downloads")
+    return StreamingResponse(
+        storage.iter_range(stored.key, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=stored.content_type,
+        headers=headers,
+    )
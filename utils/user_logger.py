@@ -1,11 +1,139 @@
+import atexit
 import json
+import os
+import threading
 from datetime import datetime
 from utils.redis_client import get_redis
+from utils.metrics import count_redis
 from utils.logger_conf import logger
 
+USER_LOG_MAX_ENTRIES = 100
+ACTION_LOG_BATCH_SIZE = int(os.getenv("ACTION_LOG_BATCH_SIZE", 200))
+ACTION_LOG_FLUSH_INTERVAL = float(os.getenv("ACTION_LOG_FLUSH_INTERVAL", 0.5))
+ACTION_LOG_MAX_PENDING = int(os.getenv("ACTION_LOG_MAX_PENDING", 10_000))
+# Also publish every action to a Redis Stream, drained into Postgres by services/action_log_worker.py
+ACTION_LOG_STREAM_ENABLED = os.getenv("ACTION_LOG_STREAM_ENABLED", "false").lower() == "true"
+ACTION_LOG_STREAM = os.getenv("ACTION_LOG_STREAM", "user_actions")
+# Approximate cap; bounds Redis memory if the worker falls behind or is down
+ACTION_LOG_STREAM_MAXLEN = int(os.getenv("ACTION_LOG_STREAM_MAXLEN", 1_000_000))
+
+
+class ActionLogWriter:
+    """
+    Buffers action log entries in process and writes them to Redis from a background
+    thread, once ACTION_LOG_BATCH_SIZE entries are pending or every
+    ACTION_LOG_FLUSH_INTERVAL seconds. A flush is one pipelined round trip carrying an
+    LPUSH of all new entries plus an LTRIM for every key touched, and with
+    ACTION_LOG_STREAM_ENABLED an XADD per entry to the action stream.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = ACTION_LOG_BATCH_SIZE,
+        flush_interval: float = ACTION_LOG_FLUSH_INTERVAL,
+        max_pending: int = ACTION_LOG_MAX_PENDING,
+        stream_enabled: bool = ACTION_LOG_STREAM_ENABLED,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.stream_enabled = stream_enabled
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # key -> serialized entries, oldest first
+        self._pending = {}
+        self._pending_count = 0
+        # Entries taken by a flush that hasn't reached Redis yet, still visible to readers
+        self._in_flight = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {"flushed": 0, "batches": 0, "failed": 0, "dropped": 0}
+
+    def append(self, key: str, entry: str):
+        with self._lock:
+            if self._pending_count >= self.max_pending:
+                self.stats["dropped"] += 1
+                return
+            self._pending.setdefault(key, []).append(entry)
+            self._pending_count += 1
+            full = self._pending_count >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="action-log-writer", daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def unflushed(self, key: str):
+        """Entries for `key` not yet in Redis, newest first."""
+        with self._lock:
+            entries = self._in_flight.get(key, []) + self._pending.get(key, [])
+        return entries[::-1]
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._pending_count = self._pending, {}, 0
+                self._in_flight = batch
+            if not batch:
+                return
+
+            count = sum(len(entries) for entries in batch.values())
+            try:
+                pipeline = get_redis().pipeline(transaction=False)
+                for key, entries in batch.items():
+                    # LPUSH pushes left to right, so the newest entry ends up at the head;
+                    # anything beyond the trim window would be discarded anyway
+                    pipeline.lpush(key, *entries[-USER_LOG_MAX_ENTRIES:])
+                    pipeline.ltrim(key, 0, USER_LOG_MAX_ENTRIES - 1)
+                    if self.stream_enabled:
+                        identifier = key.removeprefix("user_logs:")
+                        for entry in entries:
+                            pipeline.xadd(
+                                ACTION_LOG_STREAM,
+                                {"identifier": identifier, "entry": entry},
+                                maxlen=ACTION_LOG_STREAM_MAXLEN,
+                                approximate=True,
+                            )
+                # One round trip per batch, not per logged action
+                count_redis("user_logger")
+                pipeline.execute()
+                with self._lock:
+                    self.stats["flushed"] += count
+                    self.stats["batches"] += 1
+            except Exception as e:
+                with self._lock:
+                    self.stats["failed"] += count
+                logger.bind(service="redis").error(f"Failed to flush {count} user actions to Redis: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight = {}
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = self._pending_count
+        return stats
+
+
+action_log_writer = ActionLogWriter()
+atexit.register(action_log_writer.stop)
+
+
 def log_user_action(action: str, details: dict = None, user_uuid: str = None, ip: str = None):
-    redis = get_redis()
-    
     if user_uuid:
         identifier = f"user_uuid:{user_uuid}"
     elif ip:
@@ -15,31 +143,33 @@ def log_user_action(action: str, details: dict = None, user_uuid: str = None, ip
         return
 
     log_key = f"user_logs:{identifier}"
-    
+
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "action": action,
         "details": details or {}
     }
-    
-    try:
-        # Push to a list in Redis
-        redis.lpush(log_key, json.dumps(log_entry))
-        # Keep only last 100 logs per user
-        redis.ltrim(log_key, 0, 99)
-        
-        # Also log to system log for persistence/visibility
-        # Use structured logging to match the new JSON format
-        logger.bind(service="application", track=identifier).info(f"Action: {action} | Details: {details}")
-    except Exception as e:
-        logger.bind(service="redis").error(f"Failed to log user action to Redis: {e}")
+
+    # Only buffered here; the Redis write happens on the writer thread
+    action_log_writer.append(log_key, json.dumps(log_entry))
+
+    # Also log to system log for persistence/visibility
+    # Use structured logging to match the new JSON format
+    logger.bind(service="application", track=identifier).info(f"Action: {action} | Details: {details}")
+
+def flush_user_logs():
+    action_log_writer.flush()
 
 def get_user_logs(identifier: str, limit: int = 50):
     redis = get_redis()
     log_key = f"user_logs:{identifier}"
+    # Recent entries may still be buffered in this process
+    unflushed = action_log_writer.unflushed(log_key)[:limit]
     try:
-        logs = redis.lrange(log_key, 0, limit - 1)
+        logs = unflushed
+        if len(unflushed) < limit:
+            logs = unflushed + redis.lrange(log_key, 0, limit - len(unflushed) - 1)
         return [json.loads(log) for log in logs]
     except Exception as e:
         logger.bind(service="redis").error(f"Failed to fetch user logs from Redis: {e}")
-        return []
+        return [json.loads(log) for log in unflushed]